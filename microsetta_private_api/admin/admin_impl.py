@@ -36,12 +36,13 @@ from werkzeug.exceptions import Unauthorized
 from microsetta_private_api.qiita import qclient
 from microsetta_private_api.repo.interested_user_repo import InterestedUserRepo
 from microsetta_private_api.repo.removal_queue_repo import RemovalQueueRepo
+from microsetta_private_api.repo.summary_export_repo import SummaryExportRepo
 
 
 def search_barcode(token_info, sample_barcode):
     validate_admin_access(token_info)
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         admin_repo = AdminRepo(t)
         diag = admin_repo.retrieve_diagnostics_by_barcode(sample_barcode)
         if diag is None:
@@ -52,7 +53,7 @@ def search_barcode(token_info, sample_barcode):
 def search_kit_id(token_info, kit_id):
     validate_admin_access(token_info)
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         admin_repo = AdminRepo(t)
         diag = admin_repo.retrieve_diagnostics_by_kit_id(kit_id)
         if diag is None:
@@ -63,7 +64,7 @@ def search_kit_id(token_info, kit_id):
 def search_email(token_info, email):
     validate_admin_access(token_info)
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         admin_repo = AdminRepo(t)
         diag = admin_repo.retrieve_diagnostics_by_email(email)
         if diag is None:
@@ -74,7 +75,7 @@ def search_email(token_info, email):
 def search_interested_users_by_email(token_info, email):
     validate_admin_access(token_info)
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         i_u_repo = InterestedUserRepo(t)
         users = i_u_repo.get_interested_user_by_email(email)
         users_obj = {
@@ -186,7 +187,8 @@ def qiita_compatible_metadata(token_info, include_private, body):
     # TODO: this call constructs transactions implicitly. It would be
     # better for the transaction to be established and passed in,
     # similar to how other "repo" objects are managed
-    df, errors = retrieve_metadata(samples, include_private=include_private)
+    df, errors = retrieve_metadata(samples, include_private=include_private,
+                                   read_only=True)
 
     if errors:
         return jsonify(code=404, message=str(errors)), 404
@@ -207,12 +209,13 @@ def validate_admin_access(token_info):
         raise Unauthorized()
 
 
-def get_projects(token_info, include_stats, is_active=None):
+def get_projects(token_info, include_stats, is_active=None, fresh=False):
     validate_admin_access(token_info)
 
     with Transaction() as t:
         admin_repo = AdminRepo(t)
-        projects_list = admin_repo.get_projects(include_stats, is_active)
+        projects_list = admin_repo.get_projects(include_stats, is_active,
+                                                fresh)
         result = [x.to_api() for x in projects_list]
         return jsonify(result), 200
 
@@ -418,17 +421,19 @@ def query_email_stats(body, token_info):
     project = body.get("project")
 
     results = []
-    with Transaction() as t:
-        account_repo = AccountRepo(t)
-        kit_repo = KitRepo(t)
-        source_repo = SourceRepo(t)
-        sample_repo = SampleRepo(t)
+    with Transaction(read_only=True) as t:
+        # can use internal lookup by email, because we have admin access
+        accounts = AccountRepo(t)._find_accounts_by_emails(email_list)  # noqa
+        unused = KitRepo(t).count_kits_unused_samples(
+            [a.created_with_kit_id for a in accounts.values()
+             if a.created_with_kit_id is not None])
+        account_samples = SampleRepo(t).get_sample_statuses_by_accounts(
+            [a.id for a in accounts.values()])
 
         for email in email_list:
             result = {'email': email, 'project': project}
             results.append(result)
-            # can use internal lookup by email, because we have admin access
-            account = account_repo._find_account_by_email(email)  # noqa
+            account = accounts.get(email)
             if account is None:
                 result['summary'] = "No Account"
                 continue
@@ -438,34 +443,22 @@ def query_email_stats(body, token_info):
                 result['kit_name'] = account.created_with_kit_id
 
             if account.created_with_kit_id is not None:
-                unused = kit_repo.get_kit_unused_samples(
-                             account.created_with_kit_id
-                         )
-                if unused is None:
-                    result['unclaimed-samples-in-kit'] = 0
-                else:
-                    result['unclaimed-samples-in-kit'] = len(unused.samples)
+                result['unclaimed-samples-in-kit'] = unused.get(
+                    account.created_with_kit_id, 0)
 
             sample_statuses = defaultdict(int)
-            sources = source_repo.get_sources_in_account(account.id)
 
             samples_in_project = 0
-            for source in sources:
-                samples = sample_repo.get_samples_by_source(account.id,
-                                                            source.id)
-                for sample in samples:
-                    if project is not None and \
-                       project != "" and \
-                       project not in sample.sample_projects:
-                        continue
-                    samples_in_project += 1
-                    sample_status = sample_repo.get_sample_status(
-                        sample.barcode,
-                        sample._latest_scan_timestamp  # noqa
-                    )
-                    if sample_status is None:
-                        sample_status = "never-scanned"
-                    sample_statuses[sample_status] += 1
+            for sample_projects, sample_status in \
+                    account_samples.get(account.id, []):
+                if project is not None and \
+                   project != "" and \
+                   project not in sample_projects:
+                    continue
+                samples_in_project += 1
+                if sample_status is None:
+                    sample_status = "never-scanned"
+                sample_statuses[sample_status] += 1
             result.update(sample_statuses)
 
             if result.get('unclaimed-samples-in-kit', 0) > 0:
@@ -484,10 +477,56 @@ def query_project_barcode_stats(body, token_info, strip_sampleid):
     validate_admin_access(token_info)
     email = body.get("email")
     project = body["project"]
-    celery_per_sample_summary.delay(email, project, strip_sampleid)
+    compression = body.get("compression")
+    celery_per_sample_summary.delay(email, project, strip_sampleid,
+                                    compression)
     return None, 200
 
 
+def get_summary_export(token):
+    # the link is followed from an email, so cannot carry an admin's JWT.
+    # Instead, the token is unguessable, expires and can only be used once
+    with Transaction() as t:
+        export = SummaryExportRepo(t).claim_export(token)
+        t.commit()
+
+    if export is None:
+        return jsonify(code=404,
+                       message="Summary not found, expired or already "
+                               "downloaded"), 404
+
+    filename, n_chunks = export
+    if filename.endswith('.gz'):
+        mimetype = 'application/gzip'
+    elif filename.endswith('.zip'):
+        mimetype = 'application/zip'
+    else:
+        mimetype = 'text/csv'
+
+    def generate():
+        # one chunk is held at a time, and no transaction is held while the
+        # client reads it
+        try:
+            for chunk_index in range(n_chunks):
+                with Transaction(read_only=True) as t:
+                    chunk = SummaryExportRepo(t).get_export_chunk(
+                        token, chunk_index)
+                if chunk is None:
+                    # removed while being downloaded
+                    return
+                yield chunk
+        finally:
+            # the summary cannot be downloaded again, so need not be kept
+            with Transaction() as t:
+                SummaryExportRepo(t).delete_export(token)
+                t.commit()
+
+    response = Response(generate(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename="{filename}"'
+    return response
+
+
 def query_barcode_stats(body, token_info, strip_sampleid):
     validate_admin_access(token_info)
     if 'sample_barcodes' in body:
@@ -497,23 +536,10 @@ def query_barcode_stats(body, token_info, strip_sampleid):
         project_id = body["project_id"]
         barcodes = get_barcodes_for(project_id)
 
-    unprocessed_barcodes = None
-
-    if len(barcodes) > 1000:
-        unprocessed_barcodes = barcodes[1000:]
-        barcodes = barcodes[0:1000]
-
-    results = {'samples': per_sample(project_id, barcodes, strip_sampleid)}
-
-    if unprocessed_barcodes:
-        results['partial_result'] = True
-
-        # if returning a partial result, include the remainder of the barcodes
-        # so that they can be used in a subsequent query like a paging
-        # mechanism.
-        results['unprocessed_barcodes'] = unprocessed_barcodes
-    else:
-        results['partial_result'] = False
+    # per_sample summarizes any number of barcodes in a few queries, so the
+    # result is never partial; partial_result is kept for existing clients
+    results = {'samples': per_sample(project_id, barcodes, strip_sampleid),
+               'partial_result': False}
 
     return jsonify(results), 200
 
@@ -597,7 +623,7 @@ def _create_daklapack_order(order_dict):
 
 def search_activation(token_info, email_query=None, code_query=None):
     validate_admin_access(token_info)
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         activations = ActivationRepo(t)
         if email_query is not None:
             infos = activations.search_email(email_query)
@@ -941,3 +967,12 @@ def update_perk_fulfillment_state(token_info, perk_fulfillment_state):
         pf_state = admin_repo.get_perk_fulfillment_state()
         t.commit()
     return jsonify({"pf_state": pf_state}), 200
+
+
+def clear_survey_template_cache(token_info):
+    validate_admin_access(token_info)
+
+    # NB: this only affects the serving process. Other processes pick up
+    # survey changes once they observe a new database patch level.
+    SurveyTemplateRepo.clear_survey_template_cache()
+    return '', 204
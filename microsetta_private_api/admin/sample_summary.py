@@ -1,8 +1,12 @@
-from microsetta_private_api.model.source import Source
-from microsetta_private_api.repo.sample_repo import SampleRepo
+import csv
+import gzip
+import io
+import zipfile
+from contextlib import contextmanager
+
+from microsetta_private_api.config_manager import SERVER_CONFIG
 from microsetta_private_api.repo.transaction import Transaction
 from microsetta_private_api.repo.admin_repo import AdminRepo
-from microsetta_private_api.repo.survey_template_repo import SurveyTemplateRepo
 from microsetta_private_api.repo.vioscreen_repo import VioscreenSessionRepo
 from werkzeug.exceptions import NotFound
 
@@ -17,10 +21,8 @@ def get_barcodes_for(project_id):
 
 def per_sample(project, barcodes, strip_sampleid):
     summaries = []
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         admin_repo = AdminRepo(t)
-        sample_repo = SampleRepo(t)
-        template_repo = SurveyTemplateRepo(t)
         vs_repo = VioscreenSessionRepo(t)
 
         # all associated projects returned for each barcode,
@@ -30,82 +32,159 @@ def per_sample(project, barcodes, strip_sampleid):
                 return summaries
             barcodes = admin_repo.get_project_barcodes(project)
 
+        details = admin_repo.retrieve_summary_details_by_barcodes(barcodes)
         for barcode in barcodes:
-            diag = admin_repo.retrieve_diagnostics_by_barcode(barcode)
-            if diag is None:
+            if barcode not in details:
                 raise NotFound(f"Barcode not found: {barcode}")
 
-            sample = diag['sample']
-            account = diag['account']
-            source = diag['source']
-
-            account_email = None if account is None else account.email
-            source_type = None if source is None else source.source_type
-            vio_id = None
-
-            # find all projects for barcode
-            projects_info = diag['projects_info']
-            all_projects = [proj_obj['project'] for proj_obj in projects_info]
-            barcode_project = '; '.join(sorted(all_projects))
-
-            if source is not None and source_type == Source.SOURCE_TYPE_HUMAN:
-
-                vio_id = template_repo.get_vioscreen_id_if_exists(account.id,
-                                                                  source.id,
-                                                                  sample.id)
-
-            # at least one sample has been observed that "is_microsetta",
-            # described in the barcodes.project_barcode table, but which is
-            # unexpectedly not present in ag.ag_kit_barcodes
-            if sample is None:
-                sample_status = None
-                sample_site = None
+        ffq_statuses = vs_repo.get_ffq_statuses_by_samples(
+            [d['sample_id'] for d in details.values()
+             if d['sample_id'] is not None])
+
+    for barcode in barcodes:
+        detail = details[barcode]
+        sample_id = detail['sample_id']
+
+        # find all projects for barcode
+        barcode_project = '; '.join(sorted(detail['projects']))
+
+        # at least one sample has been observed that "is_microsetta",
+        # described in the barcodes.project_barcode table, but which is
+        # unexpectedly not present in ag.ag_kit_barcodes
+        if sample_id is None:
+            sample_site = None
+            sample_date = None
+            sample_time = None
+            ffq_complete = None
+            ffq_taken = None
+        else:
+            sample_site = detail['site_sampled']
+
+            # get sample date, time; as for Sample, a sample has a
+            # collection datetime only if it has both a date and a time
+            if detail['sample_date'] is not None and \
+                    detail['sample_time'] is not None:
+                sample_date = detail['sample_date'].isoformat()
+                sample_time = detail['sample_time'].isoformat()
+            else:
                 sample_date = None
                 sample_time = None
-                ffq_complete = None
-                ffq_taken = None
-            else:
-                sample_status = sample_repo.get_sample_status(
-                    sample.barcode,
-                    sample._latest_scan_timestamp
-                )
-                sample_site = sample.site
-
-                # get sample date, time
-                sample_datetime = sample.datetime_collected
-                if sample_datetime is not None:
-                    sample_date = sample_datetime.date().isoformat()
-                    sample_time = sample_datetime.time().isoformat()
-                else:
-                    sample_date = None
-                    sample_time = None
-
-                ffq_complete, ffq_taken, _ = vs_repo.get_ffq_status_by_sample(
-                    sample.id
-                )
-
-            summary = {
-                "sampleid": None if strip_sampleid else barcode,
-                "project": barcode_project,
-                "source-type": source_type,
-                "site-sampled": sample_site,
-                "sample-date": sample_date,
-                "sample-time": sample_time,
-                "account-email": account_email,
-                "vioscreen_username": vio_id,
-                "ffq-taken": ffq_taken,
-                "ffq-complete": ffq_complete,
-                "sample-status": sample_status,
-                "sample-received": sample_status is not None
-            }
-
-            for status in ["sample-is-valid",
-                           "no-associated-source",
-                           "no-registered-account",
-                           "no-collection-info",
-                           "sample-has-inconsistencies",
-                           "received-unknown-validity"]:
-                summary[status] = sample_status == status
-
-            summaries.append(summary)
+
+            ffq_complete, ffq_taken, _ = ffq_statuses[sample_id]
+
+        sample_status = detail['sample_status']
+        summary = {
+            "sampleid": None if strip_sampleid else barcode,
+            "project": barcode_project,
+            "source-type": detail['source_type'],
+            "site-sampled": sample_site,
+            "sample-date": sample_date,
+            "sample-time": sample_time,
+            "account-email": detail['account_email'],
+            "vioscreen_username": detail['vio_id'],
+            "ffq-taken": ffq_taken,
+            "ffq-complete": ffq_complete,
+            "sample-status": sample_status,
+            "sample-received": sample_status is not None
+        }
+
+        for status in ["sample-is-valid",
+                       "no-associated-source",
+                       "no-registered-account",
+                       "no-collection-info",
+                       "sample-has-inconsistencies",
+                       "received-unknown-validity"]:
+            summary[status] = sample_status == status
+
+        summaries.append(summary)
     return summaries
+
+
+def iter_per_sample(project, barcodes, strip_sampleid, batch_size=None):
+    """Generate the summaries of samples, a batch of barcodes at a time
+
+    Produces the same summaries as per_sample, while holding only a batch
+    of them in memory at once.
+
+    Parameters
+    ----------
+    project : int or None
+        The project to summarize, if barcodes is None
+    barcodes : list of str or None
+        The barcodes to summarize
+    strip_sampleid : bool
+        Whether to omit the barcode from the summaries
+    batch_size : int, optional
+        The number of barcodes summarized at once. If not specified, the
+        summary_batch_size server configuration is used.
+
+    Yields
+    ------
+    dict
+        The summary of each barcode, in order
+    """
+    if batch_size is None:
+        batch_size = SERVER_CONFIG.get('summary_batch_size', 1000)
+
+    if barcodes is None:
+        if project is None:
+            return
+        with Transaction(read_only=True) as t:
+            barcodes = AdminRepo(t).get_project_barcodes(project)
+
+    for start in range(0, len(barcodes), batch_size):
+        yield from per_sample(None, barcodes[start:start + batch_size],
+                              strip_sampleid)
+
+
+@contextmanager
+def _open_summary_csv(path, compression, member_name):
+    if compression is None:
+        with open(path, 'w', newline='') as f:
+            yield f
+    elif compression == 'gzip':
+        with gzip.open(path, 'wt', newline='') as f:
+            yield f
+    elif compression == 'zip':
+        with zipfile.ZipFile(path, 'w',
+                             compression=zipfile.ZIP_DEFLATED) as zf:
+            with zf.open(member_name, 'w', force_zip64=True) as member:
+                with io.TextIOWrapper(member, encoding='utf-8',
+                                      newline='') as f:
+                    yield f
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+
+
+def write_summaries_csv(summaries, path, compression=None,
+                        member_name='summary.csv'):
+    """Write summaries to a CSV file as they are produced
+
+    The CSV matches that written by pandas for a DataFrame of the
+    summaries, including its leading index column.
+
+    Parameters
+    ----------
+    summaries : Iterable of dict
+        The summaries to write, such as from iter_per_sample
+    path : str
+        The path to write to
+    compression : {None, 'gzip', 'zip'}, optional
+        How to compress the file
+    member_name : str, optional
+        The name of the CSV within a zip file
+
+    Returns
+    -------
+    int
+        The number of summaries written
+    """
+    n_written = 0
+    with _open_summary_csv(path, compression, member_name) as f:
+        writer = csv.writer(f, lineterminator='\n')
+        for summary in summaries:
+            if n_written == 0:
+                writer.writerow([''] + list(summary))
+            writer.writerow([n_written] + list(summary.values()))
+            n_written += 1
+    return n_written
@@ -1,4 +1,5 @@
 import pytest
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch
 from flask import Response
@@ -11,6 +12,9 @@ from microsetta_private_api.model.daklapack_order \
 from microsetta_private_api.repo.transaction import Transaction
 from microsetta_private_api.repo.account_repo import AccountRepo
 from microsetta_private_api.repo.admin_repo import AdminRepo
+from microsetta_private_api.repo.kit_repo import KitRepo
+from microsetta_private_api.repo.sample_repo import SampleRepo
+from microsetta_private_api.repo.source_repo import SourceRepo
 from microsetta_private_api.api.tests.test_api import (  # noqa
     client,
     MOCK_HEADERS,  ACCT_ID_1, ACCT_MOCK_ISS, ACCT_MOCK_SUB,
@@ -22,6 +26,9 @@ from microsetta_private_api.model.tests.test_daklapack_order import \
     DUMMY_DAK_ORDER_DESC, DUMMY_PLANNED_SEND_DATE, DUMMY_FEDEX_REFS, \
     DUMMY_SHIPPING_PROVIDER, DUMMY_SHIPPING_TYPE
 from microsetta_private_api.repo.survey_answers_repo import SurveyAnswersRepo
+from microsetta_private_api.repo.summary_export_repo import SummaryExportRepo
+from microsetta_private_api.config_manager import SERVER_CONFIG
+from microsetta_private_api.tasks import per_sample_summary
 
 
 DUMMY_PROJ_NAME = "test project"
@@ -784,6 +791,17 @@ class AdminApiTests(TestCase):
         self.assertEqual(len(article_dicts_list), len(response_obj))
         self.assertEqual(FIRST_LIVE_DAK_ARTICLE, response_obj[0])
 
+    def test_clear_survey_template_cache(self):
+        with patch('microsetta_private_api.admin.admin_impl.'
+                   'SurveyTemplateRepo.clear_survey_template_cache') as mock:
+            response = self.client.delete(
+                "/api/admin/survey_template_cache",
+                headers=MOCK_HEADERS
+            )
+            mock.assert_called_once_with()
+
+        self.assertEqual(204, response.status_code)
+
     def test_email_stats(self):
         with Transaction() as t:
             accts = AccountRepo(t)
@@ -812,6 +830,59 @@ class AdminApiTests(TestCase):
                 else:
                     self.assertEqual(result[0].get("sample-is-valid", 0), 0)
 
+    def test_email_stats_per_account(self):
+        account_ids = ["65dcd6c8-69fa-4de8-a33a-3de4957a0c79",
+                       "556f5dc4-8cf2-49ae-876c-32fbdfb005dd"]
+        with Transaction() as t:
+            accts = AccountRepo(t)
+            kit_repo = KitRepo(t)
+            source_repo = SourceRepo(t)
+            sample_repo = SampleRepo(t)
+
+            # the counts, as obtained account by account
+            expected = []
+            for account_id in account_ids:
+                acct = accts.get_account(account_id)
+                exp = {'email': acct.email, 'account_id': acct.id,
+                       'kit_name': acct.created_with_kit_id}
+                if acct.created_with_kit_id is not None:
+                    unused = kit_repo.get_kit_unused_samples(
+                        acct.created_with_kit_id)
+                    exp['unclaimed-samples-in-kit'] = \
+                        0 if unused is None else len(unused.samples)
+
+                for source in source_repo.get_sources_in_account(acct.id):
+                    for sample in sample_repo.get_samples_by_source(
+                            acct.id, source.id):
+                        status = sample_repo.get_sample_status(
+                            sample.barcode, sample._latest_scan_timestamp)
+                        status = status or "never-scanned"
+                        exp[status] = exp.get(status, 0) + 1
+                expected.append(exp)
+
+        response = self.client.post(
+            "/api/admin/account_email_summary",
+            headers=MOCK_HEADERS,
+            content_type='application/json',
+            data=json.dumps({
+                "emails": [e['email'] for e in expected] +
+                          ["notanaccount@example.com"],
+                "project": None
+            })
+        )
+        self.assertEqual(200, response.status_code)
+        result = json.loads(response.data)
+        self.assertEqual(len(result), 3)
+
+        for exp, obs in zip(expected, result):
+            for key in ('summary', 'creation_time', 'project'):
+                obs.pop(key)
+            self.assertEqual(obs, exp)
+
+        self.assertEqual(result[2], {'email': "notanaccount@example.com",
+                                     'project': None,
+                                     'summary': "No Account"})
+
     def test_metadata_qiita_compatible_invalid(self):
         data = json.dumps({'sample_barcodes': ['bad']})
         response = self.client.post('/api/admin/metadata/qiita-compatible',
@@ -1205,6 +1276,80 @@ class AdminApiTests(TestCase):
         # so nothing specific to verify on the response data
         self.assertEqual(200, response.status_code)
 
+    def test_get_summary_export(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'compressed summary')
+            f.flush()
+            with Transaction() as t:
+                # stored in several chunks
+                token = SummaryExportRepo(t).create_export(
+                    7, 'summary.csv.gz', f.name, 60, chunk_size=5)
+                t.commit()
+
+        try:
+            # the token alone grants access, as the link is followed from
+            # an email
+            response = self.client.get(
+                f"api/admin/summary_exports/{token}")
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(response.data, b'compressed summary')
+            self.assertEqual(response.mimetype, 'application/gzip')
+            self.assertIn('summary.csv.gz',
+                          response.headers['Content-Disposition'])
+
+            # but only once
+            response = self.client.get(
+                f"api/admin/summary_exports/{token}")
+            self.assertEqual(404, response.status_code)
+
+            response = self.client.get(
+                "api/admin/summary_exports/notatoken")
+            self.assertEqual(404, response.status_code)
+        finally:
+            with Transaction() as t:
+                SummaryExportRepo(t).delete_export(token)
+                t.commit()
+
+    def test_get_summary_export_expired(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'compressed summary')
+            f.flush()
+            with Transaction() as t:
+                token = SummaryExportRepo(t).create_export(
+                    7, 'summary.csv.gz', f.name, -1)
+                t.commit()
+
+        try:
+            response = self.client.get(
+                f"api/admin/summary_exports/{token}")
+            self.assertEqual(404, response.status_code)
+        finally:
+            with Transaction() as t:
+                SummaryExportRepo(t).delete_export(token)
+                t.commit()
+
+    def test_per_sample_summary_download_url(self):
+        # a summary too large to attach is downloaded by following the
+        # emailed link exactly as it is built
+        with patch.dict(SERVER_CONFIG,
+                        {'summary_attachment_max_bytes': -1}), \
+                patch('microsetta_private_api.tasks.send_basic_email') \
+                as mock_email:
+            per_sample_summary('foo@bar.com', 7, False, 'none')
+
+        template_args = mock_email.call_args[0][4]
+        download_url = template_args['download_url']
+        self.assertNotIn('attachment_filepath', mock_email.call_args[1])
+
+        response = self.client.get(download_url)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertIn('summary', response.headers['Content-Disposition'])
+
+        # the download removed the summary
+        response = self.client.get(download_url)
+        self.assertEqual(404, response.status_code)
+
     def test_query_barcode_stats_project_barcodes_without_strip(self):
         barcodes = ['000010307', '000023344', '000036855']
         input_json = json.dumps({'sample_barcodes': barcodes})
@@ -1299,6 +1444,7 @@ class AdminApiTests(TestCase):
 
         response_obj = json.loads(response.data)
         self.assertIn('samples', response_obj)
+        self.assertFalse(response_obj['partial_result'])
         response_obj = response_obj['samples']
         self.assertEqual(len(response_obj), 5)
         self.assertEqual([v['sampleid'] for v in response_obj], exp_barcodes)
@@ -1,4 +1,5 @@
 from unittest import TestCase
+from unittest.mock import patch
 from datetime import date, datetime, timedelta, timezone
 import dateutil.parser
 import psycopg2
@@ -417,6 +418,43 @@ class AdminRepoTests(AdminTests):
             self.assertGreater(len(diag['scans_info']), 0)
             self.assertGreater(len(diag['projects_info']), 0)
 
+    def test_retrieve_summary_details_by_barcodes(self):
+        barcodes = ['000033903', '000004801', '000009207', '000030673',
+                    '000044481']
+        with Transaction() as t:
+            admin_repo = AdminRepo(t)
+            obs = admin_repo.retrieve_summary_details_by_barcodes(
+                barcodes + ['NotABarcode :D'])
+            self.assertEqual(sorted(obs), sorted(barcodes))
+
+            # the details agree with the diagnostics of each barcode
+            for barcode in barcodes:
+                diag = admin_repo.retrieve_diagnostics_by_barcode(barcode)
+                detail = obs[barcode]
+
+                account = diag['account']
+                source = diag['source']
+                sample = diag['sample']
+                self.assertEqual(detail['account_email'],
+                                 None if account is None else account.email)
+                self.assertEqual(detail['source_type'],
+                                 None if source is None
+                                 else source.source_type)
+                self.assertEqual(detail['sample_id'],
+                                 None if sample is None else sample.id)
+                self.assertEqual(sorted(detail['projects']),
+                                 sorted(x['project']
+                                        for x in diag['projects_info']))
+                if sample is not None:
+                    self.assertEqual(detail['site_sampled'], sample.site)
+                    self.assertEqual(detail['sample_status'],
+                                     diag['latest_scan']['sample_status'])
+                else:
+                    self.assertIsNone(detail['sample_status'])
+
+            self.assertEqual(
+                admin_repo.retrieve_summary_details_by_barcodes([]), {})
+
     def test_get_project_name_fail(self):
         with Transaction() as t:
             admin_repo = AdminRepo(t)
@@ -801,6 +839,52 @@ class AdminRepoTests(AdminTests):
             self.assertEqual(first_scan['technician_notes'], TEST_NOTES)
             self.assertEqual(first_scan['sample_status'], TEST_STATUS)
 
+    def test_scan_barcode_latest_scan(self):
+        TEST_BARCODE = '000000001'
+
+        def latest(cur):
+            cur.execute("SELECT barcode_scan_id, sample_status "
+                        "FROM barcodes.latest_barcode_scan "
+                        "WHERE barcode = %s",
+                        (TEST_BARCODE,))
+            return cur.fetchone()
+
+        with Transaction() as t:
+            admin_repo = AdminRepo(t)
+            cur = t.cursor()
+            self.assertIsNone(latest(cur))
+
+            first_id = admin_repo.scan_barcode(
+                TEST_BARCODE,
+                {
+                    "sample_status": "sample-has-inconsistencies",
+                    "technician_notes": "THIS IS A UNIT TEST"
+                }
+            )
+            self.assertEqual(latest(cur),
+                             (first_id, "sample-has-inconsistencies"))
+
+            second_id = admin_repo.scan_barcode(
+                TEST_BARCODE,
+                {
+                    "sample_status": "sample-is-valid",
+                    "technician_notes": "THIS IS A UNIT TEST"
+                }
+            )
+            self.assertEqual(latest(cur), (second_id, "sample-is-valid"))
+
+            # removing scans falls back to the remaining latest scan
+            cur.execute("DELETE FROM barcodes.barcode_scans "
+                        "WHERE barcode_scan_id = %s",
+                        (second_id,))
+            self.assertEqual(latest(cur),
+                             (first_id, "sample-has-inconsistencies"))
+
+            cur.execute("DELETE FROM barcodes.barcode_scans "
+                        "WHERE barcode_scan_id = %s",
+                        (first_id,))
+            self.assertIsNone(latest(cur))
+
     def test_scan_barcode_error_nonexistent(self):
         with Transaction() as t:
             admin_repo = AdminRepo(t)
@@ -847,6 +931,87 @@ class AdminRepoTests(AdminTests):
 
             self.assertDictEqual(meta['survey_answers'][0], survey)
 
+    def test_get_survey_metadata_bulk(self):
+        with Transaction() as t:
+            admin_repo = AdminRepo(t)
+
+            barcodes = ['000004216', '000001656']
+            obs, obs_errors = admin_repo.get_survey_metadata_bulk(
+                barcodes + ['NOTABARCODE', '000004126'])
+
+            self.assertEqual(obs_errors,
+                             {'NOTABARCODE': "No such barcode",
+                              '000004126': "Barcode is not associated with "
+                                           "a source"})
+            self.assertEqual(set(obs), set(barcodes))
+
+            def by_template(md):
+                return sorted(md['survey_answers'],
+                              key=lambda s: s['template'])
+
+            for barcode in barcodes:
+                exp = admin_repo.get_survey_metadata(barcode)
+                for key in ('sample_barcode', 'host_subject_id', 'account',
+                            'source', 'sample'):
+                    self.assertEqual(obs[barcode][key], exp[key])
+                self.assertEqual(by_template(obs[barcode]),
+                                 by_template(exp))
+
+    def test_get_survey_metadata_bulk_no_collection_time(self):
+        barcodes = ['000004216', '000001656']
+        with Transaction() as t:
+            with t.cursor() as cur:
+                cur.execute("UPDATE ag.ag_kit_barcodes "
+                            "SET sample_date = NULL, sample_time = NULL "
+                            "WHERE barcode = '000004216'")
+
+            obs, obs_errors = AdminRepo(t).get_survey_metadata_bulk(barcodes)
+
+        # the sample is reported for its barcode, and the other barcode is
+        # still pulled down
+        self.assertEqual(obs_errors,
+                         {'000004216': "Sample is missing a collection "
+                                       "date and time"})
+        self.assertEqual(set(obs), {'000001656'})
+
+    def test_get_survey_metadata_bulk_read_only(self):
+        barcodes = ['000004216', '000001656']
+        with Transaction() as t:
+            exp, exp_errors = AdminRepo(t).get_survey_metadata_bulk(barcodes)
+
+        with Transaction(read_only=True) as t:
+            obs, obs_errors = AdminRepo(t).get_survey_metadata_bulk(barcodes)
+
+        self.assertEqual(obs_errors, exp_errors)
+        for barcode in barcodes:
+            self.assertEqual(obs[barcode]['account'],
+                             exp[barcode]['account'])
+
+    def test_get_survey_metadata_no_geocoding_requests(self):
+        # the pulldown only reads stored geocoding, so it neither contacts
+        # Google nor modifies the account
+        barcode = '000004216'
+        with Transaction() as t:
+            admin_repo = AdminRepo(t)
+            account_id = admin_repo._get_ids_relevant_to_barcode(
+                barcode)['account_id']
+            exp = AccountRepo(t).get_account(account_id)
+
+            with patch('microsetta_private_api.util.google_geocoding.'
+                       'requests.get') as mock_get:
+                admin_repo.get_survey_metadata(barcode)
+                admin_repo.get_survey_metadata_bulk([barcode])
+            mock_get.assert_not_called()
+
+            obs = AccountRepo(t).get_account(account_id)
+            self.assertEqual(obs.update_time, exp.update_time)
+
+    def test_get_survey_metadata_bulk_empty(self):
+        with Transaction() as t:
+            admin_repo = AdminRepo(t)
+            self.assertEqual(admin_repo.get_survey_metadata_bulk([]),
+                             ({}, {}))
+
     def test_get_survey_multiple_instances(self):
         # this test verifies that when a user has taken the same survey
         # multiple times and claims a sample, the closest instance of each
@@ -1100,6 +1265,79 @@ class AdminRepoTests(AdminTests):
         # and is 2nd in (zero-based) list, after project 2
         self.assertEqual(updated_dict, output[1].to_api())
 
+    def test_get_projects_w_stats_snapshot(self):
+        with Transaction() as t:
+            updated_dict, computed = self._set_up_and_query_projects(
+                t, include_stats=True, is_active_val=None)
+
+            admin_repo = AdminRepo(t)
+            self.assertEqual(admin_repo.refresh_project_statistics(), 56)
+
+            # a scan recorded without scan_barcode is not in the snapshot
+            # until it is refreshed
+            with t.cursor() as cur:
+                cur.execute("INSERT INTO barcodes.barcode_scans "
+                            "(barcode, scan_timestamp, sample_status) "
+                            "VALUES ('000007640', '2030-01-01', "
+                            "'no-registered-account')")
+
+            stored = admin_repo.get_projects(True)
+            self.assertEqual([x.to_api() for x in computed],
+                             [x.to_api() for x in stored])
+
+            fresh = admin_repo.get_projects(True, fresh=True)
+            stats = fresh[7].to_api()[p.COMPUTED_STATS_KEY]
+            self.assertEqual(stats['num_no_registered_account'], 2)
+            self.assertEqual(stats['num_sample_is_valid'], 3)
+
+    def test_refresh_project_statistics_stale(self):
+        with Transaction() as t:
+            admin_repo = AdminRepo(t)
+            self.assertTrue(admin_repo.project_statistics_need_refresh(3600))
+
+            admin_repo.refresh_project_statistics()
+            self.assertFalse(admin_repo.project_statistics_need_refresh(3600))
+            self.assertTrue(admin_repo.project_statistics_need_refresh(-1))
+
+            # barcode 000007640 is in project 8
+            admin_repo.scan_barcode('000007640',
+                                    {"sample_status": "sample-is-valid",
+                                     "technician_notes": ""})
+            with t.cursor() as cur:
+                cur.execute("SELECT project_id "
+                            "FROM barcodes.project_statistics "
+                            "WHERE stale_since IS NOT NULL")
+                self.assertIn((8, ), cur.fetchall())
+            self.assertTrue(admin_repo.project_statistics_need_refresh(3600))
+
+            admin_repo.refresh_project_statistics()
+            self.assertFalse(admin_repo.project_statistics_need_refresh(3600))
+
+    def test_refresh_project_statistics_stale_during_refresh(self):
+        with Transaction() as t:
+            admin_repo = AdminRepo(t)
+            read_projects_df = admin_repo._read_projects_df_from_db
+
+            def scan_during_read(*args, **kwargs):
+                projects_df = read_projects_df(*args, **kwargs)
+                # barcode 000007640 is in project 8
+                admin_repo.scan_barcode('000007640',
+                                        {"sample_status": "sample-is-valid",
+                                         "technician_notes": ""})
+                return projects_df
+
+            with patch.object(admin_repo, '_read_projects_df_from_db',
+                              side_effect=scan_during_read):
+                admin_repo.refresh_project_statistics()
+
+            # the scan is not in the statistics stored, so they stay stale
+            with t.cursor() as cur:
+                cur.execute("SELECT project_id "
+                            "FROM barcodes.project_statistics "
+                            "WHERE stale_since IS NOT NULL")
+                self.assertIn((8, ), cur.fetchall())
+            self.assertTrue(admin_repo.project_statistics_need_refresh(3600))
+
     def test_get_daklapack_articles_not_retired(self):
         with Transaction() as t:
             admin_repo = AdminRepo(t)
@@ -0,0 +1,69 @@
+import gzip
+import os
+import tempfile
+import zipfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import pandas as pd
+
+from microsetta_private_api.admin.sample_summary import iter_per_sample, \
+    write_summaries_csv
+
+
+SUMMARIES = [{'sampleid': '000004216', 'project': 'American Gut Project',
+              'source-type': 'human', 'account-email': None,
+              'sample-received': True},
+             {'sampleid': None, 'project': 'A; B, "quoted"',
+              'source-type': None, 'account-email': 'foo@bar.com',
+              'sample-received': False}]
+
+
+class SampleSummaryTests(TestCase):
+    def setUp(self):
+        _, self.path = tempfile.mkstemp()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _expected(self):
+        pd.DataFrame(SUMMARIES).to_csv(self.path)
+        with open(self.path) as f:
+            return f.read()
+
+    def test_write_summaries_csv(self):
+        exp = self._expected()
+        obs = write_summaries_csv(iter(SUMMARIES), self.path)
+        self.assertEqual(obs, 2)
+        with open(self.path) as f:
+            self.assertEqual(f.read(), exp)
+
+    def test_write_summaries_csv_gzip(self):
+        exp = self._expected()
+        write_summaries_csv(iter(SUMMARIES), self.path, 'gzip')
+        with gzip.open(self.path, 'rt') as f:
+            self.assertEqual(f.read(), exp)
+
+    def test_write_summaries_csv_zip(self):
+        exp = self._expected()
+        write_summaries_csv(iter(SUMMARIES), self.path, 'zip', 'foo.csv')
+        with zipfile.ZipFile(self.path) as zf:
+            self.assertEqual(zf.namelist(), ['foo.csv'])
+            self.assertEqual(zf.read('foo.csv').decode(), exp)
+
+    def test_write_summaries_csv_bad_compression(self):
+        with self.assertRaisesRegex(ValueError, "Unknown compression"):
+            write_summaries_csv(iter(SUMMARIES), self.path, 'bz2')
+
+    def test_iter_per_sample(self):
+        barcodes = ['a', 'b', 'c', 'd', 'e']
+        with patch('microsetta_private_api.admin.sample_summary.'
+                   'per_sample') as mock_per_sample:
+            mock_per_sample.side_effect = \
+                lambda project, batch, strip: [{'sampleid': b}
+                                               for b in batch]
+            obs = list(iter_per_sample(None, barcodes, False, batch_size=2))
+
+        self.assertEqual(obs, [{'sampleid': b} for b in barcodes])
+        self.assertEqual([c.args[1] for c in mock_per_sample.call_args_list],
+                         [['a', 'b'], ['c', 'd'], ['e']])
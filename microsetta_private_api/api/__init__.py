@@ -43,6 +43,7 @@ from ._vioscreen import (
     read_vioscreen_food_components,
     read_vioscreen_eating_patterns,
     read_vioscreen_mpeds, read_vioscreen_food_consumption,
+    read_vioscreen_ffq,
     get_vioscreen_dietary_scores_by_component,
     get_vioscreen_dietary_scores_descriptions,
     get_vioscreen_food_components_by_code,
@@ -123,6 +124,7 @@ __all__ = [
     'read_vioscreen_eating_patterns',
     'read_vioscreen_mpeds',
     'read_vioscreen_food_consumption',
+    'read_vioscreen_ffq',
     'get_vioscreen_dietary_scores_by_component',
     'get_vioscreen_dietary_scores_descriptions',
     'get_vioscreen_food_components_by_code',
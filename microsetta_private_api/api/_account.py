@@ -13,7 +13,8 @@ from microsetta_private_api.repo.transaction import Transaction
 from microsetta_private_api.config_manager import SERVER_CONFIG
 from microsetta_private_api.repo.perk_fulfillment_repo import\
     PerkFulfillmentRepo
-from microsetta_private_api.util.google_geocoding import geocode_address
+from microsetta_private_api.util.google_geocoding import \
+    queue_account_geocoding
 
 
 def find_accounts_for_login(token_info):
@@ -59,8 +60,8 @@ def register_account(body, token_info):
     new_acct_id = str(uuid.uuid4())
     body["id"] = new_acct_id
 
-    # We need these keys to exist to create the account object, but we'll
-    # update them momentarily
+    # We need these keys to exist to create the account object, but they
+    # are filled in once the account is geocoded
     body["latitude"] = None
     body["longitude"] = None
     body["cannot_geocode"] = False
@@ -82,17 +83,12 @@ def register_account(body, token_info):
         for sub_id in subscription_ids:
             pfr.claim_unclaimed_subscription(sub_id, new_acct_id)
 
-        # Now that we've successfully created an account, geocode it
-        latitude, longitude, _, _, cannot_geocode = geocode_address(
-            new_acct.address
-        )
-        new_acct.latitude = latitude
-        new_acct.longitude = longitude
-        new_acct.cannot_geocode = cannot_geocode
-        acct_repo.update_account(new_acct)
-
         t.commit()
 
+    # Now that we've successfully created an account, geocode it in the
+    # background, so that the request does not wait on Google
+    queue_account_geocoding(new_acct_id)
+
     response = jsonify(new_acct.to_api())
     response.status_code = 201
     response.headers['Location'] = '/api/accounts/%s' % new_acct_id
@@ -134,7 +130,7 @@ def update_account(account_id, body, token_info):
         acc.first_name = body['first_name']
         acc.last_name = body['last_name']
         acc.email = body['email']
-        acc.address = Address(
+        address = Address(
             body['address']['street'],
             body['address']['city'],
             body['address']['state'],
@@ -145,21 +141,23 @@ def update_account(account_id, body, token_info):
         acc.language = body['language']
 
         # Whenever someone updates their address, we need to update geocoding
-        # info. We don't need to check if they're actually changing their
-        # address, as the geocoding code prevents duplicate requests from
-        # reaching Google's API
-        latitude, longitude, _, _, cannot_geocode = geocode_address(
-            acc.address
-        )
-        acc.latitude = latitude
-        acc.longitude = longitude
-        acc.cannot_geocode = cannot_geocode
+        # info. The location of the old address no longer applies, and the
+        # new one is geocoded in the background once this is committed
+        address_changed = address != acc.address
+        if address_changed:
+            acc.address = address
+            acc.latitude = None
+            acc.longitude = None
+            acc.cannot_geocode = False
 
         # 422 handling is done inside acct_repo
         acct_repo.update_account(acc)
         t.commit()
 
-        return jsonify(acc.to_api()), 200
+    if address_changed:
+        queue_account_geocoding(account_id)
+
+    return jsonify(acc.to_api()), 200
 
 
 JWT_SCHEMES = (
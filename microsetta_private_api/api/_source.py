@@ -18,7 +18,7 @@ from microsetta_private_api.repo.transaction import Transaction
 def read_sources(account_id, token_info, source_type=None):
     _validate_account_access(token_info, account_id)
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         source_repo = SourceRepo(t)
         sources = source_repo.get_sources_in_account(account_id, source_type)
         api_sources = [x.to_api() for x in sources]
@@ -13,8 +13,7 @@ from microsetta_private_api.repo.survey_answers_repo import SurveyAnswersRepo
 from microsetta_private_api.repo.survey_template_repo import SurveyTemplateRepo
 from microsetta_private_api.repo.transaction import Transaction
 from microsetta_private_api.repo.vioscreen_repo import VioscreenRepo
-from microsetta_private_api.util import vioscreen, myfoodrepo, vue_adapter, \
-    polyphenol_ffq
+from microsetta_private_api.util import vioscreen, myfoodrepo, polyphenol_ffq
 from microsetta_private_api.util.vioscreen import VioscreenAdminAPI
 from microsetta_private_api.config_manager import SERVER_CONFIG
 
@@ -31,7 +30,7 @@ def read_survey_templates(account_id, source_id, language_tag, token_info):
     # select survey_id, american from surveys left join survey_group on
     # survey_group = group_order;
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         source_repo = SourceRepo(t)
         source = source_repo.get_source(account_id, source_id)
         if source is None:
@@ -187,7 +186,12 @@ def read_survey_template(account_id, source_id, survey_template_id,
                          registration_code=None, vio_id=None):
     _validate_account_access(token_info, account_id)
 
-    with Transaction() as t:
+    # remote surveys record that the participant is starting them, whereas
+    # local surveys are only read
+    template_type = SurveyTemplateRepo.get_survey_template_link_info(
+        survey_template_id).survey_template_type
+
+    with Transaction(read_only=template_type != 'remote') as t:
         st_repo = SurveyTemplateRepo(t)
 
         info = st_repo.get_survey_template_link_info(
@@ -232,9 +236,8 @@ def read_survey_template(account_id, source_id, survey_template_id,
             return jsonify(info), 200
 
         # For local surveys, we generate the json representing the survey
-        survey_template = st_repo.get_survey_template(survey_template_id,
-                                                      language_tag)
-        info.survey_template_text = vue_adapter.to_vue_schema(survey_template)
+        info.survey_template_text = st_repo.get_vue_schema_cached(
+            survey_template_id, language_tag)
 
         # TODO FIXME HACK: We need a better way to enforce validation on fields
         #  that need it, can this be stored adjacent to the survey questions?
@@ -467,27 +470,32 @@ def top_food_report(account_id, source_id, survey_id, token_info):
         status = vioscreen_repo.get_vioscreen_status(account_id,
                                                      source_id,
                                                      survey_id)
-        if status != 3:
-            # Oops, we don't have results available for this one
-            raise NotFound("No such survey recorded")
-
-        vio = VioscreenAdminAPI()
-        sessions = vio.sessions(survey_id)
-        # Looks like vioscreen supports multiple sessions per user, do we care?
-        session_id = sessions[0]['sessionId']
-        report = vio.top_food_report(session_id)
-
-        if report is None:
-            return NotFound("The requested FFQ is empty")
-
-        response = make_response(report)
-        response.headers.set("Content-Type", "application/pdf")
-        # TODO: Do we want it to download a file or be embedded in the html?
-        # response.headers.set('Content-Disposition',
-        #                      'attachment',
-        #                      filename='top-food-report.pdf')
+    if status != 3:
+        # Oops, we don't have results available for this one
+        raise NotFound("No such survey recorded")
+
+    # the request would otherwise hold its database connection until it is
+    # torn down, including while waiting on Vioscreen
+    Transaction.release_request_connection()
+
+    # call Vioscreen from this worker, rather than waiting on celery
+    vio = VioscreenAdminAPI(perform_async=False)
+    sessions = vio.sessions(survey_id)
+    # Looks like vioscreen supports multiple sessions per user, do we care?
+    session_id = sessions[0]['sessionId']
+    report = vio.top_food_report(session_id)
+
+    if report is None:
+        return NotFound("The requested FFQ is empty")
+
+    response = make_response(report)
+    response.headers.set("Content-Type", "application/pdf")
+    # TODO: Do we want it to download a file or be embedded in the html?
+    # response.headers.set('Content-Disposition',
+    #                      'attachment',
+    #                      filename='top-food-report.pdf')
 
-        return response
+    return response
 
 
 def read_myfoodrepo_available_slots():
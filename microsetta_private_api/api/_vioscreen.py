@@ -11,29 +11,53 @@ from microsetta_private_api.repo.vioscreen_repo import (
 )
 
 
+# part of an FFQ -> (VioscreenComposite attribute, repo, repo getter)
+_FFQ_PARTS = {
+    'percentenergy': ('percent_energy', VioscreenPercentEnergyRepo,
+                      'get_percent_energy'),
+    'dietaryscore': ('dietary_scores', VioscreenDietaryScoreRepo,
+                     'get_dietary_scores'),
+    'supplements': ('supplements', VioscreenSupplementsRepo,
+                    'get_supplements'),
+    'foodcomponents': ('food_components', VioscreenFoodComponentsRepo,
+                       'get_food_components'),
+    'eatingpatterns': ('eating_patterns', VioscreenEatingPatternsRepo,
+                       'get_eating_patterns'),
+    'mpeds': ('mpeds', VioscreenMPedsRepo, 'get_mpeds'),
+    'foodconsumption': ('food_consumption', VioscreenFoodConsumptionRepo,
+                        'get_food_consumption'),
+}
+
+
 def _get_session_by_account_details(account_id, source_id,
                                     sample_id=None,
                                     registration_code=None,
                                     timestamp=None, vio_id=None):
-    with Transaction() as t:
-        surv_temp = SurveyTemplateRepo(t)
-        vio_sess = VioscreenSessionRepo(t)
+    with Transaction(read_only=True) as t:
+        return _find_sessions(t, account_id, source_id, sample_id,
+                              registration_code, timestamp, vio_id)
+
 
-        vio_username = \
-            surv_temp.get_vioscreen_id_if_exists(account_id,
-                                                 source_id,
-                                                 sample_id,
-                                                 registration_code,
-                                                 timestamp,
-                                                 vio_id)
-        if vio_username is None:
-            return True, (jsonify(code=404, message="Username not found"), 404)
+def _find_sessions(t, account_id, source_id, sample_id, registration_code,
+                   timestamp, vio_id):
+    surv_temp = SurveyTemplateRepo(t)
+    vio_sess = VioscreenSessionRepo(t)
 
-        vioscreen_session = vio_sess.get_sessions_by_username(vio_username)
-        if vioscreen_session is None:
-            return True, (jsonify(code=404, message="Session not found"), 404)
+    vio_username = \
+        surv_temp.get_vioscreen_id_if_exists(account_id,
+                                             source_id,
+                                             sample_id,
+                                             registration_code,
+                                             timestamp,
+                                             vio_id)
+    if vio_username is None:
+        return True, (jsonify(code=404, message="Username not found"), 404)
 
-        return False, vioscreen_session
+    vioscreen_session = vio_sess.get_sessions_by_username(vio_username)
+    if vioscreen_session is None:
+        return True, (jsonify(code=404, message="Session not found"), 404)
+
+    return False, vioscreen_session
 
 
 def read_vioscreen_session(account_id, source_id, token_info,
@@ -69,7 +93,7 @@ def read_vioscreen_percent_energy(account_id, source_id, token_info,
     if is_error:
         return vioscreen_session
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_perc = VioscreenPercentEnergyRepo(t)
 
         vioscreen_percent_energy = vio_perc.get_percent_energy(
@@ -96,7 +120,7 @@ def read_vioscreen_dietary_score(account_id, source_id, token_info,
     if is_error:
         return vioscreen_session
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_diet = VioscreenDietaryScoreRepo(t)
 
         vioscreen_dietary_scores = vio_diet.get_dietary_scores(
@@ -123,7 +147,7 @@ def read_vioscreen_supplements(account_id, source_id, token_info,
     if is_error:
         return vioscreen_session
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_supp = VioscreenSupplementsRepo(t)
 
         vioscreen_supplements = vio_supp.get_supplements(
@@ -151,7 +175,7 @@ def read_vioscreen_food_components(account_id, source_id,
     if is_error:
         return vioscreen_session
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_food = VioscreenFoodComponentsRepo(t)
 
         vioscreen_food_components = vio_food.get_food_components(
@@ -178,7 +202,7 @@ def read_vioscreen_eating_patterns(account_id, source_id, token_info,
     if is_error:
         return vioscreen_session
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_eat = VioscreenEatingPatternsRepo(t)
 
         vioscreen_eating_patterns = vio_eat.get_eating_patterns(
@@ -204,7 +228,7 @@ def read_vioscreen_mpeds(account_id, source_id, token_info,
     if is_error:
         return vioscreen_session
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_mped = VioscreenMPedsRepo(t)
 
         vioscreen_mpeds = vio_mped.get_mpeds(vioscreen_session[0].sessionId)
@@ -230,7 +254,7 @@ def read_vioscreen_food_consumption(account_id, source_id, token_info,
     if is_error:
         return vioscreen_session
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_cons = VioscreenFoodConsumptionRepo(t)
 
         vioscreen_food_consumption = vio_cons.get_food_consumption(
@@ -241,11 +265,52 @@ def read_vioscreen_food_consumption(account_id, source_id, token_info,
         return jsonify(vioscreen_food_consumption.to_api()), 200
 
 
+def read_vioscreen_ffq(account_id, source_id, token_info,
+                       sample_id=None,
+                       registration_code=None,
+                       timestamp=None, vio_id=None, include=None):
+    _validate_account_access(token_info, account_id)
+
+    if include is None:
+        include = list(_FFQ_PARTS)
+
+    with Transaction(read_only=True) as t:
+        is_error, vioscreen_session = _find_sessions(t, account_id,
+                                                     source_id,
+                                                     sample_id,
+                                                     registration_code,
+                                                     timestamp, vio_id)
+        if is_error:
+            return vioscreen_session
+
+        session_id = vioscreen_session[0].sessionId
+        if set(include) == set(_FFQ_PARTS):
+            ffq = VioscreenRepo(t).get_ffq(session_id)
+            found = {part: getattr(ffq, attr)
+                     for part, (attr, _, _) in _FFQ_PARTS.items()}
+        else:
+            found = {}
+            for part in include:
+                _, repo, getter = _FFQ_PARTS[part]
+                found[part] = getattr(repo(t), getter)(session_id)
+
+    bundle = {'session': vioscreen_session[0].to_api()}
+    for part, model in found.items():
+        if model is None:
+            bundle[part] = None
+        elif part == 'dietaryscore':
+            bundle[part] = [vds.to_api() for vds in model]
+        else:
+            bundle[part] = model.to_api()
+
+    return jsonify(bundle), 200
+
+
 def get_vioscreen_dietary_scores_by_component(score_type, score_code,
                                               token_info):
     _validate_has_account(token_info)
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_diet = VioscreenDietaryScoreRepo(t)
         scores = vio_diet.get_dietary_scores_by_component(score_type,
                                                           score_code)
@@ -260,7 +325,7 @@ def get_vioscreen_dietary_scores_by_component(score_type, score_code,
 def get_vioscreen_dietary_scores_descriptions(token_info):
     _validate_has_account(token_info)
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_diet = VioscreenDietaryScoreRepo(t)
         descriptions = vio_diet.get_dietary_scores_descriptions()
 
@@ -273,7 +338,7 @@ def get_vioscreen_dietary_scores_descriptions(token_info):
 def get_vioscreen_food_components_by_code(fc_code, token_info):
     _validate_has_account(token_info)
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_food = VioscreenFoodComponentsRepo(t)
         amounts = vio_food.get_food_components_by_code(fc_code)
 
@@ -286,7 +351,7 @@ def get_vioscreen_food_components_by_code(fc_code, token_info):
 def get_vioscreen_food_components_descriptions(token_info):
     _validate_has_account(token_info)
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_food = VioscreenFoodComponentsRepo(t)
         descriptions = vio_food.get_food_components_descriptions()
 
@@ -300,7 +365,7 @@ def get_vioscreen_sessions(account_id, source_id, token_info):
     _validate_account_access(token_info, account_id)
 
     """Obtain vioscreen sessions if it exists"""
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_session = VioscreenRepo(t)
         vioscreen_session = vio_session.get_vioscreen_sessions(account_id,
                                                                source_id)
@@ -324,7 +389,7 @@ def check_ffq_code(ffq_code, token_info):
 def get_vioscreen_registry_entries(account_id, source_id, token_info):
     _validate_account_access(token_info, account_id)
 
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         vio_repo = VioscreenRepo(t)
         vio_registry_entries = vio_repo.get_registry_entries_by_source(
             account_id,
@@ -638,6 +638,11 @@ class ApiTests(TestCase):
         # is there some better pattern I can use to split up what should be
         # a 'with' call?
         self.client.__enter__()
+        # geocoding is queued to celery, which is not running under test
+        queue_patcher = patch('microsetta_private_api.api._account.'
+                              'queue_account_geocoding')
+        self.mock_queue_geocoding = queue_patcher.start()
+        self.addCleanup(queue_patcher.stop)
         delete_dummy_accts()
         h1 = Preparation(BC1, 1234, "16S", 127)
         h2 = Preparation(BC2, 1234, "16S", 18302)
@@ -809,6 +814,10 @@ class AccountsTests(ApiTests):
         # check account id provided in body matches that in location header
         self.assertTrue(real_acct_id_from_loc, real_acct_id_from_body)
 
+        # check the new account was queued for geocoding
+        self.mock_queue_geocoding.assert_called_once_with(
+            real_acct_id_from_loc)
+
     def test_accounts_create_fail_422(self):
         """Return 422 if provided email is in use in db."""
 
@@ -1272,6 +1281,32 @@ class AccountTests(ApiTests):
         self.validate_dummy_acct_response_body(response_obj,
                                                changed_acct_dict)
 
+        # the address changed, so the old location no longer applies
+        self.assertIsNone(response_obj['latitude'])
+        self.assertIsNone(response_obj['longitude'])
+        self.mock_queue_geocoding.assert_called_once_with(dummy_acct_id)
+
+    def test_account_update_same_address(self):
+        """Updating an account without changing its address keeps its
+        location"""
+        dummy_acct_id = create_dummy_acct()
+
+        changed_acct_dict = self.make_updated_acct_dict()
+        changed_acct_dict['address'] = DUMMY_ACCT_INFO['address']
+
+        response = self.client.put(
+            '/api/accounts/%s?%s' %
+            (dummy_acct_id, self.default_lang_querystring),
+            headers=self.dummy_auth,
+            content_type='application/json',
+            data=json.dumps(changed_acct_dict))
+
+        self.assertEqual(200, response.status_code)
+        response_obj = json.loads(response.data)
+        self.assertEqual(response_obj['latitude'],
+                         DUMMY_ACCT_INFO['latitude'])
+        self.mock_queue_geocoding.assert_not_called()
+
     def test_account_update_fail_400_without_required_fields(self):
         """Return 400 validation fail if don't provide a required field """
 
@@ -3373,6 +3408,113 @@ class VioscreenTests(ApiTests):
         response_obj = json.loads(get_response.data)
         self.assertEqual(response_obj['message'], "Food Consumption not found")
 
+    def test_get_sample_vioscreen_ffq_200(self):
+        vioscreen_session = VioscreenSession(
+            sessionId="000ada854d4f45f5abda90ccade7f0a8",
+            username="674533d367f222d2",
+            protocolId=344,
+            status="Finished",
+            startDate="2014-10-08T18:55:12.747",
+            endDate="2014-10-08T18:57:07.503",
+            cultureCode="en-US",
+            created="2014-10-08T18:55:07.96",
+            modified="2017-07-29T03:56:04.22"
+        )
+
+        vioscreen_percent_e = VioscreenPercentEnergy(
+            sessionId="000ada854d4f45f5abda90ccade7f0a8",
+            energy_components=[
+                VioscreenPercentEnergyComponent(
+                    code="%protein",
+                    description="Percent of calories from Protein",
+                    short_description="Protein",
+                    units="%",
+                    amount=14.101114742737353
+                )
+            ]
+        )
+
+        vioscreen_supplements = VioscreenSupplements(
+            sessionId="000ada854d4f45f5abda90ccade7f0a8",
+            supplements_components=[
+                VioscreenSupplementsComponent(
+                    supplement="MultiVitamin",
+                    frequency="7",
+                    amount="200",
+                    average="200")])
+
+        with Transaction() as t:
+            vio_sess = VioscreenSessionRepo(t)
+            vio_sess.upsert_session(vioscreen_session)
+            vio_perc = VioscreenPercentEnergyRepo(t)
+            vio_perc.insert_percent_energy(vioscreen_percent_e)
+            vio_supp = VioscreenSupplementsRepo(t)
+            vio_supp.insert_supplements(vioscreen_supplements)
+            t.commit()
+
+        url = self._url_constructor() + '/vioscreen/ffq'
+        _ = create_dummy_acct(create_dummy_1=True,
+                              iss=ACCT_MOCK_ISS_3,
+                              sub=ACCT_MOCK_SUB_3,
+                              dummy_is_admin=True)
+        get_response = self.client.get(url,
+                                       headers=make_headers(FAKE_TOKEN_ADMIN))
+
+        self.assertEqual(get_response.status_code, 200)
+
+        response_obj = json.loads(get_response.data)
+        self.assertEqual(set(response_obj),
+                         {'session', 'percentenergy', 'dietaryscore',
+                          'supplements', 'foodcomponents', 'eatingpatterns',
+                          'mpeds', 'foodconsumption'})
+        self.assertEqual(response_obj['session']['sessionId'],
+                         vioscreen_session.sessionId)
+        self.assertEqual(response_obj['percentenergy']['calculations'][0]
+                         ['code'],
+                         vioscreen_percent_e.energy_components[0].code)
+        self.assertEqual(response_obj['supplements'],
+                         vioscreen_supplements.to_api())
+        self.assertIsNone(response_obj['mpeds'])
+        self.assertIsNone(response_obj['dietaryscore'])
+
+        # a subset of the results
+        get_response = self.client.get(url + '?include=supplements,mpeds',
+                                       headers=make_headers(FAKE_TOKEN_ADMIN))
+
+        self.assertEqual(get_response.status_code, 200)
+
+        response_obj = json.loads(get_response.data)
+        self.assertEqual(set(response_obj),
+                         {'session', 'supplements', 'mpeds'})
+        self.assertEqual(response_obj['supplements'],
+                         vioscreen_supplements.to_api())
+        self.assertIsNone(response_obj['mpeds'])
+
+    def test_get_sample_vioscreen_ffq_400(self):
+        url = self._url_constructor() + '/vioscreen/ffq?include=bogus'
+        _ = create_dummy_acct(create_dummy_1=True,
+                              iss=ACCT_MOCK_ISS_3,
+                              sub=ACCT_MOCK_SUB_3,
+                              dummy_is_admin=True)
+        get_response = self.client.get(url,
+                                       headers=make_headers(FAKE_TOKEN_ADMIN))
+
+        self.assertEqual(get_response.status_code, 400)
+
+    def test_get_sample_vioscreen_ffq_404(self):
+        url = self._url_constructor() + '/vioscreen/ffq'
+        _ = create_dummy_acct(create_dummy_1=True,
+                              iss=ACCT_MOCK_ISS_3,
+                              sub=ACCT_MOCK_SUB_3,
+                              dummy_is_admin=True)
+        get_response = self.client.get(url,
+                                       headers=make_headers(FAKE_TOKEN_ADMIN))
+
+        self.assertEqual(get_response.status_code, 404)
+
+        response_obj = json.loads(get_response.data)
+        self.assertEqual(response_obj['message'], "Session not found")
+
     def test_get_vioscreen_dietary_scores_by_component_200(self):
         vioscreen_session = VioscreenSession(
             sessionId="000ada854d4f45f5abda90ccade7f0a8",
@@ -1,6 +1,8 @@
 from celery import Celery
 
 from microsetta_private_api.config_manager import SERVER_CONFIG
+from microsetta_private_api.repo.transaction import begin_query_stats, \
+    end_query_stats
 
 PACKAGE = __name__.split('.')[0]
 CELERY_BACKEND_URI = 'celery_backend_uri'
@@ -17,7 +19,11 @@ def init_celery(celery, app):
     class ContextTask(TaskBase):
         def __call__(self, *args, **kwargs):
             with app.app_context():
-                return TaskBase.__call__(self, *args, **kwargs)
+                stats = begin_query_stats(f"task {self.name}")
+                try:
+                    return TaskBase.__call__(self, *args, **kwargs)
+                finally:
+                    end_query_stats(stats)
 
     celery.Task = ContextTask
     celery.autodiscover_tasks([PACKAGE])
@@ -37,10 +43,20 @@ def init_celery(celery, app):
            "task": "microsetta_private_api.admin.daklapack_polling.poll_dak_orders",  # noqa
            "schedule":  60 * 60 * 4  # every 4 hours
         },
+        "refresh_account_geocoding": {
+           "task": "microsetta_private_api.util.google_geocoding.refresh_account_geocoding",  # noqa
+           "schedule":  60 * 60 * 24  # every 24 hours
+        },
         "update_qiita_metadata": {
            "task": "microsetta_private_api.tasks.update_qiita_metadata",  # noqa
            "schedule":  60 * 60 * 24  # every 24 hours
         },
+        # only rebuilds when scans or kits have been created, or the
+        # stored statistics exceed project_statistics_max_age
+        "refresh_project_statistics": {
+           "task": "microsetta_private_api.tasks.refresh_project_statistics",  # noqa
+           "schedule": 60 * 10  # every 10 minutes
+        },
         "pull_fundrazr_transactions": {
            "task": "microsetta_private_api.util.fundrazr.get_fundrazr_transactions",  # noqa
            "schedule": 60 * 60  # every hour
@@ -61,6 +77,12 @@ def init_celery(celery, app):
            "task": "microsetta_private_api.util.perk_fulfillment.perks_without_fulfillment_details",  # noqa
            "schedule": 60 * 60 * 24  # every 24 hours
         },
+        # NOTE 2022-09-01: address verification of interested users is
+        # disabled, as Melissa gives false negatives for Spain
+        # "verify_interested_user_addresses": {
+        #     "task": "microsetta_private_api.tasks.verify_interested_user_addresses",  # noqa
+        #     "schedule": 60 * 60  # every hour
+        # },
         # "fetch_ffqs": {
         #     "task": "microsetta_private_api.util.vioscreen.fetch_ffqs",
         #     "schedule":  60 * 60 * 24  # every 24 hours
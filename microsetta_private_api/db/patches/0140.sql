@@ -0,0 +1,37 @@
+-- Geocoding requests are now keyed by a normalized address, in which case
+-- and runs of whitespace are collapsed and separators left behind by missing
+-- address fields are removed. This mirrors _normalize_request_address in
+-- microsetta_private_api/util/google_geocoding.py. Only ASCII letters and
+-- whitespace are normalized, as UPPER and \s depend on the collation and
+-- locale of the database, and Python's do not.
+
+-- Addresses which only differ in those respects now share a key. Keep one
+-- record for each, preferring the most recent successful response.
+DELETE FROM ag.google_geocoding gg
+    USING (SELECT geocoding_request_id,
+                  ROW_NUMBER() OVER (
+                      PARTITION BY BTRIM(
+                          REGEXP_REPLACE(
+                              REGEXP_REPLACE(
+                                  TRANSLATE(request_address,
+                                            'abcdefghijklmnopqrstuvwxyz',
+                                            'ABCDEFGHIJKLMNOPQRSTUVWXYZ'),
+                                  '[ \t\n\r\f\v]+', ' ', 'g'),
+                              '[ \t\n\r\f\v]*,[ \t\n\r\f\v,]*', ', ', 'g'),
+                          ' ,')
+                      ORDER BY response_body IS NULL, request_timestamp DESC
+                  ) AS keep_rank
+           FROM ag.google_geocoding) ranked
+    WHERE gg.geocoding_request_id = ranked.geocoding_request_id
+        AND ranked.keep_rank > 1;
+
+UPDATE ag.google_geocoding
+    SET request_address = BTRIM(
+        REGEXP_REPLACE(
+            REGEXP_REPLACE(
+                TRANSLATE(request_address,
+                          'abcdefghijklmnopqrstuvwxyz',
+                          'ABCDEFGHIJKLMNOPQRSTUVWXYZ'),
+                '[ \t\n\r\f\v]+', ' ', 'g'),
+            '[ \t\n\r\f\v]*,[ \t\n\r\f\v,]*', ', ', 'g'),
+        ' ,');
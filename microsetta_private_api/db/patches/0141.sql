@@ -0,0 +1,11 @@
+-- Record failed attempts to fetch FFQs from Vioscreen. fetch_ffqs works
+-- through sessions it has not yet attempted before retrying failures, so a
+-- run which is interrupted, or which meets the same failures, resumes where
+-- the last left off.
+CREATE TABLE ag.vioscreen_ffq_fetch_log (
+    sessionId VARCHAR PRIMARY KEY
+        REFERENCES ag.vioscreen_sessions (sessionId) ON DELETE CASCADE,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    last_attempt TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_error VARCHAR
+);
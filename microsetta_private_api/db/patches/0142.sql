@@ -0,0 +1,78 @@
+-- The latest scan of each barcode. Sample listings, the admin barcode
+-- search, project statistics and the Qiita push all need the current
+-- status of barcodes, which otherwise requires aggregating every row of
+-- barcodes.barcode_scans.
+--
+-- If several scans of a barcode share the latest timestamp, the one with
+-- the greatest barcode_scan_id is used, so that a barcode always has a
+-- single latest scan.
+CREATE TABLE barcodes.latest_barcode_scan
+(
+    barcode VARCHAR NOT NULL,
+    barcode_scan_id UUID NOT NULL,
+    scan_timestamp TIMESTAMPTZ NOT NULL,
+    sample_status VARCHAR(100) NOT NULL,
+    CONSTRAINT latest_barcode_scan_pkey PRIMARY KEY (barcode),
+    CONSTRAINT fk_latest_barcode_scan_to_barcode FOREIGN KEY (barcode)
+        REFERENCES barcodes.barcode (barcode)
+);
+
+CREATE INDEX latest_barcode_scan_sample_status_idx
+    ON barcodes.latest_barcode_scan (sample_status);
+
+-- Recompute the latest scan of a barcode from its scans. This is an index
+-- lookup through barcode_scans_barcode_idx.
+CREATE OR REPLACE FUNCTION barcodes.refresh_latest_barcode_scan(
+    changed_barcode VARCHAR)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO barcodes.latest_barcode_scan
+        (barcode, barcode_scan_id, scan_timestamp, sample_status)
+    SELECT barcode, barcode_scan_id, scan_timestamp, sample_status
+    FROM barcodes.barcode_scans
+    WHERE barcode = changed_barcode
+    ORDER BY scan_timestamp DESC, barcode_scan_id DESC
+    LIMIT 1
+    ON CONFLICT (barcode) DO UPDATE
+    SET barcode_scan_id = EXCLUDED.barcode_scan_id,
+        scan_timestamp = EXCLUDED.scan_timestamp,
+        sample_status = EXCLUDED.sample_status;
+
+    DELETE FROM barcodes.latest_barcode_scan
+    WHERE barcode = changed_barcode
+        AND NOT EXISTS (SELECT 1
+                        FROM barcodes.barcode_scans
+                        WHERE barcode = changed_barcode);
+END
+$$ LANGUAGE plpgsql;
+
+-- Keep the latest scans in step with every change to the scans, within the
+-- transaction making the change
+CREATE OR REPLACE FUNCTION barcodes.barcode_scans_latest_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM barcodes.refresh_latest_barcode_scan(NEW.barcode);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM barcodes.refresh_latest_barcode_scan(OLD.barcode);
+    ELSE
+        PERFORM barcodes.refresh_latest_barcode_scan(OLD.barcode);
+        IF NEW.barcode <> OLD.barcode THEN
+            PERFORM barcodes.refresh_latest_barcode_scan(NEW.barcode);
+        END IF;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER barcode_scans_latest_trigger
+    AFTER INSERT OR UPDATE OR DELETE ON barcodes.barcode_scans
+    FOR EACH ROW EXECUTE PROCEDURE barcodes.barcode_scans_latest_trigger();
+
+-- Backfill from the existing scans
+INSERT INTO barcodes.latest_barcode_scan
+    (barcode, barcode_scan_id, scan_timestamp, sample_status)
+SELECT DISTINCT ON (barcode)
+    barcode, barcode_scan_id, scan_timestamp, sample_status
+FROM barcodes.barcode_scans
+ORDER BY barcode, scan_timestamp DESC, barcode_scan_id DESC;
@@ -0,0 +1,18 @@
+-- A snapshot of the computed statistics of each project, so that listing
+-- projects with their statistics does not aggregate every barcode, kit and
+-- scan. The snapshot is rebuilt by the refresh_project_statistics task.
+-- Scanning a barcode or creating kits marks the projects involved as
+-- stale, so that the next run of the task rebuilds it. stale_since records
+-- when a project was last marked; a refresh clears the mark only if it is
+-- unchanged since the refresh began, so that a project marked stale while
+-- its statistics are computed is left stale.
+CREATE TABLE barcodes.project_statistics
+(
+    project_id BIGINT NOT NULL,
+    statistics JSONB NOT NULL,
+    computed_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    stale_since TIMESTAMPTZ,
+    CONSTRAINT project_statistics_pkey PRIMARY KEY (project_id),
+    CONSTRAINT fk_project_statistics_to_project FOREIGN KEY (project_id)
+        REFERENCES barcodes.project (project_id) ON DELETE CASCADE
+);
@@ -0,0 +1,31 @@
+-- Project summaries too large to email as an attachment. The recipient is
+-- instead sent a link containing the token, which downloads the summary
+-- once, until it expires. claimed_timestamp is set by that download.
+CREATE TABLE barcodes.project_summary_export
+(
+    token VARCHAR NOT NULL,
+    project_id BIGINT NOT NULL,
+    filename VARCHAR NOT NULL,
+    creation_timestamp TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expiration_timestamp TIMESTAMPTZ NOT NULL,
+    claimed_timestamp TIMESTAMPTZ,
+    CONSTRAINT project_summary_export_pkey PRIMARY KEY (token),
+    CONSTRAINT fk_project_summary_export_to_project FOREIGN KEY (project_id)
+        REFERENCES barcodes.project (project_id) ON DELETE CASCADE
+);
+
+CREATE INDEX project_summary_export_expiration_idx
+    ON barcodes.project_summary_export (expiration_timestamp);
+
+-- The content of each summary, in chunks, so that neither storing nor
+-- serving one requires holding the whole summary in memory.
+CREATE TABLE barcodes.project_summary_export_chunk
+(
+    token VARCHAR NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    content BYTEA NOT NULL,
+    CONSTRAINT project_summary_export_chunk_pkey
+        PRIMARY KEY (token, chunk_index),
+    CONSTRAINT fk_project_summary_export_chunk_to_export FOREIGN KEY (token)
+        REFERENCES barcodes.project_summary_export (token) ON DELETE CASCADE
+);
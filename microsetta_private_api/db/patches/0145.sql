@@ -0,0 +1,11 @@
+-- Accounts with a geocode_account job queued, so that an account is not
+-- queued again while its job is pending. A marker older than the
+-- geocoding_queue_ttl server configuration is taken to be a lost job.
+CREATE TABLE ag.account_geocoding_queue
+(
+    account_id UUID NOT NULL,
+    queued_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT account_geocoding_queue_pkey PRIMARY KEY (account_id),
+    CONSTRAINT fk_account_geocoding_queue_to_account FOREIGN KEY (account_id)
+        REFERENCES ag.account (id) ON DELETE CASCADE
+);
@@ -1,5 +1,6 @@
 import datetime
 import psycopg2
+import psycopg2.extras
 
 from microsetta_private_api.repo.base_repo import BaseRepo
 from microsetta_private_api.model.account import Account, AuthorizationMatch
@@ -116,6 +117,32 @@ class AccountRepo(BaseRepo):
             else:
                 return AccountRepo._row_to_account(r)
 
+    def _find_accounts_by_emails(self, emails):
+        """Set-based variant of _find_account_by_email
+
+        Parameters
+        ----------
+        emails : Iterable of str
+            The emails to look up
+
+        Returns
+        -------
+        dict
+            Account objects keyed by email. Emails without an account are
+            omitted.
+        """
+        emails = tuple(set(emails))
+        if len(emails) == 0:
+            return {}
+
+        with self._transaction.dict_cursor() as cur:
+            cur.execute("SELECT " + AccountRepo.read_cols + " FROM "
+                        "account "
+                        "WHERE "
+                        "account.email IN %s", (emails,))
+            return {r['email']: AccountRepo._row_to_account(r)
+                    for r in cur.fetchall()}
+
     def find_linked_account(self, auth_iss, auth_sub):
         with self._transaction.dict_cursor() as cur:
             cur.execute("SELECT " + AccountRepo.read_cols + " FROM "
@@ -193,6 +220,138 @@ class AccountRepo(BaseRepo):
                     "Faulty Authorization Status - Contact Admin"
                 )
 
+    def get_account_locations(self):
+        """Obtain the address and stored geocoding of every active account
+
+        Returns
+        -------
+        dict
+            Keyed by account ID, a dict of the account's "address",
+            "latitude", "longitude", "cannot_geocode" and "update_time"
+        """
+        with self._transaction.dict_cursor() as cur:
+            cur.execute("SELECT id, street, street2, city, state, "
+                        "post_code, country_code, latitude, longitude, "
+                        "cannot_geocode, update_time "
+                        "FROM ag.account "
+                        "WHERE account_type != 'deleted'")
+            return {r['id']: {'address': AccountRepo._row_to_addr(r),
+                              'latitude': r['latitude'],
+                              'longitude': r['longitude'],
+                              'cannot_geocode': r['cannot_geocode'],
+                              'update_time': r['update_time']}
+                    for r in cur.fetchall()}
+
+    def get_account_ids_without_location(self, limit=None):
+        """Obtain the active accounts which have not been geocoded
+
+        Accounts whose address could not be geocoded are not included.
+
+        Parameters
+        ----------
+        limit : int, optional
+            The most account IDs to return
+
+        Returns
+        -------
+        list of str
+            The account IDs, oldest account first
+        """
+        with self._transaction.cursor() as cur:
+            cur.execute("SELECT id "
+                        "FROM ag.account "
+                        "WHERE account_type != 'deleted' "
+                        "AND (latitude IS NULL OR longitude IS NULL) "
+                        "AND NOT cannot_geocode "
+                        "ORDER BY creation_time "
+                        "LIMIT %s",
+                        (limit, ))
+            return [r[0] for r in cur.fetchall()]
+
+    def mark_geocoding_queued(self, account_ids, ttl):
+        """Mark accounts as having a geocoding job queued
+
+        An account already marked is only marked anew if its marker is
+        older than ttl, i.e., if its job appears to have been lost.
+
+        Parameters
+        ----------
+        account_ids : list of str
+            The accounts to mark
+        ttl : int
+            The number of seconds after which a marker is disregarded
+
+        Returns
+        -------
+        set of str
+            The accounts marked, which are those to queue a job for
+        """
+        if len(account_ids) == 0:
+            return set()
+
+        with self._transaction.cursor() as cur:
+            cur.execute("DELETE FROM ag.account_geocoding_queue "
+                        "WHERE account_id IN %s "
+                        "AND queued_at < CURRENT_TIMESTAMP - "
+                        "    %s * INTERVAL '1 second'",
+                        (tuple(account_ids), ttl))
+            marked = psycopg2.extras.execute_values(
+                cur,
+                "INSERT INTO ag.account_geocoding_queue (account_id) "
+                "VALUES %s "
+                "ON CONFLICT (account_id) DO NOTHING "
+                "RETURNING account_id",
+                [(account_id, ) for account_id in account_ids],
+                template="(%s::uuid)",
+                page_size=1000,
+                fetch=True)
+        return {str(r[0]) for r in marked}
+
+    def clear_geocoding_queued(self, account_id):
+        """Remove the marker of a queued geocoding job
+
+        Parameters
+        ----------
+        account_id : str
+            The account whose job has started, or could not be queued
+        """
+        with self._transaction.cursor() as cur:
+            cur.execute("DELETE FROM ag.account_geocoding_queue "
+                        "WHERE account_id = %s",
+                        (account_id, ))
+
+    def update_account_locations(self, locations):
+        """Set the geocoding of many accounts
+
+        An account modified since its update_time was read is left alone,
+        as its address may have changed.
+
+        Parameters
+        ----------
+        locations : list of tuple
+            Each (account_id, latitude, longitude, cannot_geocode,
+            update_time)
+        """
+        if len(locations) == 0:
+            return
+
+        with self._transaction.cursor() as cur:
+            psycopg2.extras.execute_values(
+                cur,
+                "UPDATE ag.account AS a "
+                "SET latitude = v.latitude, "
+                "longitude = v.longitude, "
+                "cannot_geocode = v.cannot_geocode "
+                "FROM (VALUES %s) "
+                "AS v (id, latitude, longitude, cannot_geocode, "
+                "update_time) "
+                "WHERE a.id = v.id AND a.update_time = v.update_time",
+                locations,
+                template="(%s::uuid, %s::double precision, "
+                         "%s::double precision, %s::boolean, "
+                         "%s::timestamptz)",
+                page_size=1000)
+
     def create_account(self, account):
         try:
             with self._transaction.cursor() as cur:
@@ -16,10 +16,13 @@ from microsetta_private_api.repo.account_repo import AccountRepo
 from microsetta_private_api.repo.base_repo import BaseRepo
 from microsetta_private_api.repo.kit_repo import KitRepo
 from microsetta_private_api.repo.sample_repo import SampleRepo
-from microsetta_private_api.repo.source_repo import SourceRepo
+from microsetta_private_api.repo.source_repo import SourceRepo, \
+    _row_to_source
 from microsetta_private_api.model.activation_code import ActivationCode
+from microsetta_private_api.model.source import Source
 from werkzeug.exceptions import NotFound
-from microsetta_private_api.util.google_geocoding import geocode_address
+from microsetta_private_api.util.google_geocoding import \
+    read_geocoded_addresses
 from microsetta_private_api.repo.survey_answers_repo import SurveyAnswersRepo
 
 
@@ -103,16 +106,9 @@ NUM_KITS_W_AT_LEAST_ONE_PROBLEM_SAMPLE_SQL = f"""
         FROM ag.ag_kit_barcodes
         INNER JOIN barcodes.project_barcode
         USING (barcode)
-        INNER JOIN barcodes.barcode_scans
+        INNER JOIN barcodes.latest_barcode_scan
         USING (barcode)
-        INNER JOIN (
-            SELECT barcode, max(scan_timestamp) AS scan_timestamp
-            FROM barcodes.barcode_scans
-            GROUP BY barcode
-        ) latest_scan
-        ON barcode_scans.barcode = latest_scan.barcode
-        AND barcode_scans.scan_timestamp = latest_scan.scan_timestamp
-        AND barcode_scans.sample_status <> '{p.VALID_SAMPLES_STATUS}'
+        WHERE latest_barcode_scan.sample_status <> '{p.VALID_SAMPLES_STATUS}'
         GROUP BY project_barcode.project_id;"""
 
 NUM_FULLY_RECEIVED_KITS_SQL = f"""
@@ -143,15 +139,11 @@ KIT_INBOUND_KEY = "inbound_fedex_tracking"
 
 def _make_statuses_sql(_):
     # Note: scans with multiple identical timestamps are quite unlikely
-    # in real life but easy to create in test code.  Such a situation is
-    # pathological; we can't tell which scan is the current status (which we
-    # base on latest timestamp) if there are multiple scans for the same
-    # barcode with the SAME latest timestamp.  The below code is robust to
-    # this pathological situation IF the multiple same-latest-timestamp scans
-    # for a barcode have identical statuses.  However, if the the multiple
-    # same-latest-timestamp scans for a barcode have DIFFERENT statuses, this
-    # code will double-count that barcode.  I doubt this situation will ever
-    # happen in real life.
+    # in real life but easy to create in test code.  We can't truly tell
+    # which scan is the current status (which we base on latest timestamp)
+    # if there are multiple scans for the same barcode with the SAME latest
+    # timestamp; barcodes.latest_barcode_scan settles on one of them, so
+    # each barcode is counted under a single status.
 
     joins = """
         SELECT * FROM crosstab(
@@ -160,15 +152,8 @@ def _make_statuses_sql(_):
             FROM barcodes.project as p
             INNER JOIN barcodes.project_barcode as pb
             USING (project_id)
-            INNER JOIN barcodes.barcode_scans as scans
+            INNER JOIN barcodes.latest_barcode_scan as scans
             USING (barcode)
-            INNER JOIN (
-                SELECT barcode, max(scan_timestamp) AS scan_timestamp
-                FROM barcodes.barcode_scans
-                GROUP BY barcode
-            ) latest_scan
-            ON scans.barcode = latest_scan.barcode
-            AND scans.scan_timestamp = latest_scan.scan_timestamp
             GROUP BY project_id, sample_status
             ORDER BY project_id,
             CASE sample_status """
@@ -220,6 +205,24 @@ _PROJECT_SQLS = [
                 ((p.NUM_FULLY_RETURNED_KITS_KEY,), NUM_FULLY_RECEIVED_KITS_SQL)
                 ]
 
+# The project info and the stored snapshot of its computed statistics, which
+# is NULL for projects that have no snapshot.
+PROJECTS_SNAPSHOT_SQL = f"""
+    SELECT
+    {PROJECT_FIELDS},
+    project_statistics.statistics
+    FROM barcodes.project
+    LEFT JOIN
+    barcodes.project_statistics
+    USING (project_id)
+    ORDER BY project_id;"""
+
+# The value to mark the stored statistics of a project stale with. It always
+# changes the mark, even if set twice within the same microsecond, so that a
+# refresh can tell the project was marked again.
+STALE_SINCE_NOW = ("GREATEST(clock_timestamp(), "
+                   "stale_since + INTERVAL '1 microsecond')")
+
 
 def _get_kit_tuples(new_kit_uuids, kit_names, kits_details=None):
     result = []
@@ -281,6 +284,103 @@ class AdminRepo(BaseRepo):
         projects_df.set_index('project_id', drop=False, inplace=True)
         return projects_df
 
+    def _read_projects_df_from_snapshot(self):
+        """Return pandas data frame of project info and stored statistics.
+
+        Returns None if any project has no stored statistics, e.g., before
+        the first refresh_project_statistics, in which case the statistics
+        must be computed.
+        """
+        with self._transaction.dict_cursor():
+            conn = self._transaction._conn
+            projects_df = pd.read_sql(PROJECTS_SNAPSHOT_SQL, conn)
+
+        statistics = projects_df.pop('statistics')
+        if statistics.isna().any():
+            return None
+
+        # expand the stored statistics into a column per statistic, as
+        # _read_projects_df_from_db returns them
+        stats_df = pd.DataFrame.from_records(
+            statistics.tolist(), index=projects_df.index,
+            columns=p.get_computed_stats_keys())
+        projects_df = pd.concat([projects_df, stats_df], axis=1)
+
+        projects_df.set_index('project_id', drop=False, inplace=True)
+        return projects_df
+
+    def refresh_project_statistics(self):
+        """Compute the statistics of every project and store them
+
+        A project is only marked as no longer stale if it has not been
+        marked stale again since the refresh began, as the statistics
+        computed may not include the change which marked it.
+
+        Returns
+        -------
+        int
+            The number of projects whose statistics were stored
+        """
+        with self._transaction.cursor() as cur:
+            cur.execute("SELECT project_id, stale_since "
+                        "FROM barcodes.project_statistics")
+            stale_since = dict(cur.fetchall())
+
+        projects_df = self._read_projects_df_from_db(include_stats=True)
+        stats_df = projects_df[p.get_computed_stats_keys()]
+        stats_df = stats_df.fillna(0).astype(int)
+
+        rows = [(int(project_id), json.dumps(stats),
+                 stale_since.get(int(project_id)))
+                for project_id, stats
+                in stats_df.to_dict(orient='index').items()]
+
+        with self._transaction.cursor() as cur:
+            # stale_since of an inserted row is what was read above, i.e.,
+            # NULL, and of an existing row is cleared only if unchanged
+            psycopg2.extras.execute_values(
+                cur,
+                "INSERT INTO barcodes.project_statistics AS s "
+                "(project_id, statistics, computed_at, stale_since) "
+                "VALUES %s "
+                "ON CONFLICT (project_id) DO UPDATE "
+                "SET statistics = EXCLUDED.statistics, "
+                "    computed_at = EXCLUDED.computed_at, "
+                "    stale_since = CASE "
+                "        WHEN s.stale_since IS NOT DISTINCT FROM "
+                "            EXCLUDED.stale_since THEN NULL "
+                "        ELSE s.stale_since END",
+                rows,
+                template="(%s, %s, CURRENT_TIMESTAMP, %s::timestamptz)")
+        return len(rows)
+
+    def project_statistics_need_refresh(self, max_age):
+        """Determine whether the stored project statistics are out of date
+
+        Parameters
+        ----------
+        max_age : int
+            The age, in seconds, past which stored statistics are out of date
+
+        Returns
+        -------
+        bool
+            True if any project has no stored statistics, or has statistics
+            which are stale or older than max_age
+        """
+        with self._transaction.cursor() as cur:
+            cur.execute("SELECT EXISTS ("
+                        "    SELECT 1 "
+                        "    FROM barcodes.project "
+                        "    LEFT JOIN barcodes.project_statistics "
+                        "    USING (project_id) "
+                        "    WHERE computed_at IS NULL "
+                        "        OR stale_since IS NOT NULL "
+                        "        OR computed_at < CURRENT_TIMESTAMP - "
+                        "            %s * INTERVAL '1 second')",
+                        (max_age, ))
+            return cur.fetchone()[0]
+
     def _get_ids_relevant_to_barcode(self, sample_barcode):
         with self._transaction.dict_cursor() as cur:
             # First, look for this barcode in the set of barcodes
@@ -443,6 +543,95 @@ class AdminRepo(BaseRepo):
 
             return diagnostic
 
+    def retrieve_summary_details_by_barcodes(self, barcodes):
+        """Obtain what per-sample summaries report for many barcodes at once
+
+        Set-based counterpart of retrieve_diagnostics_by_barcode, restricted
+        to the details summarized by admin.sample_summary.per_sample, and
+        resolving the account, source, sample, latest scan, projects and
+        vioscreen registration of every barcode in a single query.
+
+        Parameters
+        ----------
+        barcodes : Iterable of str
+            The barcodes to describe
+
+        Returns
+        -------
+        dict
+            The details of each barcode, keyed by barcode. Barcodes which do
+            not exist are omitted. The details are the sample_id,
+            sample_date, sample_time, site_sampled and sample_status, which
+            are None if the barcode has no sample; the account_email; the
+            source_type, which is None if the barcode has no active source;
+            the vio_id of the active registration of a human source; and
+            the names of the projects of the barcode.
+        """
+        barcodes = tuple(set(barcodes))
+        if len(barcodes) == 0:
+            return {}
+
+        # The account of a barcode is that of its source, or if it has no
+        # source, one created with its kit, as in
+        # _get_ids_relevant_to_barcode. Revoked sources still provide the
+        # account, but are otherwise treated as absent, as by
+        # SourceRepo.get_source.
+        with self._transaction.dict_cursor() as cur:
+            cur.execute(
+                "SELECT barcode.barcode, "
+                "ag_kit_barcodes.ag_kit_barcode_id AS sample_id, "
+                "ag_kit_barcodes.sample_date, "
+                "ag_kit_barcodes.sample_time, "
+                "ag_kit_barcodes.site_sampled, "
+                "CASE WHEN ag_kit_barcodes.ag_kit_barcode_id IS NOT NULL "
+                "     THEN latest_scan.sample_status "
+                "END AS sample_status, "
+                "CASE WHEN source.date_revoked IS NULL "
+                "     THEN source.source_type "
+                "END AS source_type, "
+                "COALESCE(source_account.email, kit_account.email) "
+                "    AS account_email, "
+                "registry.vio_id, "
+                "ARRAY(SELECT project.project "
+                "      FROM barcodes.project_barcode "
+                "      INNER JOIN barcodes.project "
+                "      USING (project_id) "
+                "      WHERE project_barcode.barcode = barcode.barcode) "
+                "    AS projects "
+                "FROM barcodes.barcode "
+                "LEFT JOIN ag.ag_kit_barcodes "
+                "ON ag_kit_barcodes.barcode = barcode.barcode "
+                "LEFT JOIN barcodes.latest_barcode_scan latest_scan "
+                "ON latest_scan.barcode = barcode.barcode "
+                "LEFT JOIN ag.source "
+                "ON source.id = ag_kit_barcodes.source_id "
+                "LEFT JOIN ag.account source_account "
+                "ON source_account.id = source.account_id "
+                "LEFT JOIN LATERAL ("
+                "    SELECT email "
+                "    FROM ag.account "
+                "    WHERE account.created_with_kit_id = barcode.kit_id "
+                "        AND ag_kit_barcodes.ag_kit_barcode_id IS NOT NULL "
+                "        AND source.id IS NULL "
+                "    LIMIT 1"
+                ") kit_account ON TRUE "
+                "LEFT JOIN LATERAL ("
+                "    SELECT vio_id "
+                "    FROM ag.vioscreen_registry "
+                "    WHERE vioscreen_registry.account_id = source.account_id "
+                "        AND vioscreen_registry.source_id = source.id "
+                "        AND vioscreen_registry.sample_id = "
+                "            ag_kit_barcodes.ag_kit_barcode_id "
+                "        AND vioscreen_registry.deleted = false "
+                "        AND source.source_type = %s "
+                "        AND source.date_revoked IS NULL "
+                "    LIMIT 1"
+                ") registry ON TRUE "
+                "WHERE barcode.barcode IN %s",
+                (Source.SOURCE_TYPE_HUMAN, barcodes))
+
+            return {r['barcode']: dict(r) for r in cur.fetchall()}
+
     def get_project_name(self, project_id):
         """Obtain the name of a project using the project_id
 
@@ -561,6 +750,12 @@ class AdminRepo(BaseRepo):
                          project.alias, project.sponsor, project.coordination,
                          project.is_active])
 
+            # a new project has no barcodes, so its statistics are all zero
+            cur.execute("INSERT INTO barcodes.project_statistics "
+                        "(project_id, statistics) "
+                        "VALUES (%s, '{}')",
+                        (id_, ))
+
         # if we made it this far, all is well
         return id_
 
@@ -682,7 +877,7 @@ class AdminRepo(BaseRepo):
                         (project_name,))
             return cur.rowcount == 1
 
-    def get_projects(self, include_stats, is_active_val=None):
+    def get_projects(self, include_stats, is_active_val=None, fresh=False):
         """Return a list of Project objects, ordered by project id.
 
         Parameters
@@ -691,12 +886,22 @@ class AdminRepo(BaseRepo):
             If True or False, the resulting project list will be filtered
             to include only the projects with that active status. If None, all
             projects will be returned regardless of active status.
+        fresh : bool, optional
+            If True, the statistics are computed from the db, rather than
+            read from the snapshot stored by refresh_project_statistics,
+            which may lag behind recent scans and kits. Statistics are also
+            computed if any project has no stored snapshot.
         """
 
         # read all kinds of project info and computed counts from the db
         # into a pandas data frame
-        projects_df = self._read_projects_df_from_db(
-            include_stats=include_stats)
+        projects_df = None
+        if include_stats and not fresh:
+            projects_df = self._read_projects_df_from_snapshot()
+
+        if projects_df is None:
+            projects_df = self._read_projects_df_from_db(
+                include_stats=include_stats)
 
         # if an active value has been provided, look only at project records
         # that have that active value.  NB this has to be a test against None,
@@ -908,6 +1113,11 @@ class AdminRepo(BaseRepo):
                             "(barcode, project_id) "
                             "VALUES (%s, %s)", barcode_projects)
 
+            cur.execute("UPDATE barcodes.project_statistics "
+                        "SET stale_since = " + STALE_SINCE_NOW + " "
+                        "WHERE project_id IN %s",
+                        (tuple(project_ids), ))
+
             if is_tmi:
                 # create a record for each new kit in ag_kit table
                 ag_kit_inserts = [
@@ -1084,7 +1294,9 @@ class AdminRepo(BaseRepo):
                 raise RepoException("ERROR: Multiple barcode entries would be "
                                     "affected by scan; failing out")
 
-            # put a new row in the barcodes.barcode_scans table
+            # put a new row in the barcodes.barcode_scans table. this
+            # also updates barcodes.latest_barcode_scan, through the
+            # barcode_scans_latest_trigger
             new_uuid = str(uuid.uuid4())
             scan_args = (
                 new_uuid,
@@ -1102,6 +1314,18 @@ class AdminRepo(BaseRepo):
                 scan_args
             )
 
+            # the stored statistics of the projects of the barcode no
+            # longer count this scan
+            cur.execute(
+                "UPDATE barcodes.project_statistics "
+                "SET stale_since = " + STALE_SINCE_NOW + " "
+                "WHERE project_id IN ("
+                "    SELECT project_id "
+                "    FROM barcodes.project_barcode "
+                "    WHERE barcode = %s)",
+                (sample_barcode, )
+            )
+
             return new_uuid
 
     def search_barcode(self, sql_cond, cond_params):
@@ -1120,22 +1344,50 @@ class AdminRepo(BaseRepo):
                 sql.SQL("""SELECT project_barcode.barcode
                            FROM project_barcode
                            LEFT JOIN ag_kit_barcodes USING (barcode)
-                           LEFT JOIN barcodes.barcode_scans USING (barcode)
                            LEFT JOIN (
-                               SELECT barcode,
-                                      max(scan_timestamp)
+                               SELECT barcode, sample_status,
+                                      scan_timestamp
                                           AS scan_timestamp_latest
-                               FROM barcodes.barcode_scans
-                               GROUP BY barcode
-                           ) AS latest_scan
-                           ON barcode_scans.barcode = latest_scan.barcode
-                               AND barcode_scans.scan_timestamp =
-                                   latest_scan.scan_timestamp_latest
+                               FROM barcodes.latest_barcode_scan
+                           ) AS latest_scan USING (barcode)
                            WHERE {cond}""").format(cond=sql_cond),
                 cond_params
             )
             return [r[0] for r in cur.fetchall()]
 
+    def _apply_geocoding(self, accounts):
+        """Attach the stored geocoding of addresses to accounts
+
+        Many older accounts do not have a standardized country code and
+        state/province. If we have standardized results from Google, we
+        attach them to the account to filter through the metadata push.
+        We're _not_ going to attach them to the account in our database,
+        though. Only geocoding already obtained, when the address was set or
+        by the refresh_account_geocoding task, is used; nothing is requested
+        from Google and nothing is written. An account whose address has
+        not been geocoded keeps its stored location.
+
+        Parameters
+        ----------
+        accounts : dict of Account
+            The accounts to update in place, keyed by account ID
+        """
+        geocoded = read_geocoded_addresses(
+            self._transaction,
+            {k: a.address for k, a in accounts.items()})
+
+        for account_id, (latitude, longitude, geo_state, geo_country,
+                         cannot_geocode) in geocoded.items():
+            account = accounts[account_id]
+            account.latitude = latitude
+            account.longitude = longitude
+            account.cannot_geocode = cannot_geocode
+
+            if geo_state is not None:
+                account.address.state = geo_state
+            if geo_country is not None:
+                account.address.country_code = geo_country
+
     def get_survey_metadata(self, sample_barcode, survey_template_id=None):
         '''
         Return all surveys associated with a given barcode.
@@ -1169,22 +1421,7 @@ class AdminRepo(BaseRepo):
             raise RepoException("Barcode is not associated with a source")
 
         if account is not None:
-            # Many older accounts do not have a standardized country code and
-            # state/province. If we can get standardized results from Google
-            # we're going to attach them to the account to filter through the
-            # metadata push. We're _not_ going to attach them to the account
-            # in our database, though.
-            latitude, longitude, geo_state, geo_country, cannot_geocode =\
-                geocode_address(account.address)
-            account.latitude = latitude
-            account.longitude = longitude
-            account.cannot_geocode = cannot_geocode
-            account_repo.update_account(account)
-
-            if geo_state is not None:
-                account.address.state = geo_state
-            if geo_country is not None:
-                account.address.country_code = geo_country
+            self._apply_geocoding({account_id: account})
 
         host_subject_id = source_repo.get_host_subject_id(source)
 
@@ -1202,34 +1439,8 @@ class AdminRepo(BaseRepo):
                 timestamp
             )
 
-        pst = pytz.timezone('US/Pacific')
-        tz_aware_sample_ts = pst.localize(sample.datetime_collected)
-
-        best_ts = {}
-        # Since users can re-take surveys, we need to find the most temporally
-        # appropriate instance of each template, relative to the sample's
-        # collection time
-        for answer_id in answer_ids:
-            s_t_id = str(answer_to_template_map[answer_id][0])
-            if s_t_id in best_ts:
-                cur_time_diff = abs(
-                    (answer_to_template_map[best_ts[s_t_id]][2] -
-                     tz_aware_sample_ts).total_seconds()
-                )
-                new_time_diff = abs(
-                    (answer_to_template_map[answer_id][2] -
-                     tz_aware_sample_ts).total_seconds()
-                )
-                if new_time_diff < cur_time_diff:
-                    best_ts[s_t_id] = answer_id
-            else:
-                best_ts[s_t_id] = answer_id
-
-        new_answer_to_template_map = {}
-        for s_id in best_ts.values():
-            new_answer_to_template_map[s_id] = answer_to_template_map[s_id]
-
-        answer_to_template_map = new_answer_to_template_map
+        answer_to_template_map = self._select_closest_surveys(
+            answer_ids, answer_to_template_map, sample.datetime_collected)
         answer_ids = answer_to_template_map.keys()
 
         # if a survey template is specified, filter the returned surveys
@@ -1263,18 +1474,10 @@ class AdminRepo(BaseRepo):
                 # gracefully handle this
                 continue
 
-            survey_answers = {}
-            for k in answer_model:
-                new_k = metadata_map[int(k)]
-                survey_answers[k] = [new_k, answer_model[k]]
-
             all_survey_answers.append(
-                {
-                    "template": answer_to_template_map[answer_id][0],
-                    "survey_status": answer_to_template_map[answer_id][1],
-                    "survey_timestamp": answer_to_template_map[answer_id][2],
-                    "response": survey_answers
-                })
+                self._format_survey_answers(
+                    answer_model, answer_to_template_map[answer_id],
+                    metadata_map))
 
         pulldown = {
             "sample_barcode": sample_barcode,
@@ -1287,6 +1490,243 @@ class AdminRepo(BaseRepo):
 
         return pulldown
 
+    def get_survey_metadata_bulk(self, sample_barcodes):
+        """Return all surveys associated with each of the given barcodes
+
+        This is the set-based counterpart of get_survey_metadata. Accounts,
+        sources, samples, survey associations and answers are resolved for
+        all barcodes at once, so the number of queries issued does not grow
+        with the number of barcodes.
+
+        Parameters
+        ----------
+        sample_barcodes : Iterable of str
+            The barcodes to obtain metadata for
+
+        Returns
+        -------
+        dict
+            The pulldown, structured as from get_survey_metadata, keyed by
+            barcode
+        dict
+            Any error associated with a barcode, keyed by barcode. A barcode
+            is present in only one of the two dicts.
+        """
+        sample_barcodes = tuple(set(sample_barcodes))
+        pulldowns = {}
+        errors = {}
+        if len(sample_barcodes) == 0:
+            return pulldowns, errors
+
+        with self._transaction.dict_cursor() as cur:
+            # a revoked source is treated as no source, as get_source
+            # does not return it
+            cur.execute("SELECT "
+                        "ag_kit_barcodes.barcode, "
+                        "ag_kit_barcodes.ag_kit_barcode_id as sample_id, "
+                        "source.id as source_id, "
+                        "source.account_id as account_id "
+                        "FROM ag.ag_kit_barcodes "
+                        "LEFT JOIN ag.source "
+                        "ON ag_kit_barcodes.source_id = source.id "
+                        "AND source.date_revoked IS NULL "
+                        "WHERE ag_kit_barcodes.barcode IN %s",
+                        (sample_barcodes,))
+            ids = {r['barcode']: dict(r) for r in cur.fetchall()}
+
+            for sample_barcode in sample_barcodes:
+                if sample_barcode not in ids:
+                    errors[sample_barcode] = "No such barcode"
+                elif ids[sample_barcode]['source_id'] is None:
+                    errors[sample_barcode] = \
+                        "Barcode is not associated with a source"
+                    ids.pop(sample_barcode)
+
+            if len(ids) == 0:
+                return pulldowns, errors
+
+            account_ids = tuple({r['account_id'] for r in ids.values()})
+            source_ids = tuple({r['source_id'] for r in ids.values()})
+            sample_ids = tuple({r['sample_id'] for r in ids.values()})
+
+            cur.execute("SELECT " + AccountRepo.read_cols + " FROM "
+                        "ag.account "
+                        "WHERE "
+                        "account.id IN %s",
+                        (account_ids,))
+            accounts = {r['id']: AccountRepo._row_to_account(r)
+                        for r in cur.fetchall()}
+
+            cur.execute("SELECT " + SourceRepo.read_cols + " FROM "
+                        "ag.source "
+                        "WHERE "
+                        "source.id IN %s",
+                        (source_ids,))
+            sources = {r['id']: _row_to_source(r) for r in cur.fetchall()}
+
+            # get_host_subject_id returns the row rather than the value
+            cur.execute("SELECT source_id, host_subject_id "
+                        "FROM ag.source_host_subject_id "
+                        "WHERE source_id IN %s",
+                        (source_ids,))
+            host_subject_ids = {r['source_id']: (r['host_subject_id'],)
+                                for r in cur.fetchall()}
+
+            # the survey associations for each sample, restricted to
+            # those owned by the sample's account and source as is done by
+            # get_answered_survey
+            cur.execute("SELECT "
+                        "ag_kit_barcodes.ag_kit_barcode_id as sample_id, "
+                        "source_barcodes_surveys.survey_id, "
+                        "ag_login_surveys.survey_template_id, "
+                        "ag_login_surveys.vioscreen_status, "
+                        "ag_login_surveys.creation_time, "
+                        "ag_login_surveys.ag_login_id, "
+                        "ag_login_surveys.source_id "
+                        "FROM ag.ag_kit_barcodes "
+                        "JOIN ag.source_barcodes_surveys "
+                        "USING (barcode) "
+                        "LEFT JOIN ag.ag_login_surveys "
+                        "ON source_barcodes_surveys.survey_id = "
+                        "ag_login_surveys.survey_id "
+                        "WHERE ag_kit_barcodes.ag_kit_barcode_id IN %s",
+                        (sample_ids,))
+            surveys_by_sample = {}
+            for r in cur.fetchall():
+                surveys_by_sample.setdefault(r['sample_id'], []).append(
+                    dict(r))
+
+        sample_repo = SampleRepo(self._transaction)
+        samples = sample_repo._get_samples_by_ids(sample_ids)
+
+        self._apply_geocoding(accounts)
+
+        answer_to_template_maps = {}
+        for sample_barcode, bc_ids in list(ids.items()):
+            sample = samples[bc_ids['sample_id']]
+
+            # surveys are selected relative to when the sample was
+            # collected, so a sample without a collection date and time is
+            # reported for its barcode rather than failing the pulldown
+            if sample.datetime_collected is None:
+                errors[sample_barcode] = \
+                    "Sample is missing a collection date and time"
+                ids.pop(sample_barcode)
+                continue
+
+            answer_ids = []
+            answer_to_template_map = {}
+            for r in surveys_by_sample.get(bc_ids['sample_id'], []):
+                answer_ids.append(r['survey_id'])
+                answer_to_template_map[r['survey_id']] = (
+                    r['survey_template_id'],
+                    r['vioscreen_status'],
+                    r['creation_time']
+                )
+
+            answer_to_template_map = self._select_closest_surveys(
+                answer_ids, answer_to_template_map, sample.datetime_collected)
+
+            # drop surveys not owned by the account and source of the sample
+            owned = {r['survey_id']
+                     for r in surveys_by_sample.get(bc_ids['sample_id'], [])
+                     if r['ag_login_id'] == bc_ids['account_id'] and
+                     r['source_id'] == bc_ids['source_id']}
+            answer_to_template_maps[sample_barcode] = {
+                k: v for k, v in answer_to_template_map.items()
+                if k in owned}
+
+        survey_answers_repo = SurveyAnswersRepo(self._transaction)
+        answer_models = survey_answers_repo.get_answered_surveys_bulk(
+            [answer_id for m in answer_to_template_maps.values()
+             for answer_id in m],
+            "en_US")
+        metadata_map = survey_answers_repo.build_metadata_map()
+
+        for sample_barcode, bc_ids in ids.items():
+            source = sources[bc_ids['source_id']]
+            answer_to_template_map = answer_to_template_maps[sample_barcode]
+
+            all_survey_answers = [
+                self._format_survey_answers(answer_models[answer_id],
+                                            template_info,
+                                            metadata_map)
+                for answer_id, template_info in answer_to_template_map.items()
+            ]
+
+            pulldowns[sample_barcode] = {
+                "sample_barcode": sample_barcode,
+                "host_subject_id": host_subject_ids.get(source.id),
+                "account": accounts[bc_ids['account_id']],
+                "source": source,
+                "sample": samples[bc_ids['sample_id']],
+                "survey_answers": all_survey_answers
+            }
+
+        return pulldowns, errors
+
+    @staticmethod
+    def _select_closest_surveys(answer_ids, answer_to_template_map,
+                                sample_datetime):
+        """Limit surveys to the instance of each template closest in time
+
+        Parameters
+        ----------
+        answer_ids : list of str
+            The survey answer IDs associated with a sample
+        answer_to_template_map : dict
+            Keyed by survey answer ID, valued by (template_id, status,
+            timestamp)
+        sample_datetime : datetime.datetime
+            The sample collection time
+
+        Returns
+        -------
+        dict
+            The subset of answer_to_template_map to retain
+        """
+        pst = pytz.timezone('US/Pacific')
+        tz_aware_sample_ts = pst.localize(sample_datetime)
+
+        best_ts = {}
+        # Since users can re-take surveys, we need to find the most temporally
+        # appropriate instance of each template, relative to the sample's
+        # collection time
+        for answer_id in answer_ids:
+            s_t_id = str(answer_to_template_map[answer_id][0])
+            if s_t_id in best_ts:
+                cur_time_diff = abs(
+                    (answer_to_template_map[best_ts[s_t_id]][2] -
+                     tz_aware_sample_ts).total_seconds()
+                )
+                new_time_diff = abs(
+                    (answer_to_template_map[answer_id][2] -
+                     tz_aware_sample_ts).total_seconds()
+                )
+                if new_time_diff < cur_time_diff:
+                    best_ts[s_t_id] = answer_id
+            else:
+                best_ts[s_t_id] = answer_id
+
+        return {s_id: answer_to_template_map[s_id]
+                for s_id in best_ts.values()}
+
+    @staticmethod
+    def _format_survey_answers(answer_model, template_info, metadata_map):
+        template_id, status, timestamp = template_info
+
+        survey_answers = {}
+        for k in answer_model:
+            new_k = metadata_map[int(k)]
+            survey_answers[k] = [new_k, answer_model[k]]
+
+        return {
+            "template": template_id,
+            "survey_status": status,
+            "survey_timestamp": timestamp,
+            "response": survey_answers
+        }
+
     def get_daklapack_articles(self, include_retired=False):
         retired_constraint = "" if include_retired else "WHERE retired = False"
         cmd = f"SELECT dak_article_id, dak_article_code, short_description, " \
@@ -48,6 +48,34 @@ class GoogleGeocodingRepo(BaseRepo):
                 # Already geocoded, return the response body
                 return False, row['geocoding_request_id'], row['response_body']
 
+    def get_responses(self, request_addresses):
+        """
+        Obtain the stored geocoding responses for many addresses
+
+        Parameters
+        ----------
+        request_addresses : Iterable of str
+            Formatted addresses to look up
+
+        Returns
+        -------
+        dict
+            The response_body keyed by request_address, for each address
+            with a stored response
+        """
+        request_addresses = tuple(set(request_addresses))
+        if len(request_addresses) == 0:
+            return {}
+
+        with self._transaction.dict_cursor() as cur:
+            cur.execute("""SELECT request_address, response_body
+                           FROM ag.google_geocoding
+                           WHERE request_address IN %s
+                               AND response_body IS NOT NULL""",
+                        (request_addresses, ))
+            return {r['request_address']: r['response_body']
+                    for r in cur.fetchall()}
+
     def update_record(self, geocoding_request_id, response_body):
         """
         Update the DB record with the geocoding response
@@ -1,4 +1,5 @@
 import psycopg2
+from psycopg2.extras import execute_values
 
 from microsetta_private_api.repo.base_repo import BaseRepo
 from microsetta_private_api.exceptions import RepoException
@@ -214,6 +215,110 @@ class InterestedUserRepo(BaseRepo):
                     )
                     return False
 
+    def get_unchecked_addresses(self, limit, after=None):
+        """Obtain the addresses of interested users awaiting verification
+
+        Parameters
+        ----------
+        limit : int
+            The most addresses to return
+        after : str, optional
+            Only return interested users whose ID follows this one, to page
+            through the addresses
+
+        Returns
+        -------
+        list of dict
+            The interested_user_id of each user, and its address under the
+            keys of melissa.verify_addresses, ordered by interested_user_id
+        """
+        with self._transaction.dict_cursor() as cur:
+            cur.execute(
+                "SELECT interested_user_id, address_1, address_2, "
+                "address_3, city, state, postal_code AS postal, country "
+                "FROM campaign.interested_users "
+                "WHERE address_checked = false AND address_1 != '' AND "
+                "postal_code != '' AND country != '' "
+                "AND (%s IS NULL OR interested_user_id > %s::uuid) "
+                "ORDER BY interested_user_id "
+                "LIMIT %s",
+                (after, after, limit)
+            )
+            return [dict(r) for r in cur.fetchall()]
+
+    def update_address_verifications(self, verifications):
+        """Store the results of verifying many addresses
+
+        As with verify_address, valid addresses are replaced by the
+        Melissa-verified version, other than the country. A user whose
+        address changed after it was read is left unchecked.
+
+        Parameters
+        ----------
+        verifications : list of (dict, dict)
+            The address of each user, as from get_unchecked_addresses, and
+            its result from melissa.verify_addresses
+
+        Returns
+        -------
+        int
+            The number of interested users updated
+        """
+        valid = [(a['interested_user_id'], a['address_1'], a['postal'],
+                  a['country'], r['address_1'], r['address_2'],
+                  r['address_3'], r['city'], r['state'], r['postal'],
+                  r['latitude'] or None, r['longitude'] or None)
+                 for a, r in verifications if r['valid'] is True]
+        invalid = [(a['interested_user_id'], a['address_1'], a['postal'],
+                    a['country'])
+                   for a, r in verifications if r['valid'] is not True]
+
+        updated = 0
+        with self._transaction.cursor() as cur:
+            if valid:
+                execute_values(
+                    cur,
+                    "UPDATE campaign.interested_users iu "
+                    "SET address_checked = true, address_valid = true, "
+                    "address_1 = v.address_1, address_2 = v.address_2, "
+                    "address_3 = v.address_3, city = v.city, "
+                    "state = v.state, postal_code = v.postal, "
+                    "latitude = v.latitude, longitude = v.longitude "
+                    "FROM (VALUES %s) AS v (interested_user_id, "
+                    "source_address_1, source_postal, source_country, "
+                    "address_1, address_2, address_3, city, state, postal, "
+                    "latitude, longitude) "
+                    "WHERE iu.interested_user_id = v.interested_user_id "
+                    "AND iu.address_checked = false "
+                    "AND iu.address_1 = v.source_address_1 "
+                    "AND iu.postal_code = v.source_postal "
+                    "AND iu.country = v.source_country",
+                    valid,
+                    template="(%s::uuid, %s, %s, %s, %s, %s, %s, %s, %s, "
+                             "%s, %s::double precision, "
+                             "%s::double precision)",
+                    page_size=len(valid))
+                updated += cur.rowcount
+
+            if invalid:
+                execute_values(
+                    cur,
+                    "UPDATE campaign.interested_users iu "
+                    "SET address_checked = true, address_valid = false "
+                    "FROM (VALUES %s) AS v (interested_user_id, "
+                    "source_address_1, source_postal, source_country) "
+                    "WHERE iu.interested_user_id = v.interested_user_id "
+                    "AND iu.address_checked = false "
+                    "AND iu.address_1 = v.source_address_1 "
+                    "AND iu.postal_code = v.source_postal "
+                    "AND iu.country = v.source_country",
+                    invalid,
+                    template="(%s::uuid, %s, %s, %s)",
+                    page_size=len(invalid))
+                updated += cur.rowcount
+
+        return updated
+
     def get_interested_user_by_just_email(self, email):
         with self._transaction.dict_cursor() as cur:
             cur.execute(
@@ -67,3 +67,35 @@ class KitRepo(BaseRepo):
             else:
                 samples = [sample_repo._get_sample_by_id(r[1]) for r in rows]
                 return Kit(rows[0][0], samples)
+
+    def count_kits_unused_samples(self, supplied_kit_ids):
+        """Count the unused samples of many kits at once
+
+        Parameters
+        ----------
+        supplied_kit_ids : Iterable of str
+            The kits to count
+
+        Returns
+        -------
+        dict
+            The number of samples get_kit_unused_samples reports for each
+            kit, keyed by supplied kit id. Kits it reports None for are
+            omitted.
+        """
+        supplied_kit_ids = tuple(set(supplied_kit_ids))
+        if len(supplied_kit_ids) == 0:
+            return {}
+
+        with self._transaction.cursor() as cur:
+            cur.execute("SELECT "
+                        "ag_kit.supplied_kit_id, "
+                        "count(*) "
+                        "FROM ag_kit LEFT JOIN ag_kit_barcodes ON "
+                        "ag_kit.ag_kit_id = ag_kit_barcodes.ag_kit_id "
+                        "WHERE "
+                        "ag_kit.supplied_kit_id IN %s AND "
+                        "ag_kit_barcodes.source_id is null "
+                        "GROUP BY ag_kit.supplied_kit_id",
+                        (supplied_kit_ids,))
+            return dict(cur.fetchall())
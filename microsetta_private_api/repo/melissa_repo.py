@@ -1,3 +1,7 @@
+import uuid
+
+from psycopg2.extras import execute_values
+
 from microsetta_private_api.repo.base_repo import BaseRepo
 
 
@@ -45,6 +49,42 @@ class MelissaRepo(BaseRepo):
             else:
                 return record_id
 
+    def create_records(self, addresses):
+        """
+        Create records for many addresses before pinging Melissa
+
+        Parameters
+        ----------
+        addresses - List of (address_1, address_2, address_3, city, state,
+                    postal, country) tuples, as for create_record
+
+        Returns
+        -------
+        record_ids - Unique ID of the record of each address, in order
+        """
+        record_ids = [str(uuid.uuid4()) for _ in addresses]
+        if len(addresses) == 0:
+            return record_ids
+
+        with self._transaction.cursor() as cur:
+            execute_values(cur,
+                           """INSERT INTO campaign.melissa_address_queries (
+                              melissa_address_query_id,
+                              query_timestamp,
+                              source_address_1,
+                              source_address_2,
+                              source_address_3,
+                              source_city,
+                              source_state,
+                              source_postal,
+                              source_country)
+                              VALUES %s""",
+                           [(record_id, ) + tuple(address)
+                            for record_id, address in zip(record_ids,
+                                                          addresses)],
+                           template="(%s, NOW(), %s, %s, %s, %s, %s, %s, %s)")
+        return record_ids
+
     def check_duplicate(self, address_1, address_2, postal, country):
         """
         Check if an address has already been verified to avoid duplicate
@@ -97,6 +137,52 @@ class MelissaRepo(BaseRepo):
             else:
                 return row
 
+    def check_duplicates(self, addresses):
+        """
+        Check many addresses for having already been verified, as
+            check_duplicate does for one
+
+        Parameters
+        ----------
+        addresses - List of (address_1, address_2, postal, country) tuples
+
+        Returns
+        -------
+        dict - Full table row of a duplicate, keyed by the position of each
+            address which is a duplicate
+        """
+        if len(addresses) == 0:
+            return {}
+
+        with self._transaction.dict_cursor() as cur:
+            # IS NOT DISTINCT FROM equates a null address_2 with null, as
+            # check_duplicate does
+            rows = execute_values(
+                cur,
+                """SELECT DISTINCT ON (v.idx) v.idx, q.*
+                   FROM (VALUES %s)
+                       AS v (idx, address_1, address_2, postal, country)
+                   JOIN campaign.melissa_address_queries q
+                       ON q.result_processed = true
+                       AND ((q.source_address_1 = v.address_1
+                             AND q.source_address_2
+                                 IS NOT DISTINCT FROM v.address_2
+                             AND q.source_postal = v.postal
+                             AND q.source_country = v.country)
+                            OR (q.result_address_1 = v.address_1
+                                AND q.result_address_2
+                                    IS NOT DISTINCT FROM v.address_2
+                                AND q.result_postal = v.postal
+                                AND q.result_country = v.country))
+                   ORDER BY v.idx""",
+                [(idx, ) + tuple(address)
+                 for idx, address in enumerate(addresses)],
+                template="(%s::integer, %s::varchar, %s::varchar, "
+                         "%s::varchar, %s::varchar)",
+                page_size=len(addresses),
+                fetch=True)
+            return {row['idx']: row for row in rows}
+
     def update_results(self, record_id, source_url, result_raw,
                        result_codes, result_good, formatted_address,
                        address_1, address_2, address_3, city, state, postal,
@@ -164,3 +250,54 @@ class MelissaRepo(BaseRepo):
                          city, state, postal, country, latitude, longitude,
                          record_id))
             return cur.rowcount == 1
+
+    def update_results_bulk(self, results):
+        """
+        Update many records with the results from the Melissa API
+
+        Parameters
+        ----------
+        results - List of tuples of the parameters of update_results, in
+            the same order
+
+        Returns
+        -------
+        int - The number of rows updated
+        """
+        if len(results) == 0:
+            return 0
+
+        # as in update_results, absent lat/long must be stored as null
+        results = [r[:-2] + (r[-2] or None, r[-1] or None) for r in results]
+
+        with self._transaction.cursor() as cur:
+            execute_values(
+                cur,
+                """UPDATE campaign.melissa_address_queries q SET
+                       result_processed = true,
+                       source_url = v.source_url,
+                       result_raw = v.result_raw,
+                       result_codes = v.result_codes,
+                       result_good = v.result_good,
+                       result_formatted_address = v.formatted_address,
+                       result_address_1 = v.address_1,
+                       result_address_2 = v.address_2,
+                       result_address_3 = v.address_3,
+                       result_city = v.city,
+                       result_state = v.state,
+                       result_postal = v.postal,
+                       result_country = v.country,
+                       result_latitude = v.latitude,
+                       result_longitude = v.longitude
+                   FROM (VALUES %s)
+                       AS v (record_id, source_url, result_raw, result_codes,
+                             result_good, formatted_address, address_1,
+                             address_2, address_3, city, state, postal,
+                             country, latitude, longitude)
+                   WHERE q.melissa_address_query_id = v.record_id""",
+                [tuple(r) for r in results],
+                template="(%s::uuid, %s, %s, %s, %s::boolean, %s, %s, %s, "
+                         "%s, %s, %s, %s, %s, %s::double precision, "
+                         "%s::double precision)",
+                page_size=len(results))
+            return cur.rowcount
@@ -3,11 +3,12 @@ from ._transforms import HUMAN_TRANSFORMS, apply_transforms
 from ..admin_repo import AdminRepo
 from ..survey_template_repo import SurveyTemplateRepo
 from ..transaction import Transaction
+from ...config_manager import SERVER_CONFIG
 from ...exceptions import RepoException
-from ...util import vue_adapter
 
 from werkzeug.exceptions import NotFound
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import re
 import pandas as pd
 import numpy as np
@@ -80,7 +81,8 @@ def drop_private_columns(df):
     return df.drop(columns=to_drop, inplace=False)
 
 
-def retrieve_metadata(sample_barcodes, include_private=False):
+def retrieve_metadata(sample_barcodes, include_private=False,
+                      n_workers=None, read_only=False):
     """Retrieve all sample metadata for the provided barcodes
 
     Parameters
@@ -89,6 +91,13 @@ def retrieve_metadata(sample_barcodes, include_private=False):
         The barcodes to request
     include_private : bool, optional
         If true, retain private columns
+    n_workers : int, optional
+        The number of threads to fan the barcode fetching out over. If not
+        specified, the metadata_pulldown_workers server configuration is
+        used. The value is bounded by the database connection pool size.
+    read_only : bool, optional
+        If true, read the metadata from the read replica when one is
+        available.
 
     Returns
     -------
@@ -105,13 +114,11 @@ def retrieve_metadata(sample_barcodes, include_private=False):
         error_report.append(errors)
 
     fetched = []
+    bulk_md, bulk_errors = _fetch_barcodes_metadata_parallel(
+        sample_barcodes, n_workers, read_only)
     for sample_barcode in set(sample_barcodes):
-        try:
-            bc_md, errors = _fetch_barcode_metadata(sample_barcode)
-        except RepoException as e:
-            errors = e.args[0]
-        except NotFound as e:
-            errors = e.description
+        bc_md = bulk_md.get(sample_barcode)
+        errors = bulk_errors.get(sample_barcode)
 
         if errors is not None:
             error_report.append({sample_barcode: errors})
@@ -198,7 +205,7 @@ def _fetch_survey_template(template_id):
         Any error information associated with the retreival. If an error is
         observed, the survey responses should not be considered valid.
     """
-    with Transaction() as t:
+    with Transaction(read_only=True) as t:
         error = None
 
         survey_template_repo = SurveyTemplateRepo(t)
@@ -207,14 +214,12 @@ def _fetch_survey_template(template_id):
 
         # For local surveys, we generate the json representing the survey
         try:
-            survey_template = survey_template_repo.get_survey_template(
+            survey_template_text = survey_template_repo.get_vue_schema_cached(
                 template_id, "en_US")
         except NotFound as e:
             error = repr(e)
 
         if error is None:
-            survey_template_text = vue_adapter.to_vue_schema(survey_template)
-
             info = info.to_api(None, None, None)
             info['survey_template_text'] = survey_template_text
 
@@ -575,6 +580,89 @@ def _fetch_barcode_metadata(sample_barcode):
     return sample_pulldown, None
 
 
+def _fetch_barcodes_metadata(sample_barcodes, read_only=False):
+    """Obtain per-sample metadata for many barcodes in a single transaction
+
+    Parameters
+    ----------
+    sample_barcodes : Iterable of str
+        The barcodes to request
+    read_only : bool, optional
+        If true, use a read only transaction
+
+    Returns
+    -------
+    dict
+        The survey responses associated with each sample barcode, keyed by
+        barcode
+    dict
+        Any error information associated with the retrieval of a barcode,
+        keyed by barcode. If an error is observed, the barcode is not present
+        in the survey responses.
+    """
+    with Transaction(read_only=read_only) as t:
+        admin_repo = AdminRepo(t)
+        return admin_repo.get_survey_metadata_bulk(sample_barcodes)
+
+
+def _max_pulldown_workers():
+    """The most threads a metadata pulldown may use
+
+    Each worker holds a pooled connection for its chunk of barcodes.
+    Limiting the workers to a quarter of the pool leaves most of it for the
+    web workers.
+    """
+    return max(1, Transaction._POOL.maxconn // 4)
+
+
+def _fetch_barcodes_metadata_parallel(sample_barcodes, n_workers=None,
+                                      read_only=False):
+    """Obtain per-sample metadata, fanning chunks of barcodes out over threads
+
+    Parameters
+    ----------
+    sample_barcodes : Iterable of str
+        The barcodes to request
+    n_workers : int, optional
+        The number of threads to use. If not specified, the
+        metadata_pulldown_workers server configuration is used. The value is
+        bounded by _max_pulldown_workers.
+    read_only : bool, optional
+        If true, use read only transactions
+
+    Returns
+    -------
+    dict
+        The survey responses associated with each sample barcode, keyed by
+        barcode
+    dict
+        Any error information associated with the retrieval of a barcode,
+        keyed by barcode.
+    """
+    if n_workers is None:
+        n_workers = SERVER_CONFIG.get('metadata_pulldown_workers', 1)
+
+    barcodes = sorted(set(sample_barcodes))
+    n_workers = max(1, min(n_workers, _max_pulldown_workers(),
+                           len(barcodes)))
+
+    if n_workers == 1:
+        return _fetch_barcodes_metadata(barcodes, read_only)
+
+    chunks = [barcodes[i::n_workers] for i in range(n_workers)]
+
+    metadata = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        # any exception raised by a worker is re-raised by result()
+        for chunk_md, chunk_errors in executor.map(
+                _fetch_barcodes_metadata, chunks, [read_only] * n_workers):
+            metadata.update(chunk_md)
+            errors.update(chunk_errors)
+
+    return metadata, errors
+
+
 def _build_col_name(col_name, multiselect_answer):
     """For a multiselect response, form a stable metadata variable name
 
@@ -1,4 +1,5 @@
 import unittest
+from unittest.mock import patch
 import pandas as pd
 import pandas.testing as pdt
 import datetime
@@ -11,6 +12,9 @@ from microsetta_private_api.repo.metadata_repo._repo import (
     _build_col_name,
     _find_duplicates,
     _fetch_barcode_metadata,
+    _fetch_barcodes_metadata,
+    _fetch_barcodes_metadata_parallel,
+    _max_pulldown_workers,
     _to_pandas_series,
     _to_pandas_dataframe,
     _fetch_survey_template,
@@ -19,6 +23,7 @@ from microsetta_private_api.repo.metadata_repo._repo import (
     _find_best_answers,
     drop_private_columns)
 from microsetta_private_api.repo.survey_template_repo import SurveyTemplateRepo
+from microsetta_private_api.repo.transaction import Transaction
 from microsetta_private_api.model.account import Account
 from microsetta_private_api.model.address import Address
 
@@ -368,6 +373,37 @@ class MetadataUtilTests(unittest.TestCase):
         with self.assertRaises(RepoException):
             _fetch_barcode_metadata('000004126')
 
+    def test_fetch_barcodes_metadata(self):
+        obs, obs_errors = _fetch_barcodes_metadata(['000001656',
+                                                    'badbarcode',
+                                                    '000004126'])
+
+        self.assertEqual(list(obs), ['000001656'])
+        self.assertEqual(obs['000001656']['sample_barcode'], '000001656')
+        self.assertEqual(set(obs_errors), {'badbarcode', '000004126'})
+
+    def test_fetch_barcodes_metadata_parallel(self):
+        barcodes = ['000001656', '000004216', 'badbarcode', '000004126']
+        exp, exp_errors = _fetch_barcodes_metadata(barcodes)
+        obs, obs_errors = _fetch_barcodes_metadata_parallel(barcodes,
+                                                            n_workers=3)
+
+        self.assertEqual(set(obs), set(exp))
+        self.assertEqual(obs_errors, exp_errors)
+        for barcode in exp:
+            self.assertEqual(obs[barcode]['sample'], exp[barcode]['sample'])
+
+    def test_fetch_barcodes_metadata_parallel_bounded(self):
+        with patch('microsetta_private_api.repo.metadata_repo._repo.'
+                   'ThreadPoolExecutor') as mock_executor:
+            _fetch_barcodes_metadata_parallel(['000001656', '000004216'],
+                                              n_workers=1)
+            mock_executor.assert_not_called()
+
+        self.assertGreaterEqual(_max_pulldown_workers(), 1)
+        self.assertLess(_max_pulldown_workers(),
+                        Transaction._POOL.maxconn)
+
     def test_to_pandas_dataframe(self):
         data = [self.raw_sample_1, self.raw_sample_2]
         templates = {1: self.fake_survey_template2}
@@ -45,17 +45,8 @@ class QiitaRepo(BaseRepo):
                 # ignore for now.
                 cur.execute("""SELECT ag_kit_barcodes.barcode
                                FROM ag.ag_kit_barcodes
-                               INNER JOIN barcodes.barcode_scans USING(barcode)
-                               INNER JOIN (
-                                   SELECT barcode,
-                                      max(scan_timestamp)
-                                          AS scan_timestamp_latest
-                                   FROM barcodes.barcode_scans
-                                   GROUP BY barcode
-                               ) AS latest_scan
-                               ON barcode_scans.barcode = latest_scan.barcode
-                                   AND barcode_scans.scan_timestamp =
-                                       latest_scan.scan_timestamp_latest
+                               INNER JOIN barcodes.latest_barcode_scan
+                                   USING (barcode)
                                WHERE sample_status='sample-is-valid'
                                    AND site_sampled IS NOT NULL
                                    AND site_sampled != 'Please select...'
@@ -88,7 +79,7 @@ class QiitaRepo(BaseRepo):
         if len(to_push) == 0:
             return 0, []
 
-        formatted, error = retrieve_metadata(to_push)
+        formatted, error = retrieve_metadata(to_push, read_only=True)
         if len(formatted) == 0:
             return 0, error
 
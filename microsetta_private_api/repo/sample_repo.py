@@ -23,37 +23,7 @@ class SampleRepo(BaseRepo):
         ag.source.account_id,
         ag.ag_kit_barcodes.latest_sample_information_update
         FROM ag.ag_kit_barcodes
-        LEFT JOIN (
-            SELECT barcode, max(scan_timestamp) AS scan_timestamp
-            FROM barcodes.barcode_scans
-            GROUP BY barcode
-        ) latest_scan
-        ON ag.ag_kit_barcodes.barcode = latest_scan.barcode
-        LEFT JOIN ag.source
-        ON ag.ag_kit_barcodes.source_id = ag.source.id"""
-
-    # the nested query requires a full scan of the barcode_scans
-    # table, which is not necessary if limited to a specific sample.
-    # this query is approximately 200x faster than the above
-    # Note the WHERE in the nested query
-    PARTIAL_SQL_BARCODE_SPECIFIC = """SELECT
-        ag_kit_barcodes.ag_kit_barcode_id,
-        ag.ag_kit_barcodes.sample_date,
-        ag.ag_kit_barcodes.sample_time,
-        ag.ag_kit_barcodes.site_sampled,
-        ag.ag_kit_barcodes.notes,
-        ag.ag_kit_barcodes.barcode,
-        latest_scan.scan_timestamp,
-        ag.source.id,
-        ag.source.account_id,
-        ag.ag_kit_barcodes.latest_sample_information_update
-        FROM ag.ag_kit_barcodes
-        LEFT JOIN (
-            SELECT barcode, max(scan_timestamp) AS scan_timestamp
-            FROM barcodes.barcode_scans
-            WHERE barcode = %s
-            GROUP BY barcode
-        ) latest_scan
+        LEFT JOIN barcodes.latest_barcode_scan latest_scan
         ON ag.ag_kit_barcodes.barcode = latest_scan.barcode
         LEFT JOIN ag.source
         ON ag.ag_kit_barcodes.source_id = ag.source.id"""
@@ -204,33 +174,92 @@ class SampleRepo(BaseRepo):
             self._update_sample_association(sample_id, source_id_dst,
                                             override_locked=True)
 
-    def _get_sample_barcode_from_id(self, sample_id):
-        """Obtain a barcode from a ag.ag_kit_barcode_id"""
-        sql = """SELECT barcode
-                 FROM ag.ag_kit_barcodes
-                 WHERE ag_kit_barcode_id = %s"""
-        with self._transaction.cursor() as cur:
-            cur.execute(sql, (sample_id,))
-            sample_row = cur.fetchone()
-            if sample_row is None:
-                return None
-            else:
-                return sample_row[0]
-
     def _get_sample_by_id(self, sample_id):
         """ Do not use from api layer, you must validate account and source."""
 
         sql = "{0}{1}".format(
-            self.PARTIAL_SQL_BARCODE_SPECIFIC,
+            self.PARTIAL_SQL,
             " WHERE"
             " ag_kit_barcodes.ag_kit_barcode_id = %s")
 
         with self._transaction.cursor() as cur:
-            barcode = self._get_sample_barcode_from_id(sample_id)
-            cur.execute(sql, (barcode, sample_id,))
+            cur.execute(sql, (sample_id,))
             sample_row = cur.fetchone()
             return self._create_sample_obj(sample_row)
 
+    def _get_samples_by_ids(self, sample_ids):
+        """ Do not use from api layer, you must validate account and source.
+
+        Set-based variant of _get_sample_by_id. Projects and latest scan
+        statuses are resolved for all samples at once rather than per sample.
+
+        Parameters
+        ----------
+        sample_ids : Iterable of str
+            The ag.ag_kit_barcodes.ag_kit_barcode_id values to fetch
+
+        Returns
+        -------
+        dict
+            Sample objects keyed by sample id. Unknown ids are omitted.
+        """
+        sample_ids = tuple(set(sample_ids))
+        if len(sample_ids) == 0:
+            return {}
+
+        sql = "{0}{1}".format(
+            self.PARTIAL_SQL,
+            " WHERE"
+            " ag_kit_barcodes.ag_kit_barcode_id IN %s")
+
+        with self._transaction.cursor() as cur:
+            cur.execute(sql, (sample_ids,))
+            sample_rows = cur.fetchall()
+
+            barcodes = tuple(r[5] for r in sample_rows)
+            if len(barcodes) == 0:
+                return {}
+
+            # mirrors _retrieve_projects, including the None entry
+            # reported for a barcode without any project
+            cur.execute("SELECT barcodes.barcode.barcode, "
+                        "barcodes.project.project FROM "
+                        "barcodes.barcode "
+                        "LEFT JOIN "
+                        "barcodes.project_barcode "
+                        "ON "
+                        "barcodes.barcode.barcode = "
+                        "barcodes.project_barcode.barcode "
+                        "LEFT JOIN barcodes.project "
+                        "ON "
+                        "barcodes.project_barcode.project_id = "
+                        "barcodes.project.project_id "
+                        "WHERE "
+                        "barcodes.barcode.barcode IN %s",
+                        (barcodes,))
+            projects = {}
+            for barcode, project in cur.fetchall():
+                projects.setdefault(barcode, []).append(project)
+
+            # mirrors get_sample_status for the latest scan of each barcode
+            scanned = tuple(r[5] for r in sample_rows if r[6] is not None)
+            statuses = {}
+            if len(scanned) > 0:
+                cur.execute("SELECT barcode, sample_status "
+                            "FROM barcodes.latest_barcode_scan "
+                            "WHERE barcode IN %s",
+                            (scanned,))
+                statuses = {r[0]: r[1] for r in cur.fetchall()}
+
+        samples = {}
+        for sample_row in sample_rows:
+            barcode = sample_row[5]
+            samples[sample_row[0]] = Sample.from_db(
+                *sample_row,
+                projects.get(barcode, []),
+                statuses.get(barcode))
+        return samples
+
     def get_samples_by_source(self, account_id, source_id,
                               allow_revoked=False):
         sql = "{0}{1}".format(
@@ -261,17 +290,65 @@ class SampleRepo(BaseRepo):
                 samples.append(sample)
             return samples
 
+    def get_sample_statuses_by_accounts(self, account_ids):
+        """Obtain the projects and status of the samples of many accounts
+
+        Covers the samples get_samples_by_source returns for each active
+        source of the accounts, with their projects as from
+        _retrieve_projects and their status as from get_sample_status.
+
+        Parameters
+        ----------
+        account_ids : Iterable of str
+            The accounts to look up
+
+        Returns
+        -------
+        dict
+            A list of (projects, sample_status) for the samples of each
+            account, keyed by account id. Accounts without samples are
+            omitted.
+        """
+        account_ids = tuple(set(account_ids))
+        if len(account_ids) == 0:
+            return {}
+
+        with self._transaction.cursor() as cur:
+            cur.execute("SELECT "
+                        "source.account_id, "
+                        "ARRAY(SELECT project.project "
+                        "      FROM barcodes.project_barcode "
+                        "      INNER JOIN barcodes.project "
+                        "      USING (project_id) "
+                        "      WHERE project_barcode.barcode = "
+                        "          ag_kit_barcodes.barcode), "
+                        "latest_scan.sample_status "
+                        "FROM ag.ag_kit_barcodes "
+                        "INNER JOIN ag.source "
+                        "ON ag_kit_barcodes.source_id = source.id "
+                        "LEFT JOIN barcodes.latest_barcode_scan latest_scan "
+                        "ON ag_kit_barcodes.barcode = latest_scan.barcode "
+                        "WHERE "
+                        "source.account_id IN %s "
+                        "AND source.date_revoked IS NULL",
+                        (account_ids,))
+
+            statuses = {}
+            for account_id, projects, sample_status in cur.fetchall():
+                statuses.setdefault(account_id, []).append(
+                    (projects, sample_status))
+            return statuses
+
     def get_sample(self, account_id, source_id, sample_id):
         sql = "{0}{1}".format(
-            self.PARTIAL_SQL_BARCODE_SPECIFIC,
+            self.PARTIAL_SQL,
             " WHERE"
             " source.account_id = %s"
             " AND source.id = %s"
             " AND ag_kit_barcodes.ag_kit_barcode_id = %s ")
 
         with self._transaction.cursor() as cur:
-            barcode = self._get_sample_barcode_from_id(sample_id)
-            cur.execute(sql, (barcode, account_id, source_id, sample_id))
+            cur.execute(sql, (account_id, source_id, sample_id))
             sample_row = cur.fetchone()
             return self._create_sample_obj(sample_row)
 
@@ -0,0 +1,142 @@
+import secrets
+
+import psycopg2
+
+from microsetta_private_api.repo.base_repo import BaseRepo
+
+
+# the number of bytes of a summary stored per row
+CHUNK_SIZE = 1024 * 1024
+
+
+class SummaryExportRepo(BaseRepo):
+    def __init__(self, transaction):
+        super().__init__(transaction)
+
+    def create_export(self, project_id, filename, filepath, ttl,
+                      chunk_size=CHUNK_SIZE):
+        """Store a project summary for download by token
+
+        The summary is read and stored chunk_size bytes at a time.
+
+        Parameters
+        ----------
+        project_id : int
+            The project summarized
+        filename : str
+            The name to download the summary as
+        filepath : str
+            The path of the summary file to store
+        ttl : int
+            The number of seconds the summary can be downloaded for
+        chunk_size : int, optional
+            The number of bytes to store per chunk
+
+        Returns
+        -------
+        str
+            The token with which to download the summary
+        """
+        token = secrets.token_urlsafe(32)
+
+        with self._transaction.cursor() as cur:
+            cur.execute("INSERT INTO barcodes.project_summary_export "
+                        "(token, project_id, filename, "
+                        "expiration_timestamp) "
+                        "VALUES (%s, %s, %s, "
+                        "        CURRENT_TIMESTAMP + "
+                        "        %s * INTERVAL '1 second')",
+                        (token, project_id, filename, ttl))
+
+            with open(filepath, 'rb') as f:
+                for index, chunk in enumerate(
+                        iter(lambda: f.read(chunk_size), b'')):
+                    cur.execute("INSERT INTO "
+                                "barcodes.project_summary_export_chunk "
+                                "(token, chunk_index, content) "
+                                "VALUES (%s, %s, %s)",
+                                (token, index, psycopg2.Binary(chunk)))
+        return token
+
+    def claim_export(self, token):
+        """Claim a stored project summary for its one download
+
+        A summary can only be claimed once, and only before it expires.
+
+        Parameters
+        ----------
+        token : str
+            The token of the summary
+
+        Returns
+        -------
+        (str, int) or None
+            The filename and number of chunks of the summary, or None if
+            there is no such summary, or it has expired or been claimed
+        """
+        with self._transaction.cursor() as cur:
+            cur.execute("UPDATE barcodes.project_summary_export e "
+                        "SET claimed_timestamp = CURRENT_TIMESTAMP "
+                        "WHERE token = %s "
+                        "    AND claimed_timestamp IS NULL "
+                        "    AND expiration_timestamp > CURRENT_TIMESTAMP "
+                        "RETURNING filename, "
+                        "    (SELECT COUNT(*) "
+                        "     FROM barcodes.project_summary_export_chunk "
+                        "     WHERE token = e.token)",
+                        (token, ))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            return row[0], row[1]
+
+    def get_export_chunk(self, token, chunk_index):
+        """Obtain one chunk of a stored project summary
+
+        Parameters
+        ----------
+        token : str
+            The token of the summary
+        chunk_index : int
+            The position of the chunk in the summary, from 0
+
+        Returns
+        -------
+        bytes or None
+            The content of the chunk, or None if there is no such chunk
+        """
+        with self._transaction.cursor() as cur:
+            cur.execute("SELECT content "
+                        "FROM barcodes.project_summary_export_chunk "
+                        "WHERE token = %s AND chunk_index = %s",
+                        (token, chunk_index))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            return row[0].tobytes()
+
+    def delete_export(self, token):
+        """Remove a project summary
+
+        Parameters
+        ----------
+        token : str
+            The token of the summary
+        """
+        with self._transaction.cursor() as cur:
+            cur.execute("DELETE FROM barcodes.project_summary_export "
+                        "WHERE token = %s",
+                        (token, ))
+
+    def delete_expired_exports(self):
+        """Remove the project summaries which have expired
+
+        Returns
+        -------
+        int
+            The number of summaries removed
+        """
+        with self._transaction.cursor() as cur:
+            cur.execute("DELETE FROM barcodes.project_summary_export "
+                        "WHERE expiration_timestamp <= CURRENT_TIMESTAMP")
+            return cur.rowcount
@@ -1,8 +1,8 @@
 import psycopg2
+import psycopg2.extras
 import werkzeug
 from werkzeug.exceptions import BadRequest
 
-from microsetta_private_api import localization
 from microsetta_private_api.exceptions import RepoException
 from microsetta_private_api.repo.base_repo import BaseRepo
 from microsetta_private_api.repo.sample_repo import SampleRepo
@@ -109,14 +109,14 @@ class SurveyAnswersRepo(BaseRepo):
                                              survey_id):
             return None
 
-        localization_info = localization.LANG_SUPPORT[language_tag]
-        lang_name = localization_info[localization.LANG_NAME_KEY]
+        index = SurveyTemplateRepo(self._transaction).\
+            get_response_localization_index()
 
         with self._transaction.cursor() as cur:
             # Grab selection and multi selection responses
             cur.execute("SELECT "
                         "survey_answers.survey_question_id, "
-                        + lang_name + ", "
+                        "response, "
                         "survey_response_type "
                         "FROM "
                         "survey_answers "
@@ -125,10 +125,6 @@ class SurveyAnswersRepo(BaseRepo):
                         "ON "
                         "survey_answers.survey_question_id = "
                         "survey_question_response_type.survey_question_id "
-                        "LEFT JOIN "
-                        "survey_response "
-                        "ON "
-                        "survey_answers.response = survey_response.american "
                         "WHERE "
                         "survey_id = %s",
                         (survey_id,))
@@ -136,12 +132,13 @@ class SurveyAnswersRepo(BaseRepo):
 
             for r in rows:
                 str_id = str(r[0])
+                localized = index.localize(r[1], language_tag)
                 if r[2] == "SINGLE":
-                    model[str_id] = r[1]
+                    model[str_id] = localized
                 elif r[2] == "MULTIPLE":
                     if str_id not in model:
                         model[str_id] = []
-                    model[str_id].append(r[1])
+                    model[str_id].append(localized)
 
             # Grab free form responses
             cur.execute("SELECT "
@@ -157,6 +154,74 @@ class SurveyAnswersRepo(BaseRepo):
 
         return model
 
+    def get_answered_surveys_bulk(self, survey_ids, language_tag):
+        """Set-based variant of get_answered_survey
+
+        Do not use from api layer, ownership of the surveys is NOT verified
+        and must be established by the caller.
+
+        Parameters
+        ----------
+        survey_ids : Iterable of str
+            The survey answer IDs to fetch
+        language_tag : str
+            The language to express selection responses in
+
+        Returns
+        -------
+        dict
+            The answer models, as returned by get_answered_survey, keyed by
+            survey ID. Every requested survey ID is present.
+        """
+        survey_ids = tuple(set(survey_ids))
+        models = {survey_id: {} for survey_id in survey_ids}
+        if len(survey_ids) == 0:
+            return models
+
+        index = SurveyTemplateRepo(self._transaction).\
+            get_response_localization_index()
+
+        with self._transaction.cursor() as cur:
+            # Grab selection and multi selection responses
+            cur.execute("SELECT "
+                        "survey_answers.survey_id, "
+                        "survey_answers.survey_question_id, "
+                        "response, "
+                        "survey_response_type "
+                        "FROM "
+                        "survey_answers "
+                        "LEFT JOIN "
+                        "survey_question_response_type "
+                        "ON "
+                        "survey_answers.survey_question_id = "
+                        "survey_question_response_type.survey_question_id "
+                        "WHERE "
+                        "survey_id IN %s",
+                        (survey_ids,))
+            for r in cur.fetchall():
+                model = models[r[0]]
+                str_id = str(r[1])
+                localized = index.localize(r[2], language_tag)
+                if r[3] == "SINGLE":
+                    model[str_id] = localized
+                elif r[3] == "MULTIPLE":
+                    if str_id not in model:
+                        model[str_id] = []
+                    model[str_id].append(localized)
+
+            # Grab free form responses
+            cur.execute("SELECT "
+                        "survey_id, survey_question_id, response "
+                        "FROM "
+                        "survey_answers_other "
+                        "WHERE "
+                        "survey_id IN %s",
+                        (survey_ids,))
+            for r in cur.fetchall():
+                models[r[0]][str(r[1])] = r[2]
+
+        return models
+
     def submit_answered_survey(self, ag_login_id, source_id,
                                language_tag, survey_template_id, survey_model,
                                survey_answers_id=None):
@@ -178,7 +243,7 @@ class SurveyAnswersRepo(BaseRepo):
             survey_answers_id = str(uuid.uuid4())
 
         survey_template_repo = SurveyTemplateRepo(self._transaction)
-        survey_template = survey_template_repo.get_survey_template(
+        survey_template = survey_template_repo.get_survey_template_cached(
             survey_template_id, language_tag)
 
         with self._transaction.cursor() as cur:
@@ -188,7 +253,10 @@ class SurveyAnswersRepo(BaseRepo):
                         "%s)", (ag_login_id, survey_answers_id, source_id,
                                 survey_template_id))
 
-            # Write each answer
+            # Collect each answer, alongside the error to report should the
+            # answer be rejected, so they can be written in bulk
+            answer_rows = []
+            other_rows = []
             for survey_template_group in survey_template.groups:
                 for survey_question in survey_template_group.questions:
                     survey_question_id = survey_question.id
@@ -216,48 +284,38 @@ class SurveyAnswersRepo(BaseRepo):
                         normalized_answer = self._unlocalize(answer,
                                                              survey_question_id,  # noqa
                                                              language_tag)
-
-                        try:
-                            cur.execute("INSERT INTO survey_answers "
-                                        "(survey_id, "
-                                        "survey_question_id, "
-                                        "response) "
-                                        "VALUES(%s, %s, %s)",
-                                        (survey_answers_id,
-                                         survey_question_id,
-                                         normalized_answer))
-                        except psycopg2.errors.ForeignKeyViolation:
-                            raise BadRequest(
-                                "Invalid single survey response: %s" % answer)
+                        answer_rows.append(
+                            ((survey_answers_id,
+                              survey_question_id,
+                              normalized_answer),
+                             "Invalid single survey response: %s" % answer))
 
                     if q_type == "MULTIPLE":
                         for ans in answer:
                             normalized_answer = self._unlocalize(ans,
                                                                  survey_question_id,  # noqa
                                                                  language_tag)
-                            try:
-                                cur.execute("INSERT INTO survey_answers "
-                                            "(survey_id, "
-                                            "survey_question_id, "
-                                            "response) "
-                                            "VALUES(%s, %s, %s)",
-                                            (survey_answers_id,
-                                             survey_question_id,
-                                             normalized_answer))
-                            except psycopg2.errors.ForeignKeyViolation:
-                                raise BadRequest(
-                                    "Invalid multiple survey response: %s" % ans)  # noqa
+                            answer_rows.append(
+                                ((survey_answers_id,
+                                  survey_question_id,
+                                  normalized_answer),
+                                 "Invalid multiple survey response: %s" % ans))  # noqa
 
                     if q_type == "STRING" or q_type == "TEXT":
                         # Note:  Can't convert language on free text...
-                        cur.execute("INSERT INTO survey_answers_other "
-                                    "(survey_id, "
-                                    "survey_question_id, "
-                                    "response) "
-                                    "VALUES(%s, %s, %s)",
-                                    (survey_answers_id,
-                                     survey_question_id,
-                                     answer))
+                        other_rows.append((survey_answers_id,
+                                           survey_question_id,
+                                           answer))
+
+            self._insert_survey_answers(cur, answer_rows)
+
+            if len(other_rows) > 0:
+                psycopg2.extras.execute_values(
+                    cur,
+                    "INSERT INTO survey_answers_other "
+                    "(survey_id, survey_question_id, response) "
+                    "VALUES %s",
+                    other_rows, template=None, page_size=len(other_rows))
 
         if len(survey_model) == 0:
             # we should not have gotten to the end without recording at least
@@ -273,6 +331,46 @@ class SurveyAnswersRepo(BaseRepo):
 
         return survey_answers_id
 
+    @staticmethod
+    def _insert_survey_answers(cur, answer_rows):
+        """Write selection answers with a single statement
+
+        Parameters
+        ----------
+        cur : psycopg2.extensions.cursor
+            The cursor to write with
+        answer_rows : list of ((str, int, str), str)
+            The (survey_id, survey_question_id, response) rows to insert,
+            each paired with the message to report if the row is rejected
+
+        Raises
+        ------
+        BadRequest
+            If a row violates a foreign key, reporting the first such row
+        """
+        if len(answer_rows) == 0:
+            return
+
+        insert_sql = "INSERT INTO survey_answers " \
+                     "(survey_id, survey_question_id, response) " \
+                     "VALUES %s"
+
+        cur.execute("SAVEPOINT insert_survey_answers")
+        try:
+            psycopg2.extras.execute_values(
+                cur, insert_sql, [row for row, _ in answer_rows],
+                template=None, page_size=len(answer_rows))
+        except psycopg2.errors.ForeignKeyViolation:
+            # The batch does not tell us which row was rejected, so retry
+            # the rows individually to find the offending answer
+            cur.execute("ROLLBACK TO SAVEPOINT insert_survey_answers")
+            for row, message in answer_rows:
+                try:
+                    cur.execute(insert_sql, (row, ))
+                except psycopg2.errors.ForeignKeyViolation:
+                    raise BadRequest(message)
+        cur.execute("RELEASE SAVEPOINT insert_survey_answers")
+
     def delete_answered_survey(self, acct_id, survey_id):
         if not self._acct_owns_survey(acct_id, survey_id):
             return False
@@ -450,23 +548,15 @@ class SurveyAnswersRepo(BaseRepo):
             return cur.fetchone() is not None
 
     def _unlocalize(self, answer, survey_question_id, language_tag):
-        localization_info = localization.LANG_SUPPORT[language_tag]
-        lang_name = localization_info[localization.LANG_NAME_KEY]
-
-        with self._transaction.cursor() as cur:
-            # Normalize localized answer
-            cur.execute("""SELECT american
-                           FROM survey_response
-                             JOIN survey_question_response
-                             ON response=american
-                           WHERE survey_question_id=%s
-                             AND """ + lang_name + "=%s",
-                        (survey_question_id, answer))
-            row = cur.fetchone()
-            if row is None:
-                raise BadRequest("Invalid unlocalization: %s" % answer)
-            normalized_answer = row[0]
-            return normalized_answer
+        index = SurveyTemplateRepo(self._transaction).\
+            get_response_localization_index()
+
+        # Normalize localized answer
+        normalized_answer = index.unlocalize(answer, survey_question_id,
+                                             language_tag)
+        if normalized_answer is None:
+            raise BadRequest("Invalid unlocalization: %s" % answer)
+        return normalized_answer
 
     def _get_survey_sample_associations(self, answered_survey_id):
         """ Do not use from api layer, you must validate account and source."""
@@ -11,12 +11,130 @@ from microsetta_private_api.model.survey_template_question import \
         SurveyTemplateQuestion
 from microsetta_private_api.model.survey_template_trigger import \
         SurveyTemplateTrigger
+from microsetta_private_api.util import vue_adapter
+from collections import OrderedDict
 import copy
 import secrets
+import threading
+import time
 from microsetta_private_api.exceptions import RepoException
 from microsetta_private_api.repo.vioscreen_repo import VioscreenRepo
 
 
+class _SurveyTemplateCache:
+    """A process-wide LRU of survey templates and their Vue schemas
+
+    Survey templates only change through database patches. The applied patch
+    level is checked at most every PATCH_CHECK_INTERVAL seconds, and the
+    cache is emptied when it changes. The cache can also be emptied
+    explicitly with clear().
+
+    Cached objects must not be handed to callers, as callers are free to
+    modify what they receive.
+    """
+    PATCH_CHECK_INTERVAL = 60
+    MAX_SIZE = 128
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._patch = None
+        self._patch_checked = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._patch = None
+            self._patch_checked = None
+
+    def _check_patch(self, transaction):
+        now = time.monotonic()
+        with self._lock:
+            if self._patch_checked is not None and \
+                    now - self._patch_checked < self.PATCH_CHECK_INTERVAL:
+                return
+
+        with transaction.cursor() as cur:
+            cur.execute("SELECT current_patch FROM ag.settings")
+            patch = cur.fetchone()[0]
+
+        with self._lock:
+            if patch != self._patch:
+                self._entries.clear()
+                self._generation += 1
+                self._patch = patch
+            self._patch_checked = now
+
+    def get(self, transaction, key, build):
+        """Obtain the entry for key, constructing it with build if needed"""
+        self._check_patch(transaction)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            generation = self._generation
+
+        entry = build()
+
+        with self._lock:
+            # do not retain an entry built prior to an invalidation
+            if generation == self._generation:
+                self._entries[key] = entry
+                while len(self._entries) > self.MAX_SIZE:
+                    self._entries.popitem(last=False)
+        return entry
+
+
+_TEMPLATE_CACHE = _SurveyTemplateCache()
+
+
+class ResponseLocalizationIndex:
+    """A bidirectional index of survey responses and their localizations
+
+    Selection responses are stored in their "american" form, which is what
+    the survey_answers table references. Localized text is only unique within
+    a question, e.g., "Bajo" corresponds to "Fair" for one question and to
+    "Low" for another, so unlocalization is keyed by question.
+
+    Parameters
+    ----------
+    question_responses : Iterable of tuple
+        (survey_question_id, american, {lang_name: localized}) for every
+        valid response of every question
+    responses : Iterable of tuple
+        (american, {lang_name: localized}) for every survey response
+    """
+    def __init__(self, question_responses, responses):
+        self._unlocalized = {}
+        for question_id, american, localized in question_responses:
+            for lang_name, text in localized.items():
+                if text is None:
+                    continue
+                self._unlocalized.setdefault(
+                    (question_id, lang_name, text), american)
+
+        self._localized = {}
+        for american, localized in responses:
+            for lang_name, text in localized.items():
+                self._localized.setdefault(lang_name, {})[american] = text
+
+    def unlocalize(self, localized, survey_question_id, language_tag):
+        """Obtain the american response for localized text, or None"""
+        lang_name = localization.LANG_SUPPORT[language_tag][
+            localization.LANG_NAME_KEY]
+        return self._unlocalized.get((survey_question_id, lang_name,
+                                      localized))
+
+    def localize(self, american, language_tag):
+        """Obtain the localized text of an american response, or None"""
+        lang_name = localization.LANG_SUPPORT[language_tag][
+            localization.LANG_NAME_KEY]
+        return self._localized.get(lang_name, {}).get(american)
+
+
 class SurveyTemplateRepo(BaseRepo):
 
     VIOSCREEN_ID = 10001
@@ -255,62 +373,161 @@ class SurveyTemplateRepo(BaseRepo):
 
             rows = cur.fetchall()
 
-            all_groups = []
-            cur_group_id = None
-            cur_questions = None
-
-            for r in rows:
-                group_id = r[0]
-                question_id = r[1]
-                localized_text = r[2]
-                short_name = r[3]
-                response_type = r[4]
-                css_classes = r[5]
-
-                if group_id != cur_group_id:
-                    if cur_group_id is not None:
-                        group_localized_text = self._get_group_localized_text(
-                                                                cur_group_id,
-                                                                language_tag)
-                        all_groups.append(SurveyTemplateGroup(
-                            group_localized_text,
-                            cur_questions))
-                    cur_group_id = group_id
-                    cur_questions = []
-
-                responses = self._get_question_valid_responses(question_id,
-                                                               language_tag)
-
-                triggers = self._get_question_triggers(question_id,
+        # Resolve group text, valid responses and triggers for the whole
+        # template at once rather than per group and per question
+        question_ids = {r[1] for r in rows}
+        group_text = self._get_groups_localized_text({r[0] for r in rows},
+                                                     language_tag)
+        valid_responses = self._get_questions_valid_responses(question_ids,
+                                                              language_tag)
+        question_triggers = self._get_questions_triggers(question_ids,
+                                                         language_tag)
+
+        all_groups = []
+        cur_group_id = None
+        cur_questions = None
+
+        for r in rows:
+            group_id = r[0]
+            question_id = r[1]
+            localized_text = r[2]
+            short_name = r[3]
+            response_type = r[4]
+            css_classes = r[5]
+
+            if group_id != cur_group_id:
+                if cur_group_id is not None:
+                    all_groups.append(SurveyTemplateGroup(
+                        group_text.get(cur_group_id),
+                        cur_questions))
+                cur_group_id = group_id
+                cur_questions = []
+
+            responses = list(valid_responses.get(question_id, []))
+            triggers = list(question_triggers.get(question_id, []))
+
+            # Quick fix to correctly sort country names in Spanish
+            if (language_tag == localization.ES_MX or language_tag ==
+                localization.ES_ES) and (question_id == 110 or
+                                         question_id == 148):
+                responses[1:len(responses)] = \
+                    sorted(responses[1:len(responses)])
+
+            question = SurveyTemplateQuestion(question_id,
+                                              localized_text,
+                                              short_name,
+                                              response_type,
+                                              responses,
+                                              triggers,
+                                              css_classes)
+            cur_questions.append(question)
+
+        if cur_group_id is not None:
+            all_groups.append(SurveyTemplateGroup(
+                group_text.get(cur_group_id),
+                cur_questions))
+
+        return SurveyTemplate(survey_template_id, language_tag, all_groups)
+
+    def _get_cached_template(self, survey_template_id, language_tag):
+        def build():
+            survey_template = self.get_survey_template(survey_template_id,
+                                                       language_tag)
+            return (survey_template,
+                    vue_adapter.to_vue_schema(survey_template))
+
+        return _TEMPLATE_CACHE.get(self._transaction,
+                                   (survey_template_id, language_tag),
+                                   build)
+
+    def get_survey_template_cached(self, survey_template_id, language_tag):
+        """Obtain a survey template through the process-wide cache
+
+        Parameters
+        ----------
+        survey_template_id : int
+            The survey template to obtain
+        language_tag : str
+            The language to localize the template to
+
+        Raises
+        ------
+        NotFound
+            If the survey or the localization does not exist
+
+        Returns
+        -------
+        SurveyTemplate
+            A copy of the template which the caller may modify
+        """
+        survey_template, _ = self._get_cached_template(survey_template_id,
                                                        language_tag)
+        return copy.deepcopy(survey_template)
 
-                # Quick fix to correctly sort country names in Spanish
-                if (language_tag == localization.ES_MX or language_tag ==
-                    localization.ES_ES) and (question_id == 110 or
-                                             question_id == 148):
-                    responses[1:len(responses)] = \
-                        sorted(responses[1:len(responses)])
-
-                question = SurveyTemplateQuestion(question_id,
-                                                  localized_text,
-                                                  short_name,
-                                                  response_type,
-                                                  responses,
-                                                  triggers,
-                                                  css_classes)
-                cur_questions.append(question)
-
-            if cur_group_id is not None:
-                group_localized_text = self._get_group_localized_text(
-                    cur_group_id,
-                    language_tag)
-                all_groups.append(SurveyTemplateGroup(
-                    group_localized_text,
-                    cur_questions))
-
-            return SurveyTemplate(survey_template_id, language_tag, all_groups)
-
-    def _get_group_localized_text(self, group_id, language_tag):
+    def get_vue_schema_cached(self, survey_template_id, language_tag):
+        """Obtain the Vue schema of a survey template through the cache
+
+        Parameters
+        ----------
+        survey_template_id : int
+            The survey template to obtain
+        language_tag : str
+            The language to localize the template to
+
+        Raises
+        ------
+        NotFound
+            If the survey or the localization does not exist
+
+        Returns
+        -------
+        VueSchema
+            A copy of the schema which the caller may modify
+        """
+        _, vue_schema = self._get_cached_template(survey_template_id,
+                                                  language_tag)
+        return copy.deepcopy(vue_schema)
+
+    def get_response_localization_index(self):
+        """Obtain the process-wide ResponseLocalizationIndex
+
+        The index shares the lifetime of the survey template cache, and is
+        rebuilt when the database patch level changes or the cache is
+        cleared.
+        """
+        lang_names = [v[localization.LANG_NAME_KEY]
+                      for v in localization.LANG_SUPPORT.values()]
+
+        def build():
+            with self._transaction.cursor() as cur:
+                cur.execute("SELECT survey_question_id, american, " +
+                            ", ".join(lang_names) + " "
+                            "FROM survey_question_response "
+                            "JOIN survey_response "
+                            "ON response = american")
+                question_responses = [
+                    (r[0], r[1], dict(zip(lang_names, r[2:])))
+                    for r in cur.fetchall()]
+
+                cur.execute("SELECT american, " +
+                            ", ".join(lang_names) + " "
+                            "FROM survey_response")
+                responses = [(r[0], dict(zip(lang_names, r[1:])))
+                             for r in cur.fetchall()]
+
+            return ResponseLocalizationIndex(question_responses, responses)
+
+        return _TEMPLATE_CACHE.get(self._transaction,
+                                   ('response_localization_index', ),
+                                   build)
+
+    @staticmethod
+    def clear_survey_template_cache():
+        """Empty the survey template cache of this process"""
+        _TEMPLATE_CACHE.clear()
+
+    def _get_groups_localized_text(self, group_ids, language_tag):
+        """Obtain the localized text of each group, keyed by group ID"""
         tag_to_col = {
             localization.EN_US: "american",
             localization.EN_GB: "british",
@@ -322,18 +539,21 @@ class SurveyTemplateRepo(BaseRepo):
         if language_tag not in tag_to_col:
             raise RepoException(f"{language_tag} is not supported.")
 
+        group_ids = tuple(group_ids)
+        if len(group_ids) == 0:
+            return {}
+
         with self._transaction.cursor() as cur:
-            cur.execute("SELECT " +
+            cur.execute("SELECT group_order, " +
                         tag_to_col[language_tag] + " " +
                         "FROM survey_group "
                         "WHERE "
-                        "group_order = %s", (group_id,))
-            row = cur.fetchone()
-            if row is None:
-                return None
-            return row[0]
+                        "group_order IN %s", (group_ids,))
+            return {r[0]: r[1] for r in cur.fetchall()}
 
-    def _get_question_valid_responses(self, survey_question_id, language_tag):
+    def _get_questions_valid_responses(self, survey_question_ids,
+                                       language_tag):
+        """Obtain the ordered valid responses, keyed by question ID"""
         tag_to_col = {
             localization.EN_US: "survey_response.american",
             localization.EN_GB: "survey_response.british",
@@ -345,8 +565,13 @@ class SurveyTemplateRepo(BaseRepo):
         if language_tag not in tag_to_col:
             raise RepoException(f"{language_tag} is not supported.")
 
+        survey_question_ids = tuple(survey_question_ids)
+        if len(survey_question_ids) == 0:
+            return {}
+
         with self._transaction.cursor() as cur:
-            cur.execute("SELECT " +
+            cur.execute("SELECT "
+                        "survey_question_id, " +
                         tag_to_col[language_tag] + " "
                         "FROM "
                         "survey_question_response "
@@ -356,12 +581,18 @@ class SurveyTemplateRepo(BaseRepo):
                         "survey_question_response.response = "
                         "survey_response.american "
                         "WHERE "
-                        "survey_question_id = %s "
+                        "survey_question_id IN %s "
                         "ORDER BY "
-                        "display_index", (survey_question_id,))
-            return [x[0] for x in cur.fetchall()]
+                        "survey_question_id, display_index",
+                        (survey_question_ids,))
+
+            responses = {}
+            for question_id, response in cur.fetchall():
+                responses.setdefault(question_id, []).append(response)
+            return responses
 
-    def _get_question_triggers(self, survey_question_id, language_tag):
+    def _get_questions_triggers(self, survey_question_ids, language_tag):
+        """Obtain the triggers of each question, keyed by question ID"""
         tag_to_col = {
             localization.EN_US: "survey_response.american",
             localization.EN_GB: "survey_response.british",
@@ -373,19 +604,27 @@ class SurveyTemplateRepo(BaseRepo):
         if language_tag not in tag_to_col:
             raise RepoException(f"{language_tag} is not supported.")
 
+        survey_question_ids = tuple(survey_question_ids)
+        if len(survey_question_ids) == 0:
+            return {}
+
         with self._transaction.cursor() as cur:
             cur.execute(
-                "SELECT " + tag_to_col[language_tag] + ", "
+                "SELECT sqt.survey_question_id, " +
+                tag_to_col[language_tag] + ", "
                 "sqt.triggered_question "
                 "FROM survey_response "
                 "INNER JOIN survey_question_triggers sqt "
                 "ON sqt.triggering_response = survey_response.american "
-                "WHERE sqt.survey_question_id = %s ",
-                (survey_question_id, )
+                "WHERE sqt.survey_question_id IN %s ",
+                (survey_question_ids, )
             )
 
-            rows = cur.fetchall()
-            return [SurveyTemplateTrigger(x[0], x[1]) for x in rows]
+            triggers = {}
+            for question_id, response, triggered in cur.fetchall():
+                triggers.setdefault(question_id, []).append(
+                    SurveyTemplateTrigger(response, triggered))
+            return triggers
 
     def create_myfoodrepo_entry(self, account_id, source_id):
         """Create a MyFoodRepo entry if a slot is available
@@ -139,6 +139,23 @@ class GoogleGeocodingRepoTests(unittest.TestCase):
 
             self.assertEqual(obs, 1)
 
+    def test_get_responses(self):
+        with Transaction() as t:
+            gg_repo = GoogleGeocodingRepo(t)
+            request_address = _construct_request_address(UCSD_ADDRESS)
+            _, request_id, _ = gg_repo.get_or_create_record(request_address)
+
+            # not yet geocoded
+            self.assertEqual(gg_repo.get_responses([request_address]), {})
+
+            gg_repo.update_record(request_id,
+                                  json.dumps(UCSD_GEOCODING_RESULTS))
+            obs = gg_repo.get_responses([request_address,
+                                         'not a known address'])
+            self.assertEqual(obs,
+                             {request_address: UCSD_GEOCODING_RESULTS})
+            self.assertEqual(gg_repo.get_responses([]), {})
+
     def _is_uuid(self, value_to_test):
         try:
             uuid.UUID(str(value_to_test))
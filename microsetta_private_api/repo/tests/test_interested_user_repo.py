@@ -210,6 +210,75 @@ class InterestedUserRepoTests(unittest.TestCase):
             obs = interested_user_repo.verify_address(user_id)
             self.assertTrue(obs is False)
 
+    def test_update_address_verifications(self):
+        users = {}
+        with Transaction() as t:
+            interested_user_repo = InterestedUserRepo(t)
+            for name in ('valid', 'invalid', 'moved'):
+                interested_user = InterestedUser.from_dict({
+                    "campaign_id": self.test_campaign_id,
+                    "first_name": "Test",
+                    "last_name": name,
+                    "email": "test@testing.com",
+                    "address_1": "9500 gilman dr",
+                    "city": CITY,
+                    "state": STATE,
+                    "postal_code": POSTAL,
+                    "country": COUNTRY
+                })
+                users[name] = \
+                    interested_user_repo.insert_interested_user(
+                        interested_user)
+
+            unchecked = {
+                a['interested_user_id']: a
+                for a in interested_user_repo.get_unchecked_addresses(
+                    1000000)}
+            for user_id in users.values():
+                self.assertEqual(unchecked[user_id]['postal'], POSTAL)
+
+            # paging continues after the given ID
+            first = sorted(users.values())[0]
+            after = interested_user_repo.get_unchecked_addresses(1000000,
+                                                                 first)
+            self.assertNotIn(first, [a['interested_user_id']
+                                     for a in after])
+
+            # an address which changes after it is read is left unchecked
+            cur = t.cursor()
+            cur.execute("UPDATE campaign.interested_users "
+                        "SET address_1 = '1 Elsewhere St' "
+                        "WHERE interested_user_id = %s",
+                        (users['moved'], ))
+
+            response = {"address_1": ADDRESS_1, "address_2": ADDRESS_2,
+                        "address_3": "", "city": CITY, "state": STATE,
+                        "postal": POSTAL, "country": COUNTRY,
+                        "latitude": LATITUDE, "longitude": LONGITUDE,
+                        "valid": True}
+            obs = interested_user_repo.update_address_verifications([
+                (unchecked[users['valid']], response),
+                (unchecked[users['invalid']], dict(response, valid=False)),
+                (unchecked[users['moved']], response)])
+            self.assertEqual(obs, 2)
+
+            valid = interested_user_repo.get_interested_user_by_id(
+                users['valid'])
+            self.assertTrue(valid.address_checked)
+            self.assertTrue(valid.address_valid)
+            self.assertEqual(valid.address_1, ADDRESS_1)
+            self.assertEqual(valid.latitude, float(LATITUDE))
+
+            invalid = interested_user_repo.get_interested_user_by_id(
+                users['invalid'])
+            self.assertTrue(invalid.address_checked)
+            self.assertFalse(invalid.address_valid)
+            self.assertEqual(invalid.address_1, "9500 gilman dr")
+
+            moved = interested_user_repo.get_interested_user_by_id(
+                users['moved'])
+            self.assertFalse(moved.address_checked)
+
     def test_update_interested_user_valid(self):
         dummy_user = {
             "campaign_id": self.test_campaign_id,
@@ -52,6 +52,39 @@ class MelissaRepoTests(unittest.TestCase):
 
             self.assertTrue(obs)
 
+    def test_bulk_records(self):
+        with Transaction() as t:
+            mr = MelissaRepo(t)
+            record_ids = mr.create_records([
+                ("9500 Gilman DrBULKTEST", None, None, "La Jolla", "CA",
+                 "92093", "US"),
+                ("1234 Not Real StBULKTEST", "Apt 1", None, "San Diego",
+                 "CA", "92116", "US")])
+            self.assertEqual(len(record_ids), 2)
+
+            # neither is verified yet
+            addresses = [("9500 Gilman DrBULKTEST", None, "92093", "US"),
+                         ("1234 Not Real StBULKTEST", "Apt 1", "92116",
+                          "US")]
+            self.assertEqual(mr.check_duplicates(addresses), {})
+
+            obs = mr.update_results_bulk([
+                (record_ids[0], "http://foo.bar", "RAW_RESULT", "AV24",
+                 True, "9500 Gilman Dr, La Jolla, CA 92093, US",
+                 "9500 Gilman Dr", None, None, "La Jolla", "CA", "92093",
+                 "US", 32.8798916, -117.2363115),
+                (record_ids[1], "http://foo.bar", "RAW_RESULT", "AE01",
+                 False, "", "", "", "", "", "", "", "", "", "")])
+            self.assertEqual(obs, 2)
+
+            obs = mr.check_duplicates(addresses + [
+                ("9500 Gilman DrBULKTEST", "Apt 1", "92093", "US")])
+            self.assertEqual(sorted(obs), [0, 1])
+            self.assertEqual(obs[0]['melissa_address_query_id'],
+                             record_ids[0])
+            self.assertTrue(obs[0]['result_good'])
+            self.assertIsNone(obs[1]['result_latitude'])
+
     def test_check_duplicate_no_match(self):
         with Transaction() as t:
             mr = MelissaRepo(t)
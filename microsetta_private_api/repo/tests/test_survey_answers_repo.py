@@ -1,6 +1,8 @@
 import unittest
 import datetime
+from werkzeug.exceptions import BadRequest
 from microsetta_private_api.repo.survey_answers_repo import SurveyAnswersRepo
+from microsetta_private_api.repo.survey_template_repo import SurveyTemplateRepo
 
 from microsetta_private_api.exceptions import RepoException
 from microsetta_private_api.repo.transaction import Transaction
@@ -89,6 +91,59 @@ class SurveyAnswersTests(unittest.TestCase):
             obs = tr._unlocalize('Bajo', 141, 'es_MX')
             self.assertEqual(obs, exp)
 
+    def test_unlocalize_invalid(self):
+        with Transaction() as t:
+            tr = SurveyAnswersRepo(t)
+            with self.assertRaises(BadRequest):
+                tr._unlocalize('not a response', 141, 'es_MX')
+
+    def test_insert_survey_answers_reports_offending_answer(self):
+        with Transaction() as t:
+            with t.cursor() as cur:
+                cur.execute("DELETE FROM ag.survey_answers "
+                            "WHERE survey_id = %s "
+                            "AND survey_question_id = 141",
+                            (SURVEY_ID, ))
+                rows = [((SURVEY_ID, 141, 'Low'), 'first'),
+                        ((SURVEY_ID, 141, 'not a response'), 'second')]
+                with self.assertRaisesRegex(BadRequest, 'second'):
+                    SurveyAnswersRepo._insert_survey_answers(cur, rows)
+
+    def test_insert_survey_answers(self):
+        with Transaction() as t:
+            with t.cursor() as cur:
+                cur.execute("DELETE FROM ag.survey_answers "
+                            "WHERE survey_id = %s "
+                            "AND survey_question_id = 141",
+                            (SURVEY_ID, ))
+                rows = [((SURVEY_ID, 141, 'Low'), 'first')]
+                SurveyAnswersRepo._insert_survey_answers(cur, rows)
+
+                cur.execute("SELECT response "
+                            "FROM ag.survey_answers "
+                            "WHERE survey_id = %s "
+                            "AND survey_question_id = 141",
+                            (SURVEY_ID, ))
+                self.assertEqual(cur.fetchall(), [('Low', )])
+
+    def test_response_localization_index(self):
+        with Transaction() as t:
+            index = SurveyTemplateRepo(t).get_response_localization_index()
+
+            self.assertEqual(index.unlocalize('Bajo', 210, 'es_MX'), 'Fair')
+            self.assertEqual(index.unlocalize('Bajo', 141, 'es_MX'), 'Low')
+            self.assertEqual(index.unlocalize('Low', 141, 'en_US'), 'Low')
+            self.assertIsNone(index.unlocalize('Bajo', 141, 'en_US'))
+
+            self.assertEqual(index.localize('Low', 'es_MX'), 'Bajo')
+            self.assertEqual(index.localize('Low', 'en_US'), 'Low')
+            self.assertIsNone(index.localize('not a response', 'en_US'))
+
+            # the index is shared within the process
+            self.assertIs(
+                SurveyTemplateRepo(t).get_response_localization_index(),
+                index)
+
 
 if __name__ == '__main__':
     unittest.main()
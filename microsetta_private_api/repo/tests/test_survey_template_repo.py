@@ -1,5 +1,6 @@
 import unittest
 import uuid
+from unittest.mock import patch
 from microsetta_private_api.config_manager import SERVER_CONFIG
 from microsetta_private_api.repo.survey_template_repo import SurveyTemplateRepo
 from microsetta_private_api.repo.transaction import Transaction
@@ -511,6 +512,102 @@ class SurveyTemplateTests(unittest.TestCase):
                                                      TEST2_SOURCE_ID)
             self.assertFalse(obs)
 
+    def test_get_survey_template(self):
+        with Transaction() as t:
+            template_repo = SurveyTemplateRepo(t)
+
+            for template_id in (SurveyTemplateRepo.BASIC_INFO_ID,
+                                SurveyTemplateRepo.GENERAL_HEALTH_ID):
+                obs = template_repo.get_survey_template(template_id, 'es_MX')
+                self.assertEqual(obs.id, template_id)
+                self.assertEqual(obs.locale, 'es_MX')
+                self.assertTrue(len(obs.groups) > 0)
+
+                # verify against the responses and triggers of each
+                # question queried individually
+                with t.cursor() as cur:
+                    for group in obs.groups:
+                        for question in group.questions:
+                            cur.execute("SELECT spanish "
+                                        "FROM survey_question_response "
+                                        "LEFT JOIN survey_response "
+                                        "ON response = american "
+                                        "WHERE survey_question_id = %s "
+                                        "ORDER BY display_index",
+                                        (question.id, ))
+                            exp = [r[0] for r in cur.fetchall()]
+                            if question.id in (110, 148):
+                                exp[1:] = sorted(exp[1:])
+                            self.assertEqual(question.valid_responses, exp)
+
+                            cur.execute("SELECT spanish, "
+                                        "triggered_question "
+                                        "FROM survey_response "
+                                        "JOIN survey_question_triggers "
+                                        "ON triggering_response = american "
+                                        "WHERE survey_question_id = %s",
+                                        (question.id, ))
+                            exp = sorted(cur.fetchall())
+                            self.assertEqual(
+                                sorted((tr.trigger_response,
+                                        tr.triggered_question_id)
+                                       for tr in question.triggers),
+                                exp)
+
+    def test_get_survey_template_cached(self):
+        SurveyTemplateRepo.clear_survey_template_cache()
+        template_id = SurveyTemplateRepo.BASIC_INFO_ID
+
+        with Transaction() as t:
+            template_repo = SurveyTemplateRepo(t)
+            exp = template_repo.get_survey_template(template_id, 'en_US')
+
+            with patch.object(template_repo, 'get_survey_template',
+                              wraps=template_repo.get_survey_template) as m:
+                obs1 = template_repo.get_survey_template_cached(template_id,
+                                                                'en_US')
+                obs2 = template_repo.get_survey_template_cached(template_id,
+                                                                'en_US')
+                schema = template_repo.get_vue_schema_cached(template_id,
+                                                             'en_US')
+                m.assert_called_once_with(template_id, 'en_US')
+
+            # callers receive their own copy
+            self.assertIsNot(obs1, obs2)
+            self.assertEqual(obs1.id, exp.id)
+            self.assertEqual(
+                [[q.id for q in g.questions] for g in obs1.groups],
+                [[q.id for q in g.questions] for g in exp.groups])
+            self.assertEqual(
+                [[f.id for f in g.fields] for g in schema.groups],
+                [[str(q.id) for q in g.questions] for g in exp.groups])
+
+            # modifying a returned copy does not affect the cache
+            obs1.groups.clear()
+            obs3 = template_repo.get_survey_template_cached(template_id,
+                                                            'en_US')
+            self.assertEqual(len(obs3.groups), len(exp.groups))
+
+            # clearing the cache forces the template to be rebuilt
+            SurveyTemplateRepo.clear_survey_template_cache()
+            with patch.object(template_repo, 'get_survey_template',
+                              wraps=template_repo.get_survey_template) as m:
+                template_repo.get_survey_template_cached(template_id,
+                                                         'en_US')
+                m.assert_called_once_with(template_id, 'en_US')
+
+    def test_get_survey_template_cached_missing(self):
+        with Transaction() as t:
+            template_repo = SurveyTemplateRepo(t)
+            with self.assertRaises(NotFound):
+                template_repo.get_survey_template_cached(-1, 'en_US')
+
+    def test_get_survey_template_missing(self):
+        with Transaction() as t:
+            template_repo = SurveyTemplateRepo(t)
+            with self.assertRaises(NotFound):
+                template_repo.get_survey_template(-1, 'en_US')
+
     def test_generate_empty_survey(self):
         with Transaction() as t:
             sar = SurveyTemplateRepo(t)
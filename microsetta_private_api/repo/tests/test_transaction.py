@@ -0,0 +1,380 @@
+import time
+import unittest
+from unittest import mock
+
+import flask
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.pool
+
+from microsetta_private_api.config_manager import AMGUT_CONFIG, \
+    SERVER_CONFIG
+from microsetta_private_api.repo.transaction import Transaction, \
+    ManagedConnectionPool, QueryStats, begin_query_stats, end_query_stats, \
+    current_query_stats, _statement_shape
+
+
+def _make_pool(minconn=0, maxconn=2, **kwargs):
+    return ManagedConnectionPool(minconn, maxconn,
+                                 user=AMGUT_CONFIG.user,
+                                 password=AMGUT_CONFIG.password,
+                                 database=AMGUT_CONFIG.database,
+                                 host=AMGUT_CONFIG.host,
+                                 port=AMGUT_CONFIG.port,
+                                 **kwargs)
+
+
+class ManagedConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool is not None:
+            self.pool.closeall()
+
+    def test_search_path_set_once(self):
+        self.pool = _make_pool()
+        conn = self.pool.getconn()
+        with conn.cursor() as cur:
+            cur.execute("SHOW search_path")
+            obs = cur.fetchone()[0]
+        self.assertEqual(obs, "ag, barcodes, public, campaign")
+
+        # survives a rollback, as it was committed when connecting
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM account")
+        self.pool.putconn(conn)
+
+    def test_reuses_returned_connection(self):
+        self.pool = _make_pool(minconn=1)
+        first = self.pool.getconn()
+        self.pool.putconn(first)
+        second = self.pool.getconn()
+        self.assertIs(first, second)
+        self.pool.putconn(second)
+
+    def test_putconn_rolls_back(self):
+        self.pool = _make_pool()
+        conn = self.pool.getconn()
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        self.pool.putconn(conn)
+        self.assertEqual(conn.info.transaction_status,
+                         psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+
+    def test_replaces_closed_connection(self):
+        self.pool = _make_pool(minconn=1)
+        first = self.pool.getconn()
+        self.pool.putconn(first)
+        first.close()
+
+        second = self.pool.getconn()
+        self.assertIsNot(first, second)
+        self.assertFalse(second.closed)
+        self.pool.putconn(second)
+
+    def test_recycles_old_connection(self):
+        self.pool = _make_pool(max_age=0.01)
+        first = self.pool.getconn()
+        time.sleep(0.02)
+        self.pool.putconn(first)
+        self.assertTrue(first.closed)
+
+        second = self.pool.getconn()
+        self.assertIsNot(first, second)
+        self.pool.putconn(second)
+
+    def test_validates_idle_connection(self):
+        self.pool = _make_pool(validate_idle=0)
+        first = self.pool.getconn()
+        self.pool.putconn(first)
+
+        # terminate the backend behind the pool's back
+        other = self.pool.getconn()
+        with other.cursor() as cur:
+            cur.execute("SELECT pg_terminate_backend(%s)",
+                        (first.info.backend_pid, ))
+        other.commit()
+        self.pool.putconn(other)
+
+        # both are idle, and whichever is handed out must be alive
+        a = self.pool.getconn()
+        b = self.pool.getconn()
+        for conn in (a, b):
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            self.pool.putconn(conn)
+
+    def test_exhausted_waits_then_raises(self):
+        self.pool = _make_pool(maxconn=1, timeout=0.1)
+        conn = self.pool.getconn()
+
+        start = time.monotonic()
+        with self.assertRaisesRegex(psycopg2.pool.PoolError, "exhausted"):
+            self.pool.getconn()
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+        self.pool.putconn(conn)
+        conn = self.pool.getconn()
+        self.pool.putconn(conn)
+
+    def test_closeall(self):
+        self.pool = _make_pool(minconn=1)
+        conn = self.pool.getconn()
+        self.pool.closeall()
+        self.assertTrue(conn.closed)
+        with self.assertRaisesRegex(psycopg2.pool.PoolError, "closed"):
+            self.pool.getconn()
+
+
+class TransactionTests(unittest.TestCase):
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+
+    def test_outside_request_uses_separate_connections(self):
+        with Transaction() as t:
+            first = t.conn
+        with Transaction() as t:
+            with Transaction() as t2:
+                self.assertIsNot(t.conn, t2.conn)
+        self.assertFalse(first.closed)
+
+    def test_request_reuses_connection(self):
+        with self.app.test_request_context():
+            with Transaction() as t:
+                with t.cursor() as cur:
+                    cur.execute("SELECT 1")
+                t.commit()
+                first = t.conn
+
+            with Transaction() as t:
+                self.assertIs(t.conn, first)
+                with t.cursor() as cur:
+                    cur.execute("SELECT 1")
+                    self.assertEqual(cur.fetchone()[0], 1)
+
+            held = flask.g.get(Transaction._REQUEST_CONNS)
+            self.assertIs(held['primary'][1], first)
+            Transaction.release_request_connection()
+            self.assertIsNone(flask.g.get(Transaction._REQUEST_CONNS))
+
+    def test_request_nested_transaction_not_shared(self):
+        with self.app.test_request_context():
+            with Transaction() as outer:
+                with Transaction() as inner:
+                    self.assertIsNot(outer.conn, inner.conn)
+                    inner.rollback()
+
+                # the outer transaction is unaffected by the inner one
+                with outer.cursor() as cur:
+                    cur.execute("SELECT 1")
+                    self.assertEqual(cur.fetchone()[0], 1)
+
+            # the request connection is free again once the outer exits
+            with Transaction() as t:
+                self.assertIs(t.conn, outer.conn)
+            Transaction.release_request_connection()
+
+    def test_request_rolls_back_uncommitted_work(self):
+        with self.app.test_request_context():
+            with Transaction() as t:
+                with t.cursor() as cur:
+                    cur.execute("CREATE TEMP TABLE txn_reuse_test (x int)")
+
+            with Transaction() as t:
+                with t.cursor() as cur:
+                    cur.execute("SELECT to_regclass('pg_temp.txn_reuse_test')")
+                    self.assertIsNone(cur.fetchone()[0])
+            Transaction.release_request_connection()
+
+    def test_release_within_request(self):
+        with self.app.test_request_context():
+            with Transaction() as t:
+                with t.cursor() as cur:
+                    cur.execute("SELECT 1")
+
+            # the connection is returned before the request ends, and a
+            # later Transaction checks one out again
+            Transaction.release_request_connection()
+            self.assertIsNone(flask.g.get(Transaction._REQUEST_CONNS))
+
+            with Transaction() as t:
+                with t.cursor() as cur:
+                    cur.execute("SELECT 1")
+                    self.assertEqual(cur.fetchone()[0], 1)
+            Transaction.release_request_connection()
+
+    def test_release_without_connection(self):
+        with self.app.test_request_context():
+            # no Transaction was opened, so this is a no-op
+            Transaction.release_request_connection()
+
+
+def _dsn(**kwargs):
+    params = {'user': AMGUT_CONFIG.user,
+              'password': AMGUT_CONFIG.password,
+              'dbname': AMGUT_CONFIG.database,
+              'host': AMGUT_CONFIG.host,
+              'port': AMGUT_CONFIG.port}
+    params.update(kwargs)
+    return ' '.join('%s=%s' % (k, v) for k, v in params.items())
+
+
+def _application_name(t):
+    with t.cursor() as cur:
+        cur.execute("SHOW application_name")
+        return cur.fetchone()[0]
+
+
+class ReadOnlyTransactionTests(unittest.TestCase):
+    # the test database stands in for the replica, distinguished from the
+    # primary by its application_name
+    REPLICA_DSN = _dsn(application_name='replica_stand_in')
+
+    def setUp(self):
+        self.app = flask.Flask(__name__)
+        Transaction._REPLICA_POOL = None
+
+    def tearDown(self):
+        if Transaction._REPLICA_POOL is not None:
+            Transaction._REPLICA_POOL.closeall()
+        Transaction._REPLICA_POOL = None
+
+    def test_read_only_without_replica_uses_primary(self):
+        with mock.patch.dict(SERVER_CONFIG, {'db_replica_dsn': None}):
+            with Transaction(read_only=True) as t:
+                self.assertNotEqual(_application_name(t),
+                                    'replica_stand_in')
+        self.assertIsNone(Transaction._REPLICA_POOL)
+
+    def test_read_only_uses_replica(self):
+        with mock.patch.dict(SERVER_CONFIG,
+                             {'db_replica_dsn': self.REPLICA_DSN}):
+            with Transaction(read_only=True) as t:
+                self.assertEqual(_application_name(t), 'replica_stand_in')
+
+            # writes are not routed to the replica
+            with Transaction() as t:
+                self.assertNotEqual(_application_name(t),
+                                    'replica_stand_in')
+
+    def test_read_only_rejects_writes(self):
+        with mock.patch.dict(SERVER_CONFIG, {'db_replica_dsn': None}):
+            with Transaction(read_only=True) as t:
+                with t.cursor() as cur:
+                    err = psycopg2.errors.ReadOnlySqlTransaction
+                    with self.assertRaises(err):
+                        cur.execute("CREATE TEMP TABLE read_only_test "
+                                    "(x int)")
+
+            # the flag does not leak to the next user of the connection
+            with Transaction() as t:
+                with t.cursor() as cur:
+                    cur.execute("CREATE TEMP TABLE read_only_test (x int)")
+
+    def test_read_only_falls_back_to_primary(self):
+        bad_dsn = _dsn(port=1, connect_timeout=1)
+        with mock.patch.dict(SERVER_CONFIG, {'db_replica_dsn': bad_dsn}):
+            with Transaction(read_only=True) as t:
+                with t.cursor() as cur:
+                    cur.execute("SELECT 1")
+                    self.assertEqual(cur.fetchone()[0], 1)
+
+    def test_request_holds_replica_and_primary(self):
+        with mock.patch.dict(SERVER_CONFIG,
+                             {'db_replica_dsn': self.REPLICA_DSN}):
+            with self.app.test_request_context():
+                with Transaction(read_only=True) as t:
+                    replica_conn = t.conn
+                with Transaction() as t:
+                    primary_conn = t.conn
+                with Transaction(read_only=True) as t:
+                    self.assertIs(t.conn, replica_conn)
+
+                self.assertIsNot(replica_conn, primary_conn)
+                Transaction.release_request_connection()
+
+
+class QueryStatsTests(unittest.TestCase):
+    def test_statement_shape(self):
+        self.assertEqual(
+            _statement_shape("SELECT *\n  FROM account WHERE id = 'a''b' "
+                             "AND n IN (1, 2, 3)"),
+            "SELECT * FROM account WHERE id = ? AND n IN (?)")
+        self.assertEqual(
+            _statement_shape("INSERT INTO x (a, b) VALUES (1, 'x'), "
+                             "(2, 'y')"),
+            "INSERT INTO x (a, b) VALUES (?)")
+        self.assertEqual(_statement_shape("SELECT %s FROM t2"),
+                         "SELECT %s FROM t2")
+
+    def test_record(self):
+        stats = QueryStats('test')
+        for i in range(12):
+            stats.record("SELECT * FROM sample WHERE id = %d" % i, 0.001)
+        stats.record("SELECT * FROM account", 0.5)
+
+        self.assertEqual(stats.count, 13)
+        self.assertAlmostEqual(stats.total, 0.512)
+        self.assertEqual(len(stats.slowest), QueryStats.SLOWEST)
+        self.assertEqual(stats.slowest[0], (0.5, "SELECT * FROM account"))
+
+        obs = stats.repeated(10)
+        self.assertEqual(len(obs), 1)
+        shape, count, total = obs[0]
+        self.assertEqual(shape, "SELECT * FROM sample WHERE id = ?")
+        self.assertEqual(count, 12)
+        self.assertAlmostEqual(total, 0.012)
+        self.assertEqual(stats.repeated(13), [])
+
+        self.assertEqual(stats.header(10),
+                         "queries=13; time_ms=512.0; repeated=1")
+
+    def test_log(self):
+        stats = QueryStats('GET /foo')
+        for _ in range(3):
+            stats.record("SELECT 1", 0.001)
+
+        logger = mock.Mock()
+        stats.log(logger, 3)
+        logger.info.assert_called_once()
+        self.assertIn('GET /foo', logger.info.call_args[0])
+        logger.warning.assert_called_once()
+        self.assertIn("SELECT ?", logger.warning.call_args[0])
+
+    def test_disabled(self):
+        with mock.patch.dict(SERVER_CONFIG, {'sql_instrumentation': False}):
+            self.assertIsNone(begin_query_stats('test'))
+            self.assertIsNone(current_query_stats())
+            with Transaction() as t:
+                cur = t.cursor()
+                self.assertIs(type(cur), psycopg2.extensions.cursor)
+
+    def test_instrumented_cursors(self):
+        with mock.patch.dict(SERVER_CONFIG, {'sql_instrumentation': True}):
+            stats = begin_query_stats('test')
+            try:
+                # a nested scope continues the outer one
+                self.assertIsNone(begin_query_stats('nested'))
+
+                with Transaction() as t:
+                    with t.cursor() as cur:
+                        for i in range(3):
+                            cur.execute("SELECT %s", (i, ))
+                    with t.dict_cursor() as cur:
+                        cur.execute("SELECT 1 AS x")
+                        self.assertEqual(cur.fetchone()['x'], 1)
+            finally:
+                with mock.patch.object(stats, 'log') as mock_log:
+                    end_query_stats(stats)
+
+        mock_log.assert_called_once()
+        self.assertIsNone(current_query_stats())
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(stats.shapes["SELECT %s"][0], 3)
+        self.assertEqual(stats.shapes["SELECT ? AS x"][0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
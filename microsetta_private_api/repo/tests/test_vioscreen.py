@@ -1,11 +1,15 @@
+import copy
 import unittest
 import json
+from unittest import mock
 from microsetta_private_api.api.tests.test_api import (
     ACCT_MOCK_ISS_3,
     ACCT_MOCK_SUB_3,
     create_dummy_acct)
 
-from microsetta_private_api.repo.transaction import Transaction
+from microsetta_private_api.config_manager import SERVER_CONFIG
+from microsetta_private_api.repo.transaction import Transaction, \
+    begin_query_stats, end_query_stats
 from microsetta_private_api.repo.vioscreen_repo import (
     VioscreenRepo, VioscreenSessionRepo, VioscreenSupplementsRepo)
 from microsetta_private_api.repo.tests.test_vioscreen_dietaryscore import (
@@ -20,6 +24,7 @@ from microsetta_private_api.model.vioscreen import (
     VioscreenComposite, VioscreenSession)
 from microsetta_private_api.repo.admin_repo import AdminRepo
 from microsetta_private_api.repo.survey_template_repo import SurveyTemplateRepo
+from werkzeug.exceptions import NotFound
 
 
 def get_data_path(filename):
@@ -74,6 +79,36 @@ class VioscreenRepoTests(unittest.TestCase):
             supp = vs.get_supplements(VIOSCREEN_SESSION.sessionId)
             self.assertEqual(self.supp, supp)
 
+    def test_insert_ffqs(self):
+        other = copy.deepcopy(self.FFQ)
+        for model in [other.session, other.percent_energy,
+                      other.supplements, other.food_components,
+                      other.eating_patterns, other.mpeds,
+                      other.food_consumption] + other.dietary_scores:
+            model.sessionId = 'another session'
+
+        with Transaction() as t:
+            vr = VioscreenRepo(t)
+            vr.insert_ffqs([self.FFQ, other])
+
+            obs = vr.get_ffq(VIOSCREEN_SESSION.sessionId)
+            self.assertEqual(obs, self.FFQ)
+            obs = vr.get_ffq('another session')
+            self.assertEqual(obs, other)
+
+    def test_insert_ffqs_unknown_code(self):
+        bad = copy.deepcopy(self.FFQ)
+        bad.mpeds.components[-1].code = 'not a code'
+
+        with Transaction() as t:
+            vr = VioscreenRepo(t)
+            with self.assertRaisesRegex(NotFound, 'not a code'):
+                vr.insert_ffqs([bad])
+
+            # nothing is written when a code is unrecognized
+            sr = VioscreenSessionRepo(t)
+            self.assertIsNone(sr.get_session(VIOSCREEN_SESSION.sessionId))
+
     def test_get_ffq(self):
         with Transaction() as t:
             vr = VioscreenRepo(t)
@@ -81,6 +116,30 @@ class VioscreenRepoTests(unittest.TestCase):
             obs = vr.get_ffq(VIOSCREEN_SESSION.sessionId)
             self.assertEqual(obs, self.FFQ)
 
+    def test_get_ffq_does_not_exist(self):
+        with Transaction() as t:
+            vr = VioscreenRepo(t)
+            self.assertIsNone(vr.get_ffq('does not exist'))
+
+    def test_get_ffq_queries(self):
+        with Transaction() as t:
+            vr = VioscreenRepo(t)
+            vr.insert_ffq(self.FFQ)
+
+            with mock.patch.dict(SERVER_CONFIG,
+                                 {'sql_instrumentation': True}):
+                stats = begin_query_stats('test')
+                try:
+                    obs = vr.get_ffq(VIOSCREEN_SESSION.sessionId)
+                finally:
+                    with mock.patch.object(stats, 'log'):
+                        end_query_stats(stats)
+
+            self.assertEqual(obs, self.FFQ)
+            # the number of queries does not grow with the number of foods
+            self.assertLessEqual(stats.count, 6)
+            self.assertEqual(stats.repeated(2), [])
+
     def test_is_code_unused_false(self):
         with Transaction() as t:
             admin_repo = AdminRepo(t)
@@ -68,6 +68,28 @@ class VioscreenSessions(unittest.TestCase):
             obs = r.get_session(VIOSCREEN_SESSION.sessionId)
             self.assertEqual(obs, session_modified)
 
+    def test_upsert_sessions(self):
+        with Transaction() as t:
+            r = VioscreenSessionRepo(t)
+            r.upsert_session(VIOSCREEN_SESSION)
+
+            session_modified = copy(VIOSCREEN_SESSION)
+            session_modified.endDate = _to_dt(2, 1, 1970)
+            session_new = copy(VIOSCREEN_SESSION)
+            session_new.sessionId = 'another session'
+
+            # the last occurrence of a repeated session is kept
+            obs = r.upsert_sessions([VIOSCREEN_SESSION, session_new,
+                                     session_modified])
+            self.assertEqual(obs, 2)
+
+            obs = r.get_session(VIOSCREEN_SESSION.sessionId)
+            self.assertEqual(obs, session_modified)
+            obs = r.get_session(session_new.sessionId)
+            self.assertEqual(obs, session_new)
+
+            self.assertEqual(r.upsert_sessions([]), 0)
+
     def test_get_session_exists(self):
         with Transaction() as t:
             r = VioscreenSessionRepo(t)
@@ -256,6 +278,43 @@ class VioscreenSessions(unittest.TestCase):
             self.assertEqual({r.username for r in obs},
                              exp - {VIOSCREEN_USERNAME1, })
 
+    def test_get_missing_ffqs_fetch_failures(self):
+        with Transaction() as t:
+            r = VioscreenSessionRepo(t)
+
+            finished = []
+            for sid in ('failing session', 'other session'):
+                session = VIOSCREEN_SESSION.copy()
+                session.sessionId = sid
+                session.status = 'Finished'
+                session.endDate = _to_dt(1, 1, 1971)
+                r.upsert_session(session)
+                finished.append(sid)
+
+            def order():
+                return [o.sessionId for o in r.get_missing_ffqs()
+                        if o.sessionId in finished]
+
+            self.assertEqual(order(), ['failing session', 'other session'])
+
+            # a failed session is attempted after those not yet attempted
+            r.record_ffq_fetch_failures([('failing session', 'oops')])
+            self.assertEqual(order(), ['other session', 'failing session'])
+
+            # and after those which failed fewer times
+            r.record_ffq_fetch_failures([('other session', 'oops')])
+            r.record_ffq_fetch_failures([('failing session', 'oops again')])
+            self.assertEqual(order(), ['other session', 'failing session'])
+
+            cur = t.cursor()
+            cur.execute("""SELECT attempts, last_error
+                           FROM ag.vioscreen_ffq_fetch_log
+                           WHERE sessionId = 'failing session'""")
+            self.assertEqual(cur.fetchone(), (2, 'oops again'))
+
+            r.clear_ffq_fetch_failures(['failing session'])
+            self.assertEqual(order(), ['failing session', 'other session'])
+
     def test_get_ffq_status_by_sample(self):
 
         session_copy = VIOSCREEN_SESSION.copy()
@@ -294,6 +353,23 @@ class VioscreenSessions(unittest.TestCase):
             obs = r.get_ffq_status_by_sample(BARCODE_UUID_FOR_VIOSESSION)
             self.assertEqual(obs, (False, True, 'Review'))
 
+    def test_get_ffq_statuses_by_samples(self):
+        session_copy = VIOSCREEN_SESSION.copy()
+        session_copy.username = VIOSCREEN_USERNAME1
+        session_copy.status = 'Finished'
+        with Transaction() as t:
+            r = VioscreenSessionRepo(t)
+            r.upsert_session(session_copy)
+
+            obs = r.get_ffq_statuses_by_samples(
+                [BARCODE_UUID_NOTIN_REGISTRY, BARCODE_UUID_FOR_VIOSESSION])
+            self.assertEqual(obs,
+                             {BARCODE_UUID_NOTIN_REGISTRY:
+                              (False, False, None),
+                              BARCODE_UUID_FOR_VIOSESSION:
+                              (True, True, 'Finished')})
+            self.assertEqual(r.get_ffq_statuses_by_samples([]), {})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,41 +1,564 @@
-from microsetta_private_api.config_manager import AMGUT_CONFIG
+from microsetta_private_api.config_manager import AMGUT_CONFIG, \
+    SERVER_CONFIG
+import flask
+import psycopg2
 import psycopg2.pool
+import psycopg2.extensions
 import psycopg2.extras
 import atexit
+import logging
+import re
+import threading
+import time
 from psycopg2 import sql
 
 
+class ManagedConnectionPool:
+    """A thread safe pool of connections with session setup and recycling
+
+    Each physical connection has its search_path set once when it is
+    opened, rather than per cursor. Connections are returned to the pool
+    for reuse up to maxconn, and are discarded on checkout if they are
+    closed, older than max_age, or fail a liveness check after sitting idle
+    for longer than validate_idle. When every connection is in use, getconn
+    waits up to timeout seconds for one to be returned before raising
+    PoolError.
+
+    Parameters
+    ----------
+    minconn : int
+        The number of connections to open when the pool is created
+    maxconn : int
+        The maximum number of connections open at any one time
+    timeout : float or None
+        Seconds to wait for a connection when the pool is exhausted. None
+        waits indefinitely.
+    max_age : float or None
+        Seconds after which a connection is closed rather than reused. None
+        does not recycle connections.
+    validate_idle : float or None
+        Seconds a connection may sit idle before it is checked with a
+        trivial query on checkout. None never checks.
+    connect_kwargs : dict
+        Passed through to psycopg2.connect
+    """
+    SESSION_SETUP = 'SET search_path TO ag, barcodes, public, campaign'
+
+    def __init__(self, minconn, maxconn, timeout=None, max_age=None,
+                 validate_idle=None, **connect_kwargs):
+        if not 0 <= minconn <= maxconn:
+            raise ValueError("minconn must be between 0 and maxconn")
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_age = max_age
+        self.validate_idle = validate_idle
+        self.closed = False
+        self._connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        # idle connections as (connection, created, returned) tuples
+        self._idle = []
+        # id(connection) -> (connection, created) for checked out connections
+        self._used = {}
+        # open connections, plus those being opened
+        self._size = 0
+
+        for _ in range(minconn):
+            self._size += 1
+            self._idle.append((self._connect(), time.monotonic(),
+                               time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(self.SESSION_SETUP)
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _reserve(self, deadline):
+        # Wait for an idle connection or a free slot. Returns an idle entry,
+        # or None if a slot was reserved for a new connection.
+        with self._cond:
+            while True:
+                if self.closed:
+                    raise psycopg2.pool.PoolError("connection pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.maxconn:
+                    self._size += 1
+                    return None
+
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise psycopg2.pool.PoolError(
+                            "connection pool exhausted: no connection "
+                            "available after %ss" % self.timeout)
+                self._cond.wait(remaining)
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _expired(self, created, now):
+        return self.max_age is not None and now - created > self.max_age
+
+    def _usable(self, conn, created, returned):
+        if conn.closed:
+            return False
+
+        now = time.monotonic()
+        if self._expired(created, now):
+            return False
+
+        if self.validate_idle is not None and \
+                now - returned > self.validate_idle:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """Check out a connection, waiting up to timeout for one to be free
+
+        Returns
+        -------
+        psycopg2.extensions.connection
+            An open connection with the session already set up
+
+        Raises
+        ------
+        PoolError
+            If the pool is closed, or no connection became available within
+            timeout
+        """
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+
+        entry = self._reserve(deadline)
+        if entry is not None:
+            conn, created, returned = entry
+            if not self._usable(conn, created, returned):
+                # replace it within the same slot
+                self._close_quietly(conn)
+                entry = None
+
+        if entry is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._release_slot()
+                raise
+            created = time.monotonic()
+
+        with self._cond:
+            self._used[id(conn)] = (conn, created)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection to the pool
+
+        Parameters
+        ----------
+        conn : psycopg2.extensions.connection
+            A connection obtained from getconn
+        close : bool, optional
+            If True, close the connection rather than keep it for reuse
+        """
+        with self._cond:
+            entry = self._used.pop(id(conn), None)
+        if entry is None:
+            raise psycopg2.pool.PoolError("trying to put unkeyed connection")
+        _, created = entry
+
+        keep = not (close or self.closed or conn.closed or
+                    self._expired(created, time.monotonic()))
+        if keep:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                # server connection lost
+                keep = False
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    keep = False
+
+        with self._cond:
+            if keep and not self.closed:
+                self._idle.append((conn, created, time.monotonic()))
+                self._cond.notify()
+                return
+
+        self._close_quietly(conn)
+        self._release_slot()
+
+    def closeall(self):
+        """Close every connection, idle or in use, and close the pool"""
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            conns = [conn for conn, _, _ in self._idle]
+            conns.extend(conn for conn, _ in self._used.values())
+            self._idle = []
+            self._cond.notify_all()
+
+        for conn in conns:
+            self._close_quietly(conn)
+
+
+def _statement_shape(statement):
+    # reduce a statement to its shape, so that the same statement run with
+    # different values is grouped together
+    shape = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    shape = re.sub(r'\b\d+(\.\d+)?\b', '?', shape)
+    shape = re.sub(r'\s+', ' ', shape).strip()
+    shape = re.sub(r'\?(\s*,\s*\?)+', '?', shape)
+    shape = re.sub(r'\(\?\)(\s*,\s*\(\?\))+', '(?)', shape)
+    return shape
+
+
+class QueryStats:
+    """Query counts and timings collected over a request or celery task
+
+    Parameters
+    ----------
+    label : str
+        What the statistics are collected for, e.g., "GET /api/accounts"
+    """
+    SLOWEST = 5
+    MAX_SHAPE_LENGTH = 200
+
+    def __init__(self, label):
+        self.label = label
+        self.count = 0
+        self.total = 0.0
+        # shape -> [number of executions, total seconds]
+        self.shapes = {}
+        # (seconds, statement) of the slowest statements, slowest first
+        self.slowest = []
+
+    def record(self, statement, duration):
+        """Record the execution of a statement
+
+        Parameters
+        ----------
+        statement : str
+            The statement executed
+        duration : float
+            The time taken in seconds
+        """
+        self.count += 1
+        self.total += duration
+
+        shape = _statement_shape(statement)[:self.MAX_SHAPE_LENGTH]
+        entry = self.shapes.setdefault(shape, [0, 0.0])
+        entry[0] += 1
+        entry[1] += duration
+
+        if len(self.slowest) < self.SLOWEST or \
+                duration > self.slowest[-1][0]:
+            self.slowest.append((duration, shape))
+            self.slowest.sort(key=lambda x: x[0], reverse=True)
+            del self.slowest[self.SLOWEST:]
+
+    def repeated(self, threshold):
+        """The statement shapes executed at least threshold times
+
+        Many executions of one shape within a request usually means a query
+        issued per item of a loop (an N+1 pattern).
+
+        Parameters
+        ----------
+        threshold : int
+            The minimum number of executions to report
+
+        Returns
+        -------
+        list of (str, int, float)
+            The shape, its number of executions and total seconds, most
+            executed first
+        """
+        found = [(shape, count, total)
+                 for shape, (count, total) in self.shapes.items()
+                 if count >= threshold]
+        return sorted(found, key=lambda x: x[1], reverse=True)
+
+    def header(self, threshold):
+        """A compact summary suitable for a response header"""
+        return "queries=%d; time_ms=%.1f; repeated=%d" % (
+            self.count, self.total * 1000, len(self.repeated(threshold)))
+
+    def log(self, logger, threshold):
+        """Log a summary, and warn of any repeated statement shapes"""
+        slowest = "; ".join("%.1f ms %s" % (duration * 1000, shape)
+                            for duration, shape in self.slowest)
+        logger.info("SQL for %s: %d queries in %.1f ms; slowest: %s",
+                    self.label, self.count, self.total * 1000, slowest)
+
+        for shape, count, total in self.repeated(threshold):
+            logger.warning("Possible N+1 query in %s: %d executions in "
+                           "%.1f ms of %s", self.label, count, total * 1000,
+                           shape)
+
+
+_QUERY_STATS = threading.local()
+
+
+def current_query_stats():
+    """The QueryStats being collected by this thread, if any"""
+    return getattr(_QUERY_STATS, 'current', None)
+
+
+def begin_query_stats(label):
+    """Start collecting query statistics for this thread
+
+    Collection only happens if the sql_instrumentation server configuration
+    is enabled. If statistics are already being collected, e.g., for a
+    celery task called directly from within another, the existing
+    collection continues.
+
+    Parameters
+    ----------
+    label : str
+        What the statistics are collected for
+
+    Returns
+    -------
+    QueryStats or None
+        The statistics started, to pass to end_query_stats, or None if
+        nothing was started
+    """
+    if not SERVER_CONFIG.get('sql_instrumentation', False):
+        return None
+    if current_query_stats() is not None:
+        return None
+
+    stats = QueryStats(label)
+    _QUERY_STATS.current = stats
+    return stats
+
+
+def end_query_stats(stats):
+    """Stop collecting query statistics for this thread, and log them
+
+    Parameters
+    ----------
+    stats : QueryStats or None
+        As returned by begin_query_stats. If None, this is a no-op.
+    """
+    if stats is None or current_query_stats() is not stats:
+        return
+
+    _QUERY_STATS.current = None
+    if flask.has_app_context():
+        logger = flask.current_app.logger
+    else:
+        logger = logging.getLogger(__name__)
+    stats.log(logger, SERVER_CONFIG.get('sql_repeat_threshold', 10))
+
+
+def _statement_text(cursor, query):
+    if isinstance(query, bytes):
+        return query.decode('utf-8', 'replace')
+    if isinstance(query, sql.Composable):
+        return query.as_string(cursor)
+    return query
+
+
+class _InstrumentedCursorMixin:
+    # the QueryStats to record to, set when the cursor is created
+    query_stats = None
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self.query_stats.record(_statement_text(self, query),
+                                    time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self.query_stats.record(_statement_text(self, query),
+                                    time.perf_counter() - start)
+
+
+class _InstrumentedCursor(_InstrumentedCursorMixin,
+                          psycopg2.extensions.cursor):
+    pass
+
+
+class _InstrumentedDictCursor(_InstrumentedCursorMixin,
+                              psycopg2.extras.DictCursor):
+    pass
+
+
+def _pool_from_config(minconn, **connect_kwargs):
+    return ManagedConnectionPool(
+        minconn,
+        SERVER_CONFIG.get('db_pool_maxconn', 20),
+        timeout=SERVER_CONFIG.get('db_pool_timeout', 30),
+        max_age=SERVER_CONFIG.get('db_pool_max_age', 3600),
+        validate_idle=SERVER_CONFIG.get('db_pool_validate_idle', 30),
+        **connect_kwargs)
+
+
 class Transaction:
-    # Note: Using ThreadedConnectionPool as we've switched Celery to threaded
-    # mode. If we change that back to prefork, recommend changing the pool
-    # back to SimpleConnectionPool.
-    _POOL = psycopg2.pool.ThreadedConnectionPool(
-        1,
-        20,
+    """A database transaction, used as a context manager
+
+    Parameters
+    ----------
+    read_only : bool, optional
+        If True, the transaction may not write, and is routed to the read
+        replica described by the db_replica_dsn server configuration when
+        one is configured and reachable, falling back to the primary
+        otherwise. A replica may lag the primary, so only use this for reads
+        which do not depend on a write made moments earlier.
+    """
+    # Note: the pool must be thread safe as we've switched Celery to
+    # threaded mode.
+    _POOL = _pool_from_config(
+        SERVER_CONFIG.get('db_pool_minconn', 1),
         user=AMGUT_CONFIG.user,
         password=AMGUT_CONFIG.password,
         database=AMGUT_CONFIG.database,
         host=AMGUT_CONFIG.host,
         port=AMGUT_CONFIG.port)
 
+    # created on first use, as a replica is optional
+    _REPLICA_POOL = None
+    _REPLICA_LOCK = threading.Lock()
+
+    # Within a Flask request, the first Transaction against a pool checks
+    # out a connection which is then kept on flask.g, and reused by any
+    # later Transaction in the same request against that pool, until the
+    # request is torn down. A Transaction opened while the request
+    # connection is in use (i.e., a nested Transaction) cannot share it, as
+    # committing one would commit the other, so it checks out its own
+    # connection from the pool.
+    _REQUEST_CONNS = '_transaction_request_conns'
+
     @staticmethod
     @atexit.register
     def shutdown_pool():
         Transaction._POOL.closeall()
+        if Transaction._REPLICA_POOL is not None:
+            Transaction._REPLICA_POOL.closeall()
+
+    @staticmethod
+    def _replica_pool():
+        dsn = SERVER_CONFIG.get('db_replica_dsn')
+        if not dsn:
+            return None
+
+        with Transaction._REPLICA_LOCK:
+            if Transaction._REPLICA_POOL is None:
+                Transaction._REPLICA_POOL = _pool_from_config(0, dsn=dsn)
+        return Transaction._REPLICA_POOL
+
+    @staticmethod
+    def release_request_connection(exc=None):
+        """Return the connections held for the current request to their pools
 
-    def __init__(self):
+        This is registered as a Flask teardown_request handler. It may also
+        be called within a request, outside of any Transaction, so that the
+        request does not hold a connection while it waits on something else,
+        e.g., another service. A later Transaction in the request checks out
+        a connection anew.
+        """
+        held = flask.g.pop(Transaction._REQUEST_CONNS, {})
+        for pool, conn, _ in held.values():
+            pool.putconn(conn)
+
+    def __init__(self, read_only=False):
+        self.read_only = read_only
         self._closed = True
+        self._pool = None
         self._conn = None
+        self._request_key = None
 
     def __enter__(self):
         self._closed = False
-        self._conn = Transaction._POOL.getconn()
+        self._pool, self._conn, self._request_key = \
+            self._checkout(self.read_only)
+        if self.read_only:
+            self._conn.readonly = True
         return self
 
     def __exit__(self, type, value, traceback):
         if not self._closed:
             self.rollback()
-        Transaction._POOL.putconn(self._conn)
+
+        if self.read_only and not self._conn.closed:
+            self._conn.readonly = None
+
+        if self._request_key is not None:
+            held = flask.g.get(Transaction._REQUEST_CONNS)
+            held[self._request_key] = (self._pool, self._conn, False)
+        else:
+            self._pool.putconn(self._conn)
+
+    @staticmethod
+    def _checkout(read_only):
+        if read_only:
+            replica = Transaction._replica_pool()
+            if replica is not None:
+                try:
+                    return (replica, ) + \
+                        Transaction._checkout_from(replica, 'replica')
+                except (psycopg2.OperationalError,
+                        psycopg2.pool.PoolError) as e:
+                    logging.getLogger(__name__).warning(
+                        "Read replica unavailable, using primary: %s", e)
+
+        return (Transaction._POOL, ) + \
+            Transaction._checkout_from(Transaction._POOL, 'primary')
+
+    @staticmethod
+    def _checkout_from(pool, key):
+        # returns the connection, and the key it is held under for the
+        # current request if it is request scoped
+        if not flask.has_request_context():
+            return pool.getconn(), None
+
+        held = flask.g.setdefault(Transaction._REQUEST_CONNS, {})
+        _, conn, in_use = held.get(key, (pool, None, False))
+        if in_use:
+            # nested within another Transaction of this request
+            return pool.getconn(), None
+
+        if conn is not None and conn.closed:
+            del held[key]
+            pool.putconn(conn)
+            conn = None
+        if conn is None:
+            conn = pool.getconn()
+        held[key] = (pool, conn, True)
+        return conn, key
 
     def lock_table(self, table):
         # Just access exclusive mode for now- hard to escape the lock mode
@@ -58,19 +581,24 @@ class Transaction:
         self._conn.rollback()
         self._closed = True
 
-    def cursor(self):
+    def _cursor(self, cursor_factory, instrumented_factory):
         if self._closed:
             raise RuntimeError("Cannot open cursor from closed Transaction")
-        cur = self._conn.cursor()
-        cur.execute('SET search_path TO ag, barcodes, public, campaign')
+
+        stats = current_query_stats()
+        if stats is None:
+            return self._conn.cursor(cursor_factory=cursor_factory)
+
+        cur = self._conn.cursor(cursor_factory=instrumented_factory)
+        cur.query_stats = stats
         return cur
 
+    def cursor(self):
+        return self._cursor(psycopg2.extensions.cursor, _InstrumentedCursor)
+
     def dict_cursor(self):
-        if self._closed:
-            raise RuntimeError("Cannot open cursor from closed Transaction")
-        cur = self._conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute('SET search_path TO ag, barcodes, public, campaign')
-        return cur
+        return self._cursor(psycopg2.extras.DictCursor,
+                            _InstrumentedDictCursor)
 
     @property
     def conn(self):
@@ -1,4 +1,6 @@
 import pandas as pd
+from psycopg2.extras import execute_values
+
 from microsetta_private_api.repo.base_repo import BaseRepo
 from microsetta_private_api.model.vioscreen import (
     VioscreenSession, VioscreenPercentEnergy,
@@ -15,6 +17,47 @@ from microsetta_private_api.model.vioscreen import (
 from werkzeug.exceptions import NotFound
 
 
+# the most rows to send per INSERT statement; a single FFQ has hundreds of
+# food consumption rows, so this keeps the statements to a few per FFQ
+_INSERT_PAGE_SIZE = 1000
+
+
+def _insert_rows(cur, sql, rows):
+    """Insert rows with multi-row INSERT statements
+
+    Parameters
+    ----------
+    cur : psycopg2.cursor
+        The cursor to execute with
+    sql : str
+        The INSERT statement, with a single VALUES %s placeholder
+    rows : list of tuple
+        The rows to insert
+
+    Returns
+    -------
+    int
+        The number of inserted rows
+    """
+    if rows:
+        execute_values(cur, sql, rows, template=None,
+                       page_size=_INSERT_PAGE_SIZE)
+    return len(rows)
+
+
+def _check_codes(codes, known):
+    """Verify every code is known
+
+    Raises
+    ------
+    NotFound
+        A NotFound error is raised if any code is unrecognized
+    """
+    unknown = set(codes) - known.keys()
+    if unknown:
+        raise NotFound("No such code: " + sorted(unknown)[0])
+
+
 class VioscreenSessionRepo(BaseRepo):
     COLS = ["sessionId", "username", "protocolId", "status",
             "startDate", "endDate", "cultureCode", "created",
@@ -57,6 +100,41 @@ class VioscreenSessionRepo(BaseRepo):
                         tuple([getattr(session, attr) for attr in self.COLS]))
             return cur.rowcount == 1
 
+    def upsert_sessions(self, sessions):
+        """Insert or update many vioscreen sessions
+
+        Parameters
+        ----------
+        sessions : list of VioscreenSession
+            The session objects to insert or update. If a session is
+            repeated, its last occurrence is stored.
+
+        Returns
+        -------
+        int
+            The number of sessions inserted or updated
+        """
+        # a single statement cannot update a row twice
+        latest = {session.sessionId: session for session in sessions}
+        rows = [tuple([getattr(session, attr) for attr in self.COLS])
+                for session in latest.values()]
+
+        with self._transaction.cursor() as cur:
+            doupdateset = ["%s = EXCLUDED.%s" % (a, a) for a in self.COLS
+                           if a not in ('sessionId', 'username')]
+            doupdateset = ','.join(doupdateset)
+
+            return _insert_rows(cur,
+                                f"""INSERT INTO ag.vioscreen_sessions (
+                                        {self._sql_cols}
+                                        )
+                                    VALUES %s
+                                    ON CONFLICT (sessionId)
+                                    DO UPDATE SET
+                                        {doupdateset}
+                                    """,
+                                rows)
+
     def get_session(self, sessionId):
         """Obtain a session model for a sessionId
 
@@ -185,22 +263,51 @@ class VioscreenSessionRepo(BaseRepo):
             The third index is the exact status from Vioscreen, or None
                 if there is no FFQ associated with the sample.
         """
-        with self._transaction.cursor() as cur:
-            cur.execute("""SELECT status
-                           FROM ag.vioscreen_sessions AS vs
-                           JOIN ag.vioscreen_registry AS vr
-                               ON vs.username=vr.vio_id
-                           WHERE sample_id=%s""", (sample_uuid, ))
-            res = cur.fetchall()
-            if len(res) == 0:
-                return (False, False, None)
-            elif len(res) == 1:
-                status = res[0][0]
+        return self.get_ffq_statuses_by_samples([sample_uuid])[sample_uuid]
+
+    def get_ffq_statuses_by_samples(self, sample_uuids):
+        """Obtain the FFQ status of many samples at once
+
+        Parameters
+        ----------
+        sample_uuids : Iterable of UUID4
+            The UUIDs to check the status of
+
+        Returns
+        -------
+        dict
+            The status of each sample, as from get_ffq_status_by_sample,
+            keyed by sample UUID
+
+        Raises
+        ------
+        ValueError
+            If a sample has multiple FFQs
+        """
+        sample_uuids = tuple(set(sample_uuids))
+        statuses = {sample_uuid: [] for sample_uuid in sample_uuids}
+        if len(sample_uuids) > 0:
+            with self._transaction.cursor() as cur:
+                cur.execute("""SELECT sample_id, status
+                               FROM ag.vioscreen_sessions AS vs
+                               JOIN ag.vioscreen_registry AS vr
+                                   ON vs.username=vr.vio_id
+                               WHERE sample_id IN %s""", (sample_uuids, ))
+                for sample_uuid, status in cur.fetchall():
+                    statuses[sample_uuid].append(status)
+
+        result = {}
+        for sample_uuid, sample_statuses in statuses.items():
+            if len(sample_statuses) == 0:
+                result[sample_uuid] = (False, False, None)
+            elif len(sample_statuses) == 1:
+                status = sample_statuses[0]
                 is_complete = status == 'Finished'
                 is_taken = status in ('Started', 'Review', 'Finished')
-                return (is_complete, is_taken, status)
+                result[sample_uuid] = (is_complete, is_taken, status)
             else:
                 raise ValueError("A sample should not have multiple FFQs")
+        return result
 
     def get_missing_ffqs(self):
         """The set of valid sessions which lack FFQ data
@@ -213,6 +320,9 @@ class VioscreenSessionRepo(BaseRepo):
         3) the sessionId is not present in one of the vioscreen FFQ
            decomposed tables
 
+        Sessions which have not been attempted come first, followed by
+        those whose fetch failed the fewest times, least recently.
+
         Returns
         -------
         list of VioscreenSession
@@ -238,13 +348,60 @@ class VioscreenSessionRepo(BaseRepo):
                 # construct session objects for all of our missing sessions
                 cur.execute(f"""SELECT {self._sql_cols}
                                 FROM ag.vioscreen_sessions
-                                  WHERE sessionId IN %s""",
+                                LEFT JOIN ag.vioscreen_ffq_fetch_log
+                                    USING (sessionId)
+                                WHERE sessionId IN %s
+                                ORDER BY COALESCE(attempts, 0),
+                                    last_attempt NULLS FIRST,
+                                    sessionId""",
                             (tuple(sessions_without_data), ))
                 for row in cur.fetchall():
                     without_data.append(VioscreenSession(*row))
 
         return without_data
 
+    def record_ffq_fetch_failures(self, failures):
+        """Note failed attempts to fetch the FFQs of sessions
+
+        Parameters
+        ----------
+        failures : list of (str, str)
+            The sessionId of each session, and the reason its FFQ could not
+            be fetched
+        """
+        if len(failures) == 0:
+            return
+
+        with self._transaction.cursor() as cur:
+            execute_values(cur,
+                           """INSERT INTO ag.vioscreen_ffq_fetch_log
+                              (sessionId, last_error)
+                              VALUES %s
+                              ON CONFLICT (sessionId)
+                              DO UPDATE SET
+                                  attempts =
+                                      vioscreen_ffq_fetch_log.attempts + 1,
+                                  last_attempt = NOW(),
+                                  last_error = EXCLUDED.last_error""",
+                           # a session may only be updated once per statement
+                           list(dict(failures).items()))
+
+    def clear_ffq_fetch_failures(self, session_ids):
+        """Forget failed attempts to fetch the FFQs of sessions
+
+        Parameters
+        ----------
+        session_ids : list of str
+            The sessions whose FFQs have been fetched
+        """
+        if len(session_ids) == 0:
+            return
+
+        with self._transaction.cursor() as cur:
+            cur.execute("""DELETE FROM ag.vioscreen_ffq_fetch_log
+                           WHERE sessionId IN %s""",
+                        (tuple(session_ids), ))
+
 
 class VioscreenPercentEnergyRepo(BaseRepo):
     # code : (long description, short description, units)
@@ -262,6 +419,10 @@ class VioscreenPercentEnergyRepo(BaseRepo):
                             'Added Sugar', '%'),
               '%fat': ('Percent of calories from Fat', 'Fat', '%')}
 
+    _INSERT_SQL = """INSERT INTO ag.vioscreen_percentenergy
+                     (sessionId, code, amount)
+                     VALUES %s"""
+
     def __init__(self, transaction):
         super().__init__(transaction)
 
@@ -278,20 +439,14 @@ class VioscreenPercentEnergyRepo(BaseRepo):
             Returns number of rows modified
         """
         with self._transaction.cursor() as cur:
-            energy_components = vioscreen_percent_energy.energy_components
-            inserts = []
-            for energy_component in energy_components:
-                # checking if code exists in lookup
-                self._get_code_info(energy_component.code)
-                inserts.append((vioscreen_percent_energy.sessionId,
-                                energy_component.code,
-                                energy_component.amount))
-
-            cur.executemany("""INSERT INTO ag.vioscreen_percentenergy
-                                (sessionId, code, amount)
-                                VALUES (%s, %s, %s)""",
-                            inserts)
-            return cur.rowcount
+            return _insert_rows(cur, self._INSERT_SQL,
+                                self._rows(vioscreen_percent_energy))
+
+    def _rows(self, vioscreen_percent_energy):
+        components = vioscreen_percent_energy.energy_components
+        _check_codes([c.code for c in components], self._CODES)
+        return [(vioscreen_percent_energy.sessionId, c.code, c.amount)
+                for c in components]
 
     def get_percent_energy(self, sessionId):
         """Obtain the percent energy data for a sessionId
@@ -313,21 +468,23 @@ class VioscreenPercentEnergyRepo(BaseRepo):
                            WHERE sessionId = %s""",
                         (sessionId,))
 
-            rows = cur.fetchall()
-            if len(rows) > 0:
-                components = []
-                for code, amount in rows:
-                    codeInfo = self._get_code_info(code)
-                    vpec = VioscreenPercentEnergyComponent(code=code,
-                                                           description=codeInfo[0],  # noqa
-                                                           short_description=codeInfo[1],  # noqa
-                                                           units=codeInfo[2],
-                                                           amount=amount)
-                    components.append(vpec)
-                return VioscreenPercentEnergy(sessionId=sessionId,
-                                              energy_components=components)
-            else:
-                return None
+            return self._model(sessionId, cur.fetchall())
+
+    def _model(self, sessionId, rows):
+        if len(rows) > 0:
+            components = []
+            for code, amount in rows:
+                codeInfo = self._get_code_info(code)
+                vpec = VioscreenPercentEnergyComponent(code=code,
+                                                       description=codeInfo[0],  # noqa
+                                                       short_description=codeInfo[1],  # noqa
+                                                       units=codeInfo[2],
+                                                       amount=amount)
+                components.append(vpec)
+            return VioscreenPercentEnergy(sessionId=sessionId,
+                                          energy_components=components)
+        else:
+            return None
 
     def _get_code_info(self, code):
         """Obtain the detail about a particular energy component by its code
@@ -390,6 +547,10 @@ class VioscreenDietaryScoreRepo(BaseRepo):
             'TotalScore': ('Total HEI Score', 0.0, 100.0)},
         }
 
+    _INSERT_SQL = """INSERT INTO ag.vioscreen_dietaryscore
+                     (sessionId, scoresType, code, score)
+                     VALUES %s"""
+
     def __init__(self, transaction):
         super().__init__(transaction)
 
@@ -406,25 +567,20 @@ class VioscreenDietaryScoreRepo(BaseRepo):
         int
             The number of inserted rows
         """
-        count = 0
         with self._transaction.cursor() as cur:
-            for model in vioscreen_dietary_scores:
-                scores = model.scores
-                inserts = []
-                for score in scores:
-                    # checking if code exists in lookup
-                    self._get_code_info(model.scoresType, score.code)
-                    inserts.append((model.sessionId,
-                                    model.scoresType,
-                                    score.code,
-                                    score.score))
-
-                cur.executemany("""INSERT INTO ag.vioscreen_dietaryscore
-                                    (sessionId, scoresType, code, score)
-                                    VALUES (%s, %s, %s, %s)""",
-                                inserts)
-                count += cur.rowcount
-        return count
+            return _insert_rows(cur, self._INSERT_SQL,
+                                self._rows(vioscreen_dietary_scores))
+
+    def _rows(self, vioscreen_dietary_scores):
+        rows = []
+        for model in vioscreen_dietary_scores:
+            if model.scoresType not in self._CODES:
+                raise NotFound("No such scoresType: " + model.scoresType)
+            _check_codes([s.code for s in model.scores],
+                         self._CODES[model.scoresType])
+            rows.extend((model.sessionId, model.scoresType, s.code, s.score)
+                        for s in model.scores)
+        return rows
 
     def get_dietary_scores(self, sessionId):
         """Obtain the dietary score detail for a particular session
@@ -532,6 +688,10 @@ class VioscreenDietaryScoreRepo(BaseRepo):
 
 
 class VioscreenSupplementsRepo(BaseRepo):
+    _INSERT_SQL = """INSERT INTO ag.vioscreen_supplements
+                     (sessionId, supplement, frequency, amount, average)
+                     VALUES %s"""
+
     def __init__(self, transaction):
         super().__init__(transaction)
 
@@ -549,20 +709,16 @@ class VioscreenSupplementsRepo(BaseRepo):
             The number of inserted rows
         """
         with self._transaction.cursor() as cur:
-            components = vioscreen_supplements.supplements_components
-            inserts = [(vioscreen_supplements.sessionId,
-                        component.supplement,
-                        component.frequency,
-                        component.amount,
-                        component.average)
-                       for component in components]
-
-            cur.executemany("""INSERT INTO ag.vioscreen_supplements
-                                (sessionId, supplement, frequency,
-                                 amount, average)
-                                VALUES (%s, %s, %s, %s, %s)""",
-                            inserts)
-            return cur.rowcount
+            return _insert_rows(cur, self._INSERT_SQL,
+                                self._rows(vioscreen_supplements))
+
+    def _rows(self, vioscreen_supplements):
+        return [(vioscreen_supplements.sessionId,
+                 component.supplement,
+                 component.frequency,
+                 component.amount,
+                 component.average)
+                for component in vioscreen_supplements.supplements_components]
 
     def get_supplements(self, sessionId):
         """Obtain the supplement detail for a particular session
@@ -779,6 +935,10 @@ class VioscreenFoodComponentsRepo(BaseRepo):
               'omega6_la': ('pfa182 + pfa204, la = linoleic acid', 'g',
                             'Amount')}
 
+    _INSERT_SQL = """INSERT INTO ag.vioscreen_foodcomponents
+                     (sessionId, code, amount)
+                     VALUES %s"""
+
     def __init__(self, transaction):
         super().__init__(transaction)
 
@@ -796,20 +956,14 @@ class VioscreenFoodComponentsRepo(BaseRepo):
             The number of inserted rows
         """
         with self._transaction.cursor() as cur:
-            components = vioscreen_food_components.components
-            inserts = []
-            for component in components:
-                # checking if code exists in lookup
-                self._get_code_info(component.code)
-                inserts.append((vioscreen_food_components.sessionId,
-                                component.code,
-                                component.amount))
-
-            cur.executemany("""INSERT INTO ag.vioscreen_foodcomponents
-                                (sessionId, code, amount)
-                                VALUES (%s, %s, %s)""",
-                            inserts)
-            return cur.rowcount
+            return _insert_rows(cur, self._INSERT_SQL,
+                                self._rows(vioscreen_food_components))
+
+    def _rows(self, vioscreen_food_components):
+        components = vioscreen_food_components.components
+        _check_codes([c.code for c in components], self._CODES)
+        return [(vioscreen_food_components.sessionId, c.code, c.amount)
+                for c in components]
 
     def get_food_components(self, sessionId):
         """Obtain the food components detail for a particular session
@@ -830,21 +984,23 @@ class VioscreenFoodComponentsRepo(BaseRepo):
                            WHERE sessionId = %s""",
                         (sessionId,))
 
-            rows = cur.fetchall()
-            if len(rows) > 0:
-                components = []
-                for code, amount in rows:
-                    codeInfo = self._get_code_info(code)
-                    vfcc = VioscreenFoodComponentsComponent(code=code,
-                                                            description=codeInfo[0],  # noqa
-                                                            units=codeInfo[1],  # noqa
-                                                            amount=amount,
-                                                            valueType=codeInfo[2])  # noqa
-                    components.append(vfcc)
-                return VioscreenFoodComponents(sessionId=sessionId,
-                                               components=components)
-            else:
-                return None
+            return self._model(sessionId, cur.fetchall())
+
+    def _model(self, sessionId, rows):
+        if len(rows) > 0:
+            components = []
+            for code, amount in rows:
+                codeInfo = self._get_code_info(code)
+                vfcc = VioscreenFoodComponentsComponent(code=code,
+                                                        description=codeInfo[0],  # noqa
+                                                        units=codeInfo[1],  # noqa
+                                                        amount=amount,
+                                                        valueType=codeInfo[2])  # noqa
+                components.append(vfcc)
+            return VioscreenFoodComponents(sessionId=sessionId,
+                                           components=components)
+        else:
+            return None
 
     def _get_code_info(self, code):
         """Obtain the detail about a particular food component by its code
@@ -921,6 +1077,10 @@ class VioscreenEatingPatternsRepo(BaseRepo):
               'SOYFOODS': ('Eating Pattern', 'PerDay', 'Amount'),
               'VEGSUMM': ('Eating Pattern', 'PerDay', 'Amount')}
 
+    _INSERT_SQL = """INSERT INTO ag.vioscreen_eatingpatterns
+                     (sessionId, code, amount)
+                     VALUES %s"""
+
     def __init__(self, transaction):
         super().__init__(transaction)
 
@@ -938,20 +1098,14 @@ class VioscreenEatingPatternsRepo(BaseRepo):
             The number of inserted rows
         """
         with self._transaction.cursor() as cur:
-            components = vioscreen_eating_patterns.components
-            inserts = []
-            for component in components:
-                # checking if code exists in lookup
-                self._get_code_info(component.code)
-                inserts.append((vioscreen_eating_patterns.sessionId,
-                                component.code,
-                                component.amount))
-
-            cur.executemany("""INSERT INTO ag.vioscreen_eatingpatterns
-                                (sessionId, code, amount)
-                                VALUES (%s, %s, %s)""",
-                            inserts)
-            return cur.rowcount
+            return _insert_rows(cur, self._INSERT_SQL,
+                                self._rows(vioscreen_eating_patterns))
+
+    def _rows(self, vioscreen_eating_patterns):
+        components = vioscreen_eating_patterns.components
+        _check_codes([c.code for c in components], self._CODES)
+        return [(vioscreen_eating_patterns.sessionId, c.code, c.amount)
+                for c in components]
 
     def get_eating_patterns(self, sessionId):
         """Obtain the eating patterns detail for a particular session
@@ -972,21 +1126,23 @@ class VioscreenEatingPatternsRepo(BaseRepo):
                            WHERE sessionId = %s""",
                         (sessionId,))
 
-            rows = cur.fetchall()
-            if len(rows) > 0:
-                components = []
-                for code, amount in rows:
-                    codeInfo = self._get_code_info(code)
-                    vepc = VioscreenEatingPatternsComponent(code=code,
-                                                            description=codeInfo[0],  # noqa
-                                                            units=codeInfo[1],  # noqa
-                                                            amount=amount,
-                                                            valueType=codeInfo[2])  # noqa
-                    components.append(vepc)
-                return VioscreenEatingPatterns(sessionId=sessionId,
-                                               components=components)
-            else:
-                return None
+            return self._model(sessionId, cur.fetchall())
+
+    def _model(self, sessionId, rows):
+        if len(rows) > 0:
+            components = []
+            for code, amount in rows:
+                codeInfo = self._get_code_info(code)
+                vepc = VioscreenEatingPatternsComponent(code=code,
+                                                        description=codeInfo[0],  # noqa
+                                                        units=codeInfo[1],  # noqa
+                                                        amount=amount,
+                                                        valueType=codeInfo[2])  # noqa
+                components.append(vepc)
+            return VioscreenEatingPatterns(sessionId=sessionId,
+                                           components=components)
+        else:
+            return None
 
     def _get_code_info(self, code):
         """Obtain the detail about a particular eating pattern by its code
@@ -1096,6 +1252,10 @@ class VioscreenMPedsRepo(BaseRepo):
               'wgrain': ('Whole Grains (ounce equivalents)', 'oz_eq',
                          'Amount')}
 
+    _INSERT_SQL = """INSERT INTO ag.vioscreen_mpeds
+                     (sessionId, code, amount)
+                     VALUES %s"""
+
     def __init__(self, transaction):
         super().__init__(transaction)
 
@@ -1113,20 +1273,14 @@ class VioscreenMPedsRepo(BaseRepo):
             The number of inserted rows
         """
         with self._transaction.cursor() as cur:
-            components = vioscreen_mpeds.components
-            inserts = []
-            for component in components:
-                # checking if code exists in lookup
-                self._get_code_info(component.code)
-                inserts.append((vioscreen_mpeds.sessionId,
-                                component.code,
-                                component.amount))
-
-            cur.executemany("""INSERT INTO ag.vioscreen_mpeds
-                                (sessionId, code, amount)
-                                VALUES (%s, %s, %s)""",
-                            inserts)
-            return cur.rowcount
+            return _insert_rows(cur, self._INSERT_SQL,
+                                self._rows(vioscreen_mpeds))
+
+    def _rows(self, vioscreen_mpeds):
+        components = vioscreen_mpeds.components
+        _check_codes([c.code for c in components], self._CODES)
+        return [(vioscreen_mpeds.sessionId, c.code, c.amount)
+                for c in components]
 
     def get_mpeds(self, sessionId):
         """Obtain the mpeds detail for a particular session
@@ -1147,21 +1301,23 @@ class VioscreenMPedsRepo(BaseRepo):
                            WHERE sessionId = %s""",
                         (sessionId,))
 
-            rows = cur.fetchall()
-            if len(rows) > 0:
-                components = []
-                for code, amount in rows:
-                    codeInfo = self._get_code_info(code)
-                    vmpc = VioscreenMPedsComponent(code=code,
-                                                   description=codeInfo[0],  # noqa
-                                                   units=codeInfo[1],  # noqa
-                                                   amount=amount,
-                                                   valueType=codeInfo[2])
-                    components.append(vmpc)
-                return VioscreenMPeds(sessionId=sessionId,
-                                      components=components)
-            else:
-                return None
+            return self._model(sessionId, cur.fetchall())
+
+    def _model(self, sessionId, rows):
+        if len(rows) > 0:
+            components = []
+            for code, amount in rows:
+                codeInfo = self._get_code_info(code)
+                vmpc = VioscreenMPedsComponent(code=code,
+                                               description=codeInfo[0],
+                                               units=codeInfo[1],
+                                               amount=amount,
+                                               valueType=codeInfo[2])
+                components.append(vmpc)
+            return VioscreenMPeds(sessionId=sessionId,
+                                  components=components)
+        else:
+            return None
 
     def _get_code_info(self, code):
         """Obtain the detail about a particular mped by its code
@@ -1375,6 +1531,17 @@ class VioscreenFoodConsumptionRepo(BaseRepo):
               'omega6_la': ('pfa182 + pfa204, la = linoleic acid', 'g',
                             'Amount')}
 
+    _INSERT_SQL = """INSERT INTO ag.vioscreen_foodconsumption
+                     (sessionId, foodCode, description, foodGroup,
+                      amount, frequency, consumptionAdjustment,
+                      servingSizeText, servingFrequencyText, created)
+                     VALUES %s"""
+
+    _INSERT_COMPONENTS_SQL = """
+        INSERT INTO ag.vioscreen_foodconsumptioncomponents
+        (sessionId, description, code, amount)
+        VALUES %s"""
+
     def __init__(self, transaction):
         super().__init__(transaction)
 
@@ -1392,50 +1559,37 @@ class VioscreenFoodConsumptionRepo(BaseRepo):
             The number of inserted rows
         """
         with self._transaction.cursor() as cur:
-            rowcount = 0
-            components = vioscreen_food_consumption.components
-
-            component_inserts = []
-            component_consumption_inserts = []
-            for component in components:
-                component_inserts.append((
-                    vioscreen_food_consumption.sessionId,
-                    component.foodCode,
-                    component.description,
-                    component.foodGroup,
-                    component.amount,
-                    component.frequency,
-                    component.consumptionAdjustment,
-                    component.servingSizeText,
-                    component.servingFrequencyText,
-                    component.created))
-
-                for component2 in component.data:
-                    # checking if code exists in lookup
-                    self._get_code_info(component2.code)
-                    component_consumption_inserts.append((
-                        vioscreen_food_consumption.sessionId,
-                        component.description,
-                        component2.code,
-                        component2.amount))
-
-            cur.executemany("""INSERT INTO ag.vioscreen_foodconsumption
-                               (sessionId, foodCode, description, foodGroup,
-                                amount, frequency, consumptionAdjustment,
-                                servingSizeText, servingFrequencyText, created)
-                               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                            """, component_inserts)
-            rowcount += cur.rowcount
-
-            cur.executemany("""
-                            INSERT INTO ag.vioscreen_foodconsumptioncomponents
-                            (sessionId, description, code, amount)
-                            VALUES (%s, %s, %s, %s)""",
-                            component_consumption_inserts)
-            rowcount += cur.rowcount
-
+            rowcount = _insert_rows(
+                cur, self._INSERT_SQL,
+                self._rows(vioscreen_food_consumption))
+            rowcount += _insert_rows(
+                cur, self._INSERT_COMPONENTS_SQL,
+                self._component_rows(vioscreen_food_consumption))
             return rowcount
 
+    def _rows(self, vioscreen_food_consumption):
+        return [(vioscreen_food_consumption.sessionId,
+                 component.foodCode,
+                 component.description,
+                 component.foodGroup,
+                 component.amount,
+                 component.frequency,
+                 component.consumptionAdjustment,
+                 component.servingSizeText,
+                 component.servingFrequencyText,
+                 component.created)
+                for component in vioscreen_food_consumption.components]
+
+    def _component_rows(self, vioscreen_food_consumption):
+        rows = [(vioscreen_food_consumption.sessionId,
+                 component.description,
+                 component2.code,
+                 component2.amount)
+                for component in vioscreen_food_consumption.components
+                for component2 in component.data]
+        _check_codes([row[2] for row in rows], self._CODES)
+        return rows
+
     def get_food_consumption(self, sessionId):
         """Obtain the food consumption detail for a particular session
 
@@ -1449,12 +1603,6 @@ class VioscreenFoodConsumptionRepo(BaseRepo):
         VioscreenFoodConsumption or None
             The food consumption detail, or None if no record was found
         """
-        # TODO: it may be possible to do this all in a single query. An
-        # attempt was made using array_agg(code, amount), however postgres
-        # coerces that to a string. A two dimensional array is possible with
-        # array_agg(array[code, amount]) however the types need to be the
-        # same (as best as I understand), leading to some theatrics on
-        # formatting and parsing. A problem for another day.
         with self._transaction.cursor() as cur:
             cur.execute(
                 """SELECT foodCode, description, foodGroup, amount, frequency,
@@ -1462,49 +1610,53 @@ class VioscreenFoodConsumptionRepo(BaseRepo):
                            servingFrequencyText, created
                    FROM ag.vioscreen_foodconsumption
                    WHERE sessionId = %s""", (sessionId,))
-
             rows = cur.fetchall()
-            if len(rows) > 0:
-                components = []
-                for (foodCode, description, foodGroup, amount_outer, frequency,
-                     consumptionAdjustment, servingSizeText,
-                     servingFrequencyText, created) in rows:
-                    cur.execute("""SELECT code, amount
-                                   FROM ag.vioscreen_foodconsumptioncomponents
-                                   WHERE sessionId = %s AND description = %s
-                                """,
-                                (sessionId, description))
-                    rows2 = cur.fetchall()
-
-                    components2 = []
-                    for code, amount in rows2:
-                        codeInfo = self._get_code_info(code)
-                        vfcc2 = VioscreenFoodComponentsComponent(
-                            code=code,
-                            description=codeInfo[0],
-                            units=codeInfo[1],
-                            amount=amount,
-                            valueType=codeInfo[2])
-                        components2.append(vfcc2)
-
-                    vfcc = VioscreenFoodConsumptionComponent(
-                        foodCode=foodCode,
-                        description=description,
-                        foodGroup=foodGroup,
-                        amount=amount_outer,
-                        frequency=frequency,
-                        consumptionAdjustment=consumptionAdjustment,
-                        servingSizeText=servingSizeText,
-                        servingFrequencyText=servingFrequencyText,
-                        created=created,
-                        data=components2)
-                    components.append(vfcc)
-
-                return VioscreenFoodConsumption(sessionId=sessionId,
-                                                components=components)
-            else:
+            if len(rows) == 0:
                 return None
 
+            # the components of every food are read at once, and matched
+            # to their food by description below
+            cur.execute("""SELECT description, code, amount
+                           FROM ag.vioscreen_foodconsumptioncomponents
+                           WHERE sessionId = %s""",
+                        (sessionId,))
+            return self._model(sessionId, rows, cur.fetchall())
+
+    def _model(self, sessionId, rows, component_rows):
+        if len(rows) == 0:
+            return None
+
+        by_description = {}
+        for description, code, amount in component_rows:
+            codeInfo = self._get_code_info(code)
+            vfcc2 = VioscreenFoodComponentsComponent(
+                code=code,
+                description=codeInfo[0],
+                units=codeInfo[1],
+                amount=amount,
+                valueType=codeInfo[2])
+            by_description.setdefault(description, []).append(vfcc2)
+
+        components = []
+        for (foodCode, description, foodGroup, amount_outer, frequency,
+             consumptionAdjustment, servingSizeText,
+             servingFrequencyText, created) in rows:
+            vfcc = VioscreenFoodConsumptionComponent(
+                foodCode=foodCode,
+                description=description,
+                foodGroup=foodGroup,
+                amount=amount_outer,
+                frequency=frequency,
+                consumptionAdjustment=consumptionAdjustment,
+                servingSizeText=servingSizeText,
+                servingFrequencyText=servingFrequencyText,
+                created=created,
+                data=list(by_description.get(description, [])))
+            components.append(vfcc)
+
+        return VioscreenFoodConsumption(sessionId=sessionId,
+                                        components=components)
+
     def _get_code_info(self, code):
         """Obtain the detail about a particular food consumption component by
         its code
@@ -1544,6 +1696,20 @@ class VioscreenRepo(BaseRepo):
         ffq : VioscreenComposite instance
             A complete ffq
         """
+        self.insert_ffqs([ffq])
+
+    def insert_ffqs(self, ffqs):
+        """Represent many ffq instances in our database
+
+        The rows of all the ffqs are staged before anything is written, so
+        that each table is loaded with a few multi-row statements no matter
+        how many ffqs are given.
+
+        Parameters
+        ----------
+        ffqs : list of VioscreenComposite
+            Complete ffqs
+        """
         sess = VioscreenSessionRepo(self._transaction)
         supp = VioscreenSupplementsRepo(self._transaction)
         scores = VioscreenDietaryScoreRepo(self._transaction)
@@ -1553,14 +1719,35 @@ class VioscreenRepo(BaseRepo):
         mpeds = VioscreenMPedsRepo(self._transaction)
         cons = VioscreenFoodConsumptionRepo(self._transaction)
 
-        sess.upsert_session(ffq.session)
-        energy.insert_percent_energy(ffq.percent_energy)
-        scores.insert_dietary_scores(ffq.dietary_scores)
-        supp.insert_supplements(ffq.supplements)
-        food.insert_food_components(ffq.food_components)
-        patterns.insert_eating_patterns(ffq.eating_patterns)
-        mpeds.insert_mpeds(ffq.mpeds)
-        cons.insert_food_consumption(ffq.food_consumption)
+        # (INSERT statement, row builder, ffq attribute), in the order the
+        # tables were historically written
+        stages = [
+            (energy._INSERT_SQL, energy._rows, 'percent_energy'),
+            (scores._INSERT_SQL, scores._rows, 'dietary_scores'),
+            (supp._INSERT_SQL, supp._rows, 'supplements'),
+            (food._INSERT_SQL, food._rows, 'food_components'),
+            (patterns._INSERT_SQL, patterns._rows, 'eating_patterns'),
+            (mpeds._INSERT_SQL, mpeds._rows, 'mpeds'),
+            (cons._INSERT_SQL, cons._rows, 'food_consumption'),
+            (cons._INSERT_COMPONENTS_SQL, cons._component_rows,
+             'food_consumption')]
+
+        # build every row first, so an unrecognized code is found before
+        # anything is written
+        staged = []
+        for sql, make_rows, attr in stages:
+            rows = []
+            for ffq in ffqs:
+                rows.extend(make_rows(getattr(ffq, attr)))
+            staged.append((sql, rows))
+
+        sess.upsert_sessions([ffq.session for ffq in ffqs])
+        with self._transaction.cursor() as cur:
+            for sql, rows in staged:
+                _insert_rows(cur, sql, rows)
+
+        sess.clear_ffq_fetch_failures(
+            [ffq.session.sessionId for ffq in ffqs])
 
     def get_ffq(self, session_id):
         """Obtain a complete ffq
@@ -1585,13 +1772,31 @@ class VioscreenRepo(BaseRepo):
         cons = VioscreenFoodConsumptionRepo(self._transaction)
 
         session = sess.get_session(session_id)
-        percent_energy = energy.get_percent_energy(session_id)
+        if session is None:
+            return None
+
+        # the tables of (code, amount) rows are read together
+        code_tables = {'percentenergy': energy,
+                       'foodcomponents': food,
+                       'eatingpatterns': patterns,
+                       'mpeds': mpeds}
+        code_rows = {table: [] for table in code_tables}
+        with self._transaction.cursor() as cur:
+            cur.execute(" UNION ALL ".join(
+                f"""(SELECT '{table}', code, amount
+                     FROM ag.vioscreen_{table}
+                     WHERE sessionId = %(session_id)s)"""
+                for table in code_tables),
+                {'session_id': session_id})
+            for table, code, amount in cur.fetchall():
+                code_rows[table].append((code, amount))
+
+        percent_energy, food_components, eating_patterns, mpeds = [
+            repo._model(session_id, code_rows[table])
+            for table, repo in code_tables.items()]
+        food_consumption = cons.get_food_consumption(session_id)
         dietary_scores = scores.get_dietary_scores(session_id)
         supplements = supp.get_supplements(session_id)
-        eating_patterns = patterns.get_eating_patterns(session_id)
-        mpeds = mpeds.get_mpeds(session_id)
-        food_consumption = cons.get_food_consumption(session_id)
-        food_components = food.get_food_components(session_id)
 
         return VioscreenComposite(session, percent_energy, dietary_scores,
                                   supplements, food_components,
@@ -8,6 +8,8 @@ from flask import jsonify, request
 from flask_babel import Babel
 
 from microsetta_private_api.exceptions import RepoException
+from microsetta_private_api.repo.transaction import Transaction, \
+    begin_query_stats, end_query_stats
 from microsetta_private_api.celery_utils import celery, init_celery
 from microsetta_private_api.localization import EN_US, ES_MX, ES_ES, JA_JP
 
@@ -42,6 +44,24 @@ def handle_422(repo_exc):
     return jsonify(code=422, message=str(repo_exc)), 422
 
 
+def begin_request_query_stats():
+    flask.g.query_stats = begin_query_stats(
+        f"{request.method} {request.path}")
+
+
+def add_query_stats_header(response):
+    stats = flask.g.get('query_stats')
+    if stats is not None and SERVER_CONFIG['debug']:
+        response.headers['X-SQL-Stats'] = stats.header(
+            SERVER_CONFIG.get('sql_repeat_threshold', 10))
+    return response
+
+
+def end_request_query_stats(exc):
+    # a teardown, so that collection ends even if the request raised
+    end_query_stats(flask.g.pop('query_stats', None))
+
+
 def build_app():
     # Create the application instance
     app = connexion.FlaskApp(__name__)
@@ -68,6 +88,14 @@ def build_app():
     # Set mapping from exception type to response code
     app.app.register_error_handler(RepoException, handle_422)
 
+    # return any database connection held by the request to the pool
+    app.app.teardown_request(Transaction.release_request_connection)
+
+    # collect SQL statistics per request, if enabled
+    app.app.before_request(begin_request_query_stats)
+    app.app.after_request(add_query_stats_header)
+    app.app.teardown_request(end_request_query_stats)
+
     # attach the reverse proxy mechanism
     app.app.wsgi_app = ReverseProxied(app.app.wsgi_app)
 
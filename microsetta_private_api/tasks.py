@@ -4,13 +4,17 @@ from microsetta_private_api.model.log_event import EventType, EventSubtype
 from microsetta_private_api.admin.email_templates import EmailMessage, \
     BasicEmailMessage
 import flask_babel
-from microsetta_private_api.admin.sample_summary import per_sample
+from microsetta_private_api.admin.sample_summary import iter_per_sample, \
+    write_summaries_csv
 from microsetta_private_api.repo.transaction import Transaction
 from microsetta_private_api.repo.admin_repo import AdminRepo
 from microsetta_private_api.repo.qiita_repo import QiitaRepo
+from microsetta_private_api.repo.summary_export_repo import SummaryExportRepo
+from microsetta_private_api.repo.interested_user_repo import \
+    InterestedUserRepo
+from microsetta_private_api.util.melissa import verify_addresses
 from microsetta_private_api.localization import EN_US, JA_JP
 from microsetta_private_api.config_manager import SERVER_CONFIG
-import pandas as pd
 import tempfile
 import os
 import datetime
@@ -40,32 +44,84 @@ def send_basic_email(to_email, subject, template_base_fp, req_template_keys,
     SendEmail.send(to_email, msg_obj, msg_args, from_email, **kwargs)
 
 
+_SUMMARY_EXTENSIONS = {None: '.csv', 'gzip': '.csv.gz', 'zip': '.zip'}
+
+
 @celery.task(ignore_result=True)
-def per_sample_summary(email, project, strip_sampleid):
-    with Transaction() as t:
+def per_sample_summary(email, project, strip_sampleid, compression=None):
+    """Email the summary of the samples of a project as a CSV
+
+    Summaries are written to the file as they are produced, so that memory
+    use does not grow with the size of the project. If the file exceeds the
+    summary_attachment_max_bytes server configuration, it is stored for
+    summary_download_ttl seconds, and the email links to it rather than
+    attaching it.
+
+    Parameters
+    ----------
+    email : str
+        The address to send the summary to
+    project : int
+        The project to summarize
+    strip_sampleid : bool
+        Whether to omit barcodes from the summary
+    compression : {'gzip', 'zip', 'none'}, optional
+        How to compress the CSV. If not specified, the summary_compression
+        server configuration is used.
+    """
+    if compression is None:
+        compression = SERVER_CONFIG.get('summary_compression', 'gzip')
+    if compression == 'none':
+        compression = None
+
+    with Transaction(read_only=True) as t:
         admin = AdminRepo(t)
         project_name = admin.get_project_name(project)
 
-    summaries = per_sample(project, barcodes=None,
-                           strip_sampleid=strip_sampleid)
-    df = pd.DataFrame(summaries)
-    _, path = tempfile.mkstemp()
-    df.to_csv(path)
     date = datetime.datetime.now().strftime("%d%b%Y")
-    filename = f'project-{project_name}-summary-{date}.csv'
-
-    # NOTE: we are not using .delay so this action remains
-    # within the current celery task
-    template_args = {'date': date, 'project': project_name}
-    send_basic_email(email,
-                     f"[TMI-summary] Project {project}",
-                     'email/sample_summary',
-                     list(template_args),
-                     template_args,
-                     "EMAIL", "EMAIL_PER_PROJECT_SUMMARY",
-                     attachment_filepath=path,
-                     attachment_filename=filename)
-    os.remove(path)
+    basename = f'project-{project_name}-summary-{date}'
+    filename = basename + _SUMMARY_EXTENSIONS[compression]
+
+    _, path = tempfile.mkstemp()
+    try:
+        summaries = iter_per_sample(project, barcodes=None,
+                                    strip_sampleid=strip_sampleid)
+        write_summaries_csv(summaries, path, compression,
+                            member_name=f'{basename}.csv')
+
+        template_args = {'date': date, 'project': project_name}
+        attachment = {'attachment_filepath': path,
+                      'attachment_filename': filename}
+
+        max_bytes = SERVER_CONFIG.get('summary_attachment_max_bytes',
+                                      10 * 1024 * 1024)
+        if os.path.getsize(path) > max_bytes:
+            ttl = SERVER_CONFIG.get('summary_download_ttl', 24 * 60 * 60)
+            with Transaction() as t:
+                export_repo = SummaryExportRepo(t)
+                export_repo.delete_expired_exports()
+                token = export_repo.create_export(project, filename, path,
+                                                  ttl)
+                t.commit()
+
+            expiration = datetime.datetime.now() + \
+                datetime.timedelta(seconds=ttl)
+            template_args['download_url'] = \
+                f"{SERVER_CONFIG['endpoint']}/api/admin/summary_exports/{token}"  # noqa
+            template_args['expiration'] = expiration.strftime("%d%b%Y %H:%M")
+            attachment = {}
+
+        # NOTE: we are not using .delay so this action remains
+        # within the current celery task
+        send_basic_email(email,
+                         f"[TMI-summary] Project {project}",
+                         'email/sample_summary',
+                         list(template_args),
+                         template_args,
+                         "EMAIL", "EMAIL_PER_PROJECT_SUMMARY",
+                         **attachment)
+    finally:
+        os.remove(path)
 
 
 @celery.task(ignore_result=True)
@@ -86,3 +142,82 @@ def update_qiita_metadata():
                        {"what": "qiita metadata push errors",
                         "content": json.dumps(error, indent=2)},
                        EN_US)
+
+
+@celery.task(ignore_result=True)
+def verify_interested_user_addresses(limit=None):
+    """Verify the addresses of interested users which have not been checked
+
+    Addresses are sent to Melissa in batches of melissa_batch_size, and the
+    results of each batch are stored before the next is sent. An address
+    which cannot be verified is left unchecked, and is not retried until
+    the next sweep.
+
+    Parameters
+    ----------
+    limit : int, optional
+        The most addresses to verify. If not specified, the
+        melissa_sweep_limit server configuration is used.
+
+    Returns
+    -------
+    int
+        The number of interested users updated
+    """
+    if limit is None:
+        limit = SERVER_CONFIG.get('melissa_sweep_limit', 5000)
+    batch_size = SERVER_CONFIG.get('melissa_batch_size', 100)
+
+    after = None
+    checked = 0
+    updated = 0
+    while checked < limit:
+        with Transaction(read_only=True) as t:
+            unchecked = InterestedUserRepo(t).get_unchecked_addresses(
+                min(batch_size, limit - checked), after)
+        if len(unchecked) == 0:
+            break
+
+        after = unchecked[-1]['interested_user_id']
+        checked += len(unchecked)
+
+        results = verify_addresses(unchecked)
+        with Transaction() as t:
+            updated += InterestedUserRepo(t).update_address_verifications(
+                [(a, r) for a, r in zip(unchecked, results) if r is not None])
+            t.commit()
+
+    return updated
+
+
+@celery.task(ignore_result=True)
+def refresh_project_statistics(force=False):
+    """Rebuild the stored project statistics if they are out of date
+
+    The statistics are out of date if a project has none stored, if a scan
+    or kit of a project was created since they were stored, or if they are
+    older than the project_statistics_max_age server configuration, which
+    bounds how long changes made by other means go unnoticed.
+
+    Parameters
+    ----------
+    force : bool, optional
+        If True, the statistics are rebuilt even if they are up to date
+
+    Returns
+    -------
+    int
+        The number of projects whose statistics were rebuilt
+    """
+    max_age = SERVER_CONFIG.get('project_statistics_max_age', 60 * 60)
+
+    with Transaction() as t:
+        admin_repo = AdminRepo(t)
+        if not force and not admin_repo.project_statistics_need_refresh(
+                max_age):
+            return 0
+
+        n_refreshed = admin_repo.refresh_project_statistics()
+        t.commit()
+
+    return n_refreshed
@@ -1,27 +1,107 @@
 import json
+import re
 import requests
+import string
+import threading
+import time
 import urllib.parse
+from collections import OrderedDict
 
+from flask import current_app
+
+from microsetta_private_api.celery_utils import celery
+from microsetta_private_api.repo.account_repo import AccountRepo
 from microsetta_private_api.repo.transaction import Transaction
 from microsetta_private_api.repo.google_geocoding_repo import\
     GoogleGeocodingRepo
 from microsetta_private_api.config_manager import SERVER_CONFIG
 
 
+class _GeocodingCache:
+    """A process-wide LRU of parsed geocoding responses
+
+    Entries are keyed by request address, and are kept for at most
+    geocoding_cache_ttl seconds and geocoding_cache_size entries. Only
+    addresses whose response is stored in ag.google_geocoding are cached,
+    so the cache never holds what the database does not.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _max_size():
+        return SERVER_CONFIG.get('geocoding_cache_size', 4096)
+
+    @staticmethod
+    def _ttl():
+        return SERVER_CONFIG.get('geocoding_cache_ttl', 24 * 60 * 60)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, request_address):
+        """Obtain the parsed response of an address, or None if absent"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(request_address)
+            if entry is None:
+                return None
+
+            expires, parsed = entry
+            if expires <= now:
+                del self._entries[request_address]
+                return None
+
+            self._entries.move_to_end(request_address)
+            return parsed
+
+    def put(self, request_address, parsed):
+        max_size = self._max_size()
+        if max_size <= 0:
+            return
+
+        expires = time.monotonic() + self._ttl()
+        with self._lock:
+            self._entries[request_address] = (expires, parsed)
+            self._entries.move_to_end(request_address)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+
+_GEOCODING_CACHE = _GeocodingCache()
+
+# uppercases ASCII letters only, as TRANSLATE does in patch 0140
+_ASCII_UPPER = str.maketrans(string.ascii_lowercase, string.ascii_uppercase)
+
+
+def clear_geocoding_cache():
+    """Empty the geocoding cache of this process"""
+    _GEOCODING_CACHE.clear()
+
+
 def geocode_address(address):
+    request_address = _construct_request_address(address)
+
+    cached = _GEOCODING_CACHE.get(request_address)
+    if cached is not None:
+        return cached
+
     with Transaction() as t:
         gg_repo = GoogleGeocodingRepo(t)
 
-        request_address = _construct_request_address(address)
-
         # Determine if we've already geocoded the address
         new_request, request_id, response_body = gg_repo.get_or_create_record(
             request_address
         )
-        if not new_request:
+        if not new_request and response_body is not None:
             # Already geocoded, just return the parsed response
-            return _parse_response(response_body)
+            parsed = _parse_response(response_body)
+            _GEOCODING_CACHE.put(request_address, parsed)
+            return parsed
         else:
+            # Either a new address, or a previous request for it failed
             if request_id is None:
                 # There was an error creating the DB record - we should never
                 # reach this point, but if we do, mark it as failed
@@ -44,14 +124,223 @@ def geocode_address(address):
             response_raw = response.text
             response_obj = json.loads(response_raw)
 
+            parsed = _parse_response(response_obj)
             try:
                 gg_repo.update_record(request_id, response_raw)
             except Exception:
                 t.rollback()
             else:
                 t.commit()
+                _GEOCODING_CACHE.put(request_address, parsed)
+
+            return parsed
+
+
+def read_geocoded_addresses(transaction, addresses):
+    """Look up previously geocoded addresses, without contacting Google
+
+    Parameters
+    ----------
+    transaction : Transaction
+        The transaction to read within
+    addresses : dict of Address
+        The addresses to look up, keyed by any identifier
+
+    Returns
+    -------
+    dict
+        The parsed geocoding, as (latitude, longitude, state, country,
+        request_error), of each address which has been geocoded, keyed as
+        the input
+    """
+    request_addresses = {k: _construct_request_address(a)
+                         for k, a in addresses.items()}
+
+    parsed = {}
+    for request_address in set(request_addresses.values()):
+        cached = _GEOCODING_CACHE.get(request_address)
+        if cached is not None:
+            parsed[request_address] = cached
+
+    responses = GoogleGeocodingRepo(transaction).get_responses(
+        set(request_addresses.values()) - set(parsed))
+    for request_address, response_body in responses.items():
+        parsed[request_address] = _parse_response(response_body)
+        _GEOCODING_CACHE.put(request_address, parsed[request_address])
+
+    return {k: parsed[r]
+            for k, r in request_addresses.items() if r in parsed}
+
+
+@celery.task(bind=True, ignore_result=True, max_retries=5)
+def geocode_account(self, account_id):
+    """Geocode the address of an account and store its location
+
+    Queued once an account is created or its address changed, so that the
+    request does not wait on Google. Repeated jobs for an account are cheap,
+    as Google is only asked about an address once. Failures to reach Google
+    are retried with a backoff.
+
+    Parameters
+    ----------
+    account_id : str
+        The account to geocode
+    """
+    # cleared before the account is read, so that an address changed from
+    # here on queues a job of its own
+    with Transaction() as t:
+        AccountRepo(t).clear_geocoding_queued(account_id)
+        t.commit()
+
+    with Transaction() as t:
+        account = AccountRepo(t).get_account(account_id)
+    if account is None:
+        return
+
+    try:
+        latitude, longitude, _, _, cannot_geocode = geocode_address(
+            account.address)
+    except Exception as e:
+        raise self.retry(exc=e, countdown=60 * 2 ** self.request.retries)
+
+    if (latitude, longitude, cannot_geocode) == \
+            (account.latitude, account.longitude, account.cannot_geocode):
+        return
+
+    # if the account was modified in the meantime, the location is not
+    # stored, and is left to the job queued for the modification or the
+    # nightly refresh
+    with Transaction() as t:
+        AccountRepo(t).update_account_locations(
+            [(account.id, latitude, longitude, cannot_geocode,
+              account.update_time)])
+        t.commit()
+
+
+def _queue_geocoding(account_ids):
+    """Queue geocode_account for the accounts without a job pending
+
+    Returns
+    -------
+    list of str
+        The accounts queued
+    """
+    ttl = SERVER_CONFIG.get('geocoding_queue_ttl', 60 * 60)
+    with Transaction() as t:
+        marked = AccountRepo(t).mark_geocoding_queued(account_ids, ttl)
+        t.commit()
+
+    queued = []
+    for account_id in account_ids:
+        if account_id not in marked:
+            continue
+
+        try:
+            geocode_account.apply_async(args=[account_id], retry=False)
+        except Exception:
+            with Transaction() as t:
+                AccountRepo(t).clear_geocoding_queued(account_id)
+                t.commit()
+            raise
+        queued.append(account_id)
+    return queued
+
+
+def queue_account_geocoding(account_id):
+    """Queue geocode_account, without failing if the queue is unavailable
+
+    Nothing is queued if a job for the account is already pending. An
+    account which cannot be queued is geocoded by the nightly
+    refresh_account_geocoding task instead.
+
+    Parameters
+    ----------
+    account_id : str
+        The account to geocode
+    """
+    try:
+        _queue_geocoding([account_id])
+    except Exception:
+        current_app.logger.warning("Unable to queue geocoding of account %s",
+                                   account_id, exc_info=True)
+
 
-            return _parse_response(response_obj)
+def backfill_account_geocoding(limit=None):
+    """Queue geocoding of the accounts which lack a location
+
+    Accounts with a job already pending are skipped.
+
+    Parameters
+    ----------
+    limit : int, optional
+        The most accounts to queue
+
+    Returns
+    -------
+    int
+        The number of accounts queued
+    """
+    with Transaction(read_only=True) as t:
+        account_ids = AccountRepo(t).get_account_ids_without_location(limit)
+
+    return len(_queue_geocoding([str(a) for a in account_ids]))
+
+
+@celery.task(ignore_result=True)
+def refresh_account_geocoding(limit=None):
+    """Geocode accounts and store their locations
+
+    Account addresses which have not been geocoded are sent to Google, up to
+    limit distinct addresses per run. Every account whose stored location
+    differs from the geocoding of its address is then updated, so that
+    metadata pulldowns can rely on what is stored.
+
+    Parameters
+    ----------
+    limit : int, optional
+        The most addresses to send to Google. If not specified, the
+        geocoding_refresh_limit server configuration is used.
+    """
+    if limit is None:
+        limit = SERVER_CONFIG.get('geocoding_refresh_limit', 500)
+
+    with Transaction(read_only=True) as t:
+        locations = AccountRepo(t).get_account_locations()
+        geocoded = read_geocoded_addresses(
+            t, {k: v['address'] for k, v in locations.items()})
+
+    # accounts sharing an address only need it geocoded once
+    missing = {}
+    for account_id in sorted(set(locations) - set(geocoded)):
+        address = locations[account_id]['address']
+        missing.setdefault(_construct_request_address(address),
+                           []).append(account_id)
+
+    for account_ids in list(missing.values())[:limit]:
+        address = locations[account_ids[0]]['address']
+        try:
+            result = geocode_address(address)
+        except Exception:
+            current_app.logger.warning("Unable to geocode account %s",
+                                       account_ids[0], exc_info=True)
+            continue
+
+        for account_id in account_ids:
+            geocoded[account_id] = result
+
+    changed = []
+    for account_id, (latitude, longitude, _, _, cannot_geocode) in \
+            geocoded.items():
+        stored = locations[account_id]
+        if (latitude, longitude, cannot_geocode) != \
+                (stored['latitude'], stored['longitude'],
+                 stored['cannot_geocode']):
+            changed.append((account_id, latitude, longitude, cannot_geocode,
+                            stored['update_time']))
+
+    with Transaction() as t:
+        AccountRepo(t).update_account_locations(changed)
+        t.commit()
 
 
 def _construct_request_address(address):
@@ -74,7 +363,22 @@ def _construct_request_address(address):
     if address.country_code is not None:
         request_address += ", " + address.country_code
 
-    return request_address
+    return _normalize_request_address(request_address)
+
+
+def _normalize_request_address(request_address):
+    # Case and spacing do not change where an address is, so they are
+    # removed from the key under which the address is geocoded, as are
+    # separators left behind by missing fields. Patch 0140 applies the same
+    # normalization to the keys of existing records, and must be kept in
+    # step with this. Only ASCII letters and whitespace are normalized, as
+    # the case mapping of Postgres depends on the collation of the database.
+    # The order of street and street2 is kept, as it is part of the address
+    # sent to Google.
+    normalized = request_address.translate(_ASCII_UPPER)
+    normalized = re.sub(r"\s+", " ", normalized, flags=re.ASCII)
+    normalized = re.sub(r"\s*,[\s,]*", ", ", normalized, flags=re.ASCII)
+    return normalized.strip(" ,")
 
 
 def _parse_response(geocoding_response, strict_mode=False):
@@ -14,6 +14,9 @@ GOOD_CODES = ["AV25", "AV24", "AV23", "AV22", "AV21"]
 # have determined that for certain scenarios like Mail Boxes Etc and similar
 # locations, it's appropriate to treat as good.
 GOOD_CODES_NO_ERROR = ["AV14"]
+# The fields of an address, as verify_addresses accepts them
+ADDRESS_FIELDS = ("address_1", "address_2", "address_3", "city", "state",
+                  "postal", "country")
 
 
 def verify_address(
@@ -45,18 +48,7 @@ def verify_address(
 
         if dupe_status is not False:
             # duplicate record - return result with an added field noting dupe
-            return_dict = {"address_1": dupe_status["result_address_1"],
-                           "address_2": dupe_status['result_address_2'],
-                           "address_3": dupe_status['result_address_3'],
-                           "city": dupe_status['result_city'],
-                           "state": dupe_status['result_state'],
-                           "postal": dupe_status['result_postal'],
-                           "country": dupe_status['result_country'],
-                           "latitude": dupe_status['result_latitude'],
-                           "longitude": dupe_status['result_longitude'],
-                           "valid": dupe_status['result_good'],
-                           "duplicate": True}
-            return return_dict
+            return _duplicate_result(dupe_status)
         else:
             record_id = melissa_repo.create_record(address_1, address_2,
                                                    address_3, city, state,
@@ -104,49 +96,25 @@ def verify_address(
                 Note: Melissa's Global Address API allows batch requests.
                     However, our usage is on a single-record basis. Therefore,
                     we can safely assume that the response will only include
-                    one record to parse and use.
+                    one record to parse and use. See verify_addresses for
+                    batch requests.
                 """
 
                 record_obj = response_obj["Records"][0]
+                result = _parse_record(record_obj, block_po_boxes)
 
-                r_formatted_address = record_obj["FormattedAddress"]
-                r_codes = record_obj["Results"]
-                r_good = False
-                r_errors_present = False
-                r_good_conditional = False
-
-                codes = r_codes.split(",")
-                for code in codes:
-                    if code[0:2] == "AE":
-                        r_errors_present = True
-                    if code in GOOD_CODES_NO_ERROR:
-                        r_good_conditional = True
-                    if code in GOOD_CODES:
-                        r_good = True
-                        break
-
-                if r_good_conditional and not r_errors_present:
-                    r_good = True
-
-                # We can't ship to PO boxes, so we need to block them even if
-                # the address is otherwise valid. We check for the AddressType
-                # key, as it's only applicable to US addresses
-                if block_po_boxes and "AddressType" in record_obj:
-                    if record_obj["AddressType"] == "P":
-                        # Mark the record bad
-                        r_good = False
-                        # Inject a custom error code to indicate why
-                        r_codes += ",AEPOBOX"
-
-                r_address_1 = record_obj["AddressLine1"]
-                r_address_2 = record_obj["AddressLine2"]
-                r_address_3 = record_obj["AddressLine3"]
-                r_city = record_obj["Locality"]
-                r_state = record_obj["AdministrativeArea"]
-                r_postal = record_obj["PostalCode"]
-                r_country = record_obj["CountryName"]
-                r_latitude = record_obj["Latitude"]
-                r_longitude = record_obj["Longitude"]
+                r_formatted_address = result["formatted_address"]
+                r_codes = result["codes"]
+                r_good = result["valid"]
+                r_address_1 = result["address_1"]
+                r_address_2 = result["address_2"]
+                r_address_3 = result["address_3"]
+                r_city = result["city"]
+                r_state = result["state"]
+                r_postal = result["postal"]
+                r_country = result["country"]
+                r_latitude = result["latitude"]
+                r_longitude = result["longitude"]
 
                 u_success = melissa_repo.update_results(record_id, url,
                                                         response_raw, r_codes,
@@ -183,3 +151,174 @@ def verify_address(
                 exception_msg += record_id
 
                 raise Exception(exception_msg)
+
+
+def verify_addresses(addresses, block_po_boxes=True):
+    """
+    Verify many addresses, sending them to Melissa in batches of up to
+    melissa_batch_size records
+
+    Parameters
+    ----------
+    addresses : list of dict
+        The addresses to verify, each keyed by ADDRESS_FIELDS, as the
+        parameters of verify_address
+    block_po_boxes : bool, optional
+        Whether PO boxes are treated as invalid, as for verify_address
+
+    Returns
+    -------
+    list of dict or None
+        The result of each address, in order, as verify_address returns it.
+        None is given for an address which lacks address_1, postal or
+        country, or for which Melissa returned no record.
+    """
+    results = [None] * len(addresses)
+    verifiable = [i for i, a in enumerate(addresses)
+                  if a.get('address_1') and a.get('postal') and
+                  a.get('country')]
+
+    batch_size = SERVER_CONFIG.get("melissa_batch_size", 100)
+    for start in range(0, len(verifiable), batch_size):
+        batch = verifiable[start:start + batch_size]
+        for i, result in zip(batch,
+                             _verify_batch([addresses[i] for i in batch],
+                                           block_po_boxes)):
+            results[i] = result
+
+    return results
+
+
+def _verify_batch(addresses, block_po_boxes):
+    with Transaction() as t:
+        melissa_repo = MelissaRepo(t)
+
+        dupes = melissa_repo.check_duplicates(
+            [(a.get('address_1'), a.get('address_2'), a.get('postal'),
+              a.get('country'))
+             for a in addresses])
+        results = [_duplicate_result(dupes[i]) if i in dupes else None
+                   for i in range(len(addresses))]
+
+        # addresses repeated within the batch are only sent once
+        pending = {}
+        for i, a in enumerate(addresses):
+            if i not in dupes:
+                key = tuple(a.get(f) for f in ADDRESS_FIELDS)
+                pending.setdefault(key, []).append(i)
+        if len(pending) == 0:
+            return results
+
+        record_ids = melissa_repo.create_records(list(pending))
+
+        # Melissa API behaves oddly if it receives null values, so they are
+        # sent as ""
+        records = [{"RecordID": record_id,
+                    "AddressLine1": key[0],
+                    "AddressLine2": key[1] or "",
+                    "AddressLine3": key[2] or "",
+                    "Locality": key[3] or "",
+                    "AdministrativeArea": key[4] or "",
+                    "PostalCode": key[5],
+                    "Country": key[6]}
+                   for record_id, key in zip(record_ids, pending)]
+        url = SERVER_CONFIG["melissa_url"]
+        response = requests.post(
+            url,
+            json={"CustomerID": SERVER_CONFIG["melissa_license_key"],
+                  "Options": "DeliveryLines:ON",
+                  "Records": records})
+        if response.ok is False:
+            exception_msg = "Error connecting to Melissa API."
+            exception_msg += " Status Code: " + str(response.status_code)
+            exception_msg += " Status Text: " + response.reason
+            raise Exception(exception_msg)
+
+        # records Melissa does not return are left unprocessed, as
+        # verify_address does
+        response_records = {r["RecordID"]: r
+                            for r in response.json().get("Records", [])}
+        updates = []
+        for record_id, indices in zip(record_ids, pending.values()):
+            record_obj = response_records.get(record_id)
+            if record_obj is None:
+                continue
+
+            result = _parse_record(record_obj, block_po_boxes)
+            updates.append((record_id, url, json.dumps(record_obj),
+                            result["codes"], result["valid"],
+                            result["formatted_address"],
+                            result["address_1"], result["address_2"],
+                            result["address_3"], result["city"],
+                            result["state"], result["postal"],
+                            result["country"], result["latitude"],
+                            result["longitude"]))
+
+            return_dict = {k: result[k]
+                           for k in ADDRESS_FIELDS + ("latitude",
+                                                      "longitude", "valid")}
+            for i in indices:
+                results[i] = dict(return_dict)
+
+        melissa_repo.update_results_bulk(updates)
+        t.commit()
+
+    return results
+
+
+def _duplicate_result(dupe_status):
+    return {"address_1": dupe_status["result_address_1"],
+            "address_2": dupe_status['result_address_2'],
+            "address_3": dupe_status['result_address_3'],
+            "city": dupe_status['result_city'],
+            "state": dupe_status['result_state'],
+            "postal": dupe_status['result_postal'],
+            "country": dupe_status['result_country'],
+            "latitude": dupe_status['result_latitude'],
+            "longitude": dupe_status['result_longitude'],
+            "valid": dupe_status['result_good'],
+            "duplicate": True}
+
+
+def _parse_record(record_obj, block_po_boxes):
+    """Interpret one record of a Melissa Global Address API response"""
+    r_codes = record_obj["Results"]
+    r_good = False
+    r_errors_present = False
+    r_good_conditional = False
+
+    codes = r_codes.split(",")
+    for code in codes:
+        if code[0:2] == "AE":
+            r_errors_present = True
+        if code in GOOD_CODES_NO_ERROR:
+            r_good_conditional = True
+        if code in GOOD_CODES:
+            r_good = True
+            break
+
+    if r_good_conditional and not r_errors_present:
+        r_good = True
+
+    # We can't ship to PO boxes, so we need to block them even if
+    # the address is otherwise valid. We check for the AddressType
+    # key, as it's only applicable to US addresses
+    if block_po_boxes and "AddressType" in record_obj:
+        if record_obj["AddressType"] == "P":
+            # Mark the record bad
+            r_good = False
+            # Inject a custom error code to indicate why
+            r_codes += ",AEPOBOX"
+
+    return {"formatted_address": record_obj["FormattedAddress"],
+            "codes": r_codes,
+            "valid": r_good,
+            "address_1": record_obj["AddressLine1"],
+            "address_2": record_obj["AddressLine2"],
+            "address_3": record_obj["AddressLine3"],
+            "city": record_obj["Locality"],
+            "state": record_obj["AdministrativeArea"],
+            "postal": record_obj["PostalCode"],
+            "country": record_obj["CountryName"],
+            "latitude": record_obj["Latitude"],
+            "longitude": record_obj["Longitude"]}
@@ -1,10 +1,23 @@
+import datetime
+import http.server
+import json
+import threading
 import unittest
+import uuid
 from unittest import skipIf
+from unittest.mock import patch
 
 from microsetta_private_api.config_manager import SERVER_CONFIG
 from microsetta_private_api.util.google_geocoding import geocode_address,\
-    _construct_request_address, _parse_response
+    _construct_request_address, _parse_response, read_geocoded_addresses, \
+    refresh_account_geocoding, geocode_account, backfill_account_geocoding, \
+    clear_geocoding_cache, _GEOCODING_CACHE
+from microsetta_private_api.model.account import Account
 from microsetta_private_api.model.address import Address
+from microsetta_private_api.repo.account_repo import AccountRepo
+from microsetta_private_api.repo.google_geocoding_repo import \
+    GoogleGeocodingRepo
+from microsetta_private_api.repo.transaction import Transaction
 
 
 UCSD_ADDRESS = Address(
@@ -204,6 +217,12 @@ STRICT_GEOCODING_RESULTS = {
 
 
 class GoogleGeocodingTests(unittest.TestCase):
+    def setUp(self):
+        clear_geocoding_cache()
+
+    def tearDown(self):
+        clear_geocoding_cache()
+
     @skipIf(SERVER_CONFIG['google_geocoding_key'] in
             ('', 'geocoding_key_placeholder'),
             "Google Geocoding secrets not provided")
@@ -222,7 +241,37 @@ class GoogleGeocodingTests(unittest.TestCase):
 
     def test_construct_request_address(self):
         obs = _construct_request_address(UCSD_ADDRESS)
-        self.assertEqual(obs, "9500 Gilman Dr, La Jolla, CA 92093, US")
+        self.assertEqual(obs, "9500 GILMAN DR, LA JOLLA, CA 92093, US")
+
+    def test_construct_request_address_normalized(self):
+        exp = _construct_request_address(
+            Address("9500 Gilman Dr", "La Jolla", "CA", "92093", "US",
+                    street2="Apt 2"))
+
+        # case and spacing do not matter
+        obs = _construct_request_address(
+            Address("  9500  gilman dr ", "LA JOLLA ", "ca", "92093 ", "us",
+                    street2="apt\t2"))
+        self.assertEqual(obs, exp)
+
+        # the order of the street lines is kept, as it is part of the
+        # address sent to Google
+        obs = _construct_request_address(
+            Address("Apt 2", "La Jolla", "CA", "92093", "US",
+                    street2="9500 Gilman Dr"))
+        self.assertEqual(obs, "APT 2 9500 GILMAN DR, LA JOLLA, CA 92093, US")
+        self.assertNotEqual(obs, exp)
+
+        # missing fields do not leave separators behind
+        obs = _construct_request_address(
+            Address(None, "La Jolla", "", "92093", "US"))
+        self.assertEqual(obs, "LA JOLLA, 92093, US")
+
+        # only ASCII case and spacing are normalized, as in patch 0140
+        obs = _construct_request_address(
+            Address("1 Stra\u00dfe\u00a0Nord", "Z\u00fcrich", None, "8001",
+                    "ch"))
+        self.assertEqual(obs, "1 STRA\u00dfE\u00a0NORD, Z\u00fcRICH 8001, CH")
 
     def test_parse_response_successful(self):
         obs_lat, obs_long, obs_state, obs_country, obs_error =\
@@ -256,6 +305,260 @@ class GoogleGeocodingTests(unittest.TestCase):
         self.assertEqual(obs_country, None)
         self.assertEqual(obs_error, True)
 
+    def test_read_geocoded_addresses(self):
+        known = Address("9500 Gilman DrREADGEOCODEDTEST", "La Jolla", "CA",
+                        "92093", "US")
+        unknown = Address("1 Nowhere LnREADGEOCODEDTEST", "La Jolla", "CA",
+                          "92093", "US")
+        with Transaction() as t:
+            gg_repo = GoogleGeocodingRepo(t)
+            _, request_id, _ = gg_repo.get_or_create_record(
+                _construct_request_address(known))
+            gg_repo.update_record(request_id,
+                                  json.dumps(UCSD_GEOCODING_RESULTS))
+
+            # a request which never obtained a response is not geocoded
+            gg_repo.get_or_create_record(_construct_request_address(unknown))
+
+            with patch('microsetta_private_api.util.google_geocoding.'
+                       'requests.get') as mock_get:
+                obs = read_geocoded_addresses(t, {'a': known, 'b': unknown})
+            mock_get.assert_not_called()
+
+        self.assertEqual(obs, {'a': _parse_response(UCSD_GEOCODING_RESULTS)})
+
+        # the response is now cached, and read without the database
+        with Transaction() as t:
+            with patch.object(GoogleGeocodingRepo, 'get_responses',
+                              return_value={}) as mock_responses:
+                obs = read_geocoded_addresses(t, {'a': known})
+            mock_responses.assert_called_once_with(set())
+        self.assertEqual(obs, {'a': _parse_response(UCSD_GEOCODING_RESULTS)})
+
+    def test_geocoding_cache(self):
+        parsed = _parse_response(UCSD_GEOCODING_RESULTS)
+        _GEOCODING_CACHE.put('A', parsed)
+        self.assertEqual(_GEOCODING_CACHE.get('A'), parsed)
+        self.assertIsNone(_GEOCODING_CACHE.get('B'))
+
+        # the least recently used entry is evicted first
+        with patch.dict(SERVER_CONFIG, {'geocoding_cache_size': 2}):
+            _GEOCODING_CACHE.put('B', parsed)
+            _GEOCODING_CACHE.get('A')
+            _GEOCODING_CACHE.put('C', parsed)
+        self.assertEqual(_GEOCODING_CACHE.get('A'), parsed)
+        self.assertIsNone(_GEOCODING_CACHE.get('B'))
+        self.assertEqual(_GEOCODING_CACHE.get('C'), parsed)
+
+        # and entries expire
+        with patch.dict(SERVER_CONFIG, {'geocoding_cache_ttl': 0}):
+            _GEOCODING_CACHE.put('D', parsed)
+        self.assertIsNone(_GEOCODING_CACHE.get('D'))
+
+        clear_geocoding_cache()
+        self.assertIsNone(_GEOCODING_CACHE.get('A'))
+
+    def test_geocode_address_cached(self):
+        parsed = _parse_response(UCSD_GEOCODING_RESULTS)
+        _GEOCODING_CACHE.put(_construct_request_address(UCSD_ADDRESS),
+                             parsed)
+        with patch('microsetta_private_api.util.google_geocoding.'
+                   'Transaction') as mock_transaction:
+            obs = geocode_address(UCSD_ADDRESS)
+        mock_transaction.assert_not_called()
+        self.assertEqual(obs, parsed)
+
+    def test_refresh_account_geocoding(self):
+        updated = datetime.datetime.now()
+        shared = Address("1 Shared St", "La Jolla", "CA", "92093", "US")
+        locations = {
+            # geocoded, and stored correctly
+            'acct1': {'address': UCSD_ADDRESS, 'latitude': 32.8798916,
+                      'longitude': -117.2363115, 'cannot_geocode': False,
+                      'update_time': updated},
+            # geocoded, but not yet stored
+            'acct2': {'address': UCSD_ADDRESS, 'latitude': None,
+                      'longitude': None, 'cannot_geocode': False,
+                      'update_time': updated},
+            # not geocoded, and sharing an address
+            'acct3': {'address': shared, 'latitude': None,
+                      'longitude': None, 'cannot_geocode': False,
+                      'update_time': updated},
+            'acct4': {'address': shared, 'latitude': None,
+                      'longitude': None, 'cannot_geocode': False,
+                      'update_time': updated},
+        }
+        parsed = _parse_response(UCSD_GEOCODING_RESULTS)
+        base = 'microsetta_private_api.util.google_geocoding.'
+        with patch(base + 'AccountRepo.get_account_locations',
+                   return_value=locations), \
+                patch(base + 'AccountRepo.update_account_locations') \
+                as mock_update, \
+                patch(base + 'read_geocoded_addresses',
+                      return_value={'acct1': parsed, 'acct2': parsed}), \
+                patch(base + 'geocode_address',
+                      return_value=(1.0, 2.0, 'CA', 'US', False)) \
+                as mock_geocode:
+            refresh_account_geocoding()
+
+        mock_geocode.assert_called_once_with(shared)
+        mock_update.assert_called_once()
+        obs = sorted(mock_update.call_args[0][0])
+        self.assertEqual(obs, [
+            ('acct2', 32.8798916, -117.2363115, False, updated),
+            ('acct3', 1.0, 2.0, False, updated),
+            ('acct4', 1.0, 2.0, False, updated)])
+
+    def test_refresh_account_geocoding_limit(self):
+        locations = {
+            'acct%d' % i: {'address': Address("%d Main St" % i, "La Jolla",
+                                              "CA", "92093", "US"),
+                           'latitude': None, 'longitude': None,
+                           'cannot_geocode': False, 'update_time': None}
+            for i in range(5)}
+        base = 'microsetta_private_api.util.google_geocoding.'
+        with patch(base + 'AccountRepo.get_account_locations',
+                   return_value=locations), \
+                patch(base + 'AccountRepo.update_account_locations'), \
+                patch(base + 'read_geocoded_addresses', return_value={}), \
+                patch(base + 'geocode_address',
+                      return_value=(None, None, None, None, True)) \
+                as mock_geocode:
+            refresh_account_geocoding(limit=2)
+
+        self.assertEqual(mock_geocode.call_count, 2)
+
+
+class _GeocodingStub(http.server.BaseHTTPRequestHandler):
+    # stands in for the Google Geocoding API
+    status = 200
+    requests = []
+
+    def do_GET(self):
+        _GeocodingStub.requests.append(self.path)
+        body = json.dumps(UCSD_GEOCODING_RESULTS).encode('utf-8')
+        self.send_response(_GeocodingStub.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class GeocodeAccountTests(unittest.TestCase):
+    ACCT_ID = str(uuid.uuid4())
+    ADDRESS = Address("9500 Gilman DrGEOCODEACCOUNTTEST", "La Jolla", "CA",
+                      "92093", "US")
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.HTTPServer(('localhost', 0), _GeocodingStub)
+        cls.thread = threading.Thread(target=cls.server.serve_forever,
+                                      daemon=True)
+        cls.thread.start()
+        cls.url = 'http://localhost:%d/geocode/json' % cls.server.server_port
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _GeocodingStub.status = 200
+        _GeocodingStub.requests = []
+        clear_geocoding_cache()
+        self.config = patch.dict(SERVER_CONFIG,
+                                 {'google_geocoding_url': self.url})
+        self.config.start()
+
+        with Transaction() as t:
+            AccountRepo(t).create_account(
+                Account(self.ACCT_ID, "geocodeaccount@example.com",
+                        "standard", "https://MOCKUNITTEST.com",
+                        "geocodeaccount", "first", "last", self.ADDRESS,
+                        None, None, False, "en_US", True))
+            t.commit()
+
+    def tearDown(self):
+        self.config.stop()
+        clear_geocoding_cache()
+        with Transaction() as t:
+            AccountRepo(t).delete_account(self.ACCT_ID)
+            with t.cursor() as cur:
+                cur.execute("DELETE FROM ag.google_geocoding "
+                            "WHERE request_address = %s",
+                            (_construct_request_address(self.ADDRESS), ))
+            t.commit()
+
+    def test_geocode_account(self):
+        geocode_account(self.ACCT_ID)
+        with Transaction() as t:
+            obs = AccountRepo(t).get_account(self.ACCT_ID)
+        self.assertEqual(obs.latitude, 32.8798916)
+        self.assertEqual(obs.longitude, -117.2363115)
+        self.assertFalse(obs.cannot_geocode)
+        self.assertEqual(len(_GeocodingStub.requests), 1)
+
+        # a repeated job does not ask Google again
+        geocode_account(self.ACCT_ID)
+        self.assertEqual(len(_GeocodingStub.requests), 1)
+
+    def test_geocode_account_google_unavailable(self):
+        _GeocodingStub.status = 503
+        with self.assertRaisesRegex(Exception, "Google Geocoding"):
+            geocode_account(self.ACCT_ID)
+
+        with Transaction() as t:
+            obs = AccountRepo(t).get_account(self.ACCT_ID)
+        self.assertIsNone(obs.latitude)
+
+        # the failed request is not remembered, so a retry can succeed
+        _GeocodingStub.status = 200
+        geocode_account(self.ACCT_ID)
+        with Transaction() as t:
+            obs = AccountRepo(t).get_account(self.ACCT_ID)
+        self.assertEqual(obs.latitude, 32.8798916)
+
+    def test_geocode_account_missing(self):
+        geocode_account(str(uuid.uuid4()))
+        self.assertEqual(_GeocodingStub.requests, [])
+
+    def test_backfill_account_geocoding(self):
+        with patch('microsetta_private_api.util.google_geocoding.'
+                   'geocode_account.apply_async') as mock_apply:
+            try:
+                queued = backfill_account_geocoding()
+
+                queued_ids = [c[1]['args'][0]
+                              for c in mock_apply.call_args_list]
+                self.assertEqual(queued, len(queued_ids))
+                self.assertIn(self.ACCT_ID, queued_ids)
+
+                # accounts with a job pending are not queued again
+                mock_apply.reset_mock()
+                self.assertEqual(backfill_account_geocoding(), 0)
+                mock_apply.assert_not_called()
+            finally:
+                with Transaction() as t:
+                    with t.cursor() as cur:
+                        cur.execute("DELETE FROM ag.account_geocoding_queue")
+                    t.commit()
+
+    def test_geocode_account_clears_queued(self):
+        with Transaction() as t:
+            AccountRepo(t).mark_geocoding_queued([self.ACCT_ID], 60)
+            t.commit()
+
+        geocode_account(self.ACCT_ID)
+
+        # once the job has run, the account can be queued again
+        with Transaction() as t:
+            obs = AccountRepo(t).mark_geocoding_queued([self.ACCT_ID], 60)
+            t.rollback()
+        self.assertEqual(obs, {self.ACCT_ID})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,28 @@
 import unittest
 from unittest import skipIf
+from unittest.mock import patch, Mock
 
 from microsetta_private_api.config_manager import SERVER_CONFIG
-from microsetta_private_api.util.melissa import verify_address
+from microsetta_private_api.repo.transaction import Transaction
+from microsetta_private_api.util.melissa import verify_address, \
+    verify_addresses
+
+
+def _melissa_record(record_id, address_1, results="AV24",
+                    address_type="S"):
+    return {"RecordID": record_id,
+            "Results": results,
+            "FormattedAddress": address_1 + ";La Jolla, CA 92093",
+            "AddressLine1": address_1,
+            "AddressLine2": "",
+            "AddressLine3": "",
+            "Locality": "La Jolla",
+            "AdministrativeArea": "CA",
+            "PostalCode": "92093",
+            "CountryName": "United States of America",
+            "AddressType": address_type,
+            "Latitude": "32.8798916",
+            "Longitude": "-117.2363115"}
 
 
 class MelissaTests(unittest.TestCase):
@@ -72,5 +92,85 @@ class MelissaTests(unittest.TestCase):
         self.assertFalse(obs['valid'])
 
 
+class VerifyAddressesTests(unittest.TestCase):
+    def setUp(self):
+        self.address_1s = ["9500 Gilman DrVERIFYBATCHTEST",
+                           "PO Box 9002VERIFYBATCHTEST",
+                           "1234 NotAReal StVERIFYBATCHTEST"]
+
+    def tearDown(self):
+        with Transaction() as t:
+            with t.cursor() as cur:
+                cur.execute("DELETE FROM campaign.melissa_address_queries "
+                            "WHERE source_address_1 IN %s",
+                            (tuple(self.address_1s), ))
+            t.commit()
+
+    def _address(self, address_1, **kwargs):
+        address = {"address_1": address_1, "address_2": None,
+                   "address_3": None, "city": "La Jolla", "state": "CA",
+                   "postal": "92093", "country": "US"}
+        address.update(kwargs)
+        return address
+
+    def _respond(self, url, json):
+        response = Mock(ok=True)
+        records = []
+        for record in json["Records"]:
+            address_1 = record["AddressLine1"]
+            if address_1.startswith("1234"):
+                # Melissa did not return this record
+                continue
+            records.append(_melissa_record(
+                record["RecordID"], address_1,
+                address_type="P" if address_1.startswith("PO") else "S"))
+        response.json.return_value = {"Records": records}
+        return response
+
+    def test_verify_addresses(self):
+        gilman, po_box, unknown = self.address_1s
+        addresses = [self._address(gilman),
+                     self._address(po_box),
+                     self._address(gilman),
+                     self._address(unknown),
+                     self._address(gilman, postal="")]
+
+        with patch.dict(SERVER_CONFIG, {"melissa_batch_size": 3}), \
+                patch("microsetta_private_api.util.melissa.requests.post",
+                      side_effect=self._respond) as mock_post:
+            obs = verify_addresses(addresses)
+
+        # the repeated address is sent once, in batches of up to three
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(
+            sorted(len(c[1]["json"]["Records"])
+                   for c in mock_post.call_args_list), [1, 2])
+
+        self.assertTrue(obs[0]["valid"])
+        self.assertEqual(obs[0]["address_1"], gilman)
+        self.assertFalse(obs[1]["valid"])
+        self.assertEqual(obs[2], obs[0])
+        self.assertIsNone(obs[3])
+        self.assertIsNone(obs[4])
+
+        # verified addresses are not sent again
+        with patch("microsetta_private_api.util.melissa.requests.post",
+                   side_effect=self._respond) as mock_post:
+            obs = verify_addresses([self._address(gilman),
+                                    self._address(po_box)])
+        mock_post.assert_not_called()
+        self.assertTrue(obs[0]["valid"])
+        self.assertTrue(obs[0]["duplicate"])
+        self.assertFalse(obs[1]["valid"])
+
+    def test_verify_addresses_unavailable(self):
+        response = Mock(ok=False, status_code=503,
+                        reason="Service Unavailable")
+        with patch("microsetta_private_api.util.melissa.requests.post",
+                   return_value=response):
+            with self.assertRaisesRegex(Exception, "Melissa"):
+                verify_addresses([self._address(self.address_1s[0])])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,13 @@
+import threading
+import time
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, Mock
 
 from microsetta_private_api.util.vioscreen import (VioscreenAdminAPI,
+                                                   VioscreenAdminAPIAgent,
+                                                   VioscreenRetryableError,
+                                                   make_vioscreen_request,
+                                                   _RateLimiter,
                                                    update_session_detail,
                                                    fetch_ffqs,
                                                    EN_US)
@@ -86,6 +92,181 @@ class VioscreenAPITests(unittest.TestCase):
         self.assertTrue(obs.startswith(b'%PDF'))
 
 
+class VioscreenGetFFQTests(unittest.TestCase):
+    REPORTS = ('foodcomponents', 'percentenergy', 'mpeds', 'eatingpatterns',
+               'foodconsumption', 'dietaryscore', 'supplements')
+
+    def setUp(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _report(self, name, delay=0.2, fail=False):
+        def f(session_id):
+            with self.lock:
+                self.calls.append(name)
+            time.sleep(delay)
+            if fail:
+                raise ValueError("no such report")
+            return name
+        return f
+
+    def _patched(self, client, **reports):
+        patches = [patch.object(client, 'session_detail',
+                                side_effect=self._report('session')),
+                   patch('microsetta_private_api.util.vioscreen.'
+                         'VioscreenComposite', side_effect=dict)]
+        for name in self.REPORTS:
+            f = reports.get(name, self._report(name))
+            patches.append(patch.object(client, name, side_effect=f))
+        return patches
+
+    def _get_ffq(self, client, **reports):
+        patches = self._patched(client, **reports)
+        for p in patches:
+            p.start()
+        try:
+            return client.get_ffq(SID)
+        finally:
+            for p in patches:
+                p.stop()
+
+    def test_get_ffq_concurrent(self):
+        client = VioscreenAdminAPI(perform_async=False, max_workers=8)
+        start = time.monotonic()
+        obs_err, obs = self._get_ffq(client)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(obs_err, [])
+        self.assertEqual(obs['session'], 'session')
+        self.assertEqual(obs['food_components'], 'foodcomponents')
+        self.assertEqual(obs['supplements'], 'supplements')
+        self.assertEqual(len(self.calls), 8)
+        # eight requests of 0.2s each, issued at once
+        self.assertLess(elapsed, 1.0)
+
+    def test_get_ffq_concurrent_incomplete(self):
+        client = VioscreenAdminAPI(perform_async=False, max_workers=8)
+        obs_err, obs = self._get_ffq(
+            client, mpeds=self._report('mpeds', fail=True))
+        self.assertEqual(obs, None)
+        self.assertEqual(obs_err, ["FFQ appears incomplete or not taken", ])
+
+    def test_get_ffq_concurrent_session_failure(self):
+        client = VioscreenAdminAPI(perform_async=False, max_workers=8)
+        patches = self._patched(client)
+        for p in patches:
+            p.start()
+        client.session_detail.side_effect = ValueError("unknown session")
+        try:
+            with self.assertRaisesRegex(ValueError, "unknown session"):
+                client.get_ffq(SID)
+        finally:
+            for p in patches:
+                p.stop()
+
+    def test_get_ffq_sequential(self):
+        client = VioscreenAdminAPI(perform_async=False, max_workers=1)
+        obs_err, obs = self._get_ffq(
+            client, mpeds=self._report('mpeds', delay=0, fail=True))
+        self.assertEqual(obs, None)
+        self.assertEqual(obs_err, ["FFQ appears incomplete or not taken", ])
+
+        # reports after the failure are not requested
+        self.assertEqual(self.calls, ['session', 'foodcomponents',
+                                      'percentenergy', 'mpeds'])
+
+    def test_request_timeout(self):
+        client = VioscreenAdminAPI(perform_async=False, timeout=5)
+        with patch('microsetta_private_api.util.vioscreen.'
+                   'VIOSCREEN_API.request') as mock_request:
+            client.get('users')
+            client.get('users', timeout=10)
+        self.assertEqual(mock_request.call_args_list[0][1], {'timeout': 5})
+        self.assertEqual(mock_request.call_args_list[1][1], {'timeout': 10})
+
+
+def _response(status_code, json=None, content_type='application/json',
+              content=b''):
+    response = Mock(status_code=status_code, content=content,
+                    headers={'Content-Type': content_type})
+    response.json.return_value = json
+    return response
+
+
+class VioscreenAdminAPIAgentTests(unittest.TestCase):
+    def setUp(self):
+        self.agent = VioscreenAdminAPIAgent()
+        self.agent.session = Mock()
+        self.tokens = iter(['token%d' % i for i in range(100)])
+        self.agent.session.post.side_effect = \
+            lambda url, **kwargs: _response(200, {'token': next(self.tokens)})
+
+    def test_request(self):
+        self.agent.session.get.return_value = _response(200, {'users': []})
+        obs = self.agent.request('GET', 'users', timeout=5)
+        self.assertEqual(obs, {'users': []})
+
+        # a token is obtained once, and reused
+        self.agent.request('GET', 'users')
+        self.assertEqual(self.agent.session.post.call_count, 1)
+        self.assertEqual(self.agent.session.get.call_args[1]['headers'],
+                         {'Accept': 'application/json',
+                          'Authorization': 'Bearer token0'})
+
+    def test_request_pdf(self):
+        self.agent.session.post.side_effect = [
+            _response(200, {'token': 'token0'}),
+            _response(200, content_type='application/pdf',
+                      content=b'%PDF-1.4')]
+        obs = self.agent.request('POST', 'report/topfoodreport')
+        self.assertEqual(obs, b'%PDF-1.4')
+
+    def test_request_token_expired(self):
+        with patch.object(VioscreenAdminAPIAgent, 'TOKEN_LIFETIME', 0):
+            self.agent.session.get.return_value = _response(200, {})
+            self.agent.request('GET', 'users')
+            self.agent.request('GET', 'users')
+        self.assertEqual(self.agent.session.post.call_count, 2)
+
+    def test_request_token_rejected_concurrently(self):
+        self.agent.current_headers()
+        rejected = dict(self.agent.headers)
+
+        def get(url, headers=None, **kwargs):
+            if headers == rejected:
+                time.sleep(0.1)
+                return _response(401, {'Code': 1016})
+            return _response(200, {})
+
+        self.agent.session.get.side_effect = get
+        threads = [threading.Thread(target=self.agent.request,
+                                    args=('GET', 'users'))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # the threads share one new token
+        self.assertEqual(self.agent.session.post.call_count, 2)
+
+    def test_request_retryable(self):
+        self.agent.session.get.return_value = _response(500, {'Code': 1})
+        with self.assertRaisesRegex(VioscreenRetryableError, "500 ::: "):
+            self.agent.request('GET', 'users')
+
+    def test_request_known_error(self):
+        self.agent.session.get.return_value = _response(400, {'Code': 1000})
+        obs = self.agent.request('GET', 'sessions/foo/mpeds')
+        self.assertEqual(obs, {'error': 'ffq not taken'})
+
+    def test_make_vioscreen_request_pdf(self):
+        with patch('microsetta_private_api.util.vioscreen.'
+                   'VIOSCREEN_API.request', return_value=b'%PDF-1.4'):
+            obs = make_vioscreen_request('POST', 'report/topfoodreport')
+        self.assertEqual(obs, 'JVBERi0xLjQ=')
+
+
 class MockSession:
     def __init__(self, sid, uid):
         self.sessionId = sid
@@ -96,6 +277,134 @@ class MockSession:
         pass
 
 
+class MockFFQ:
+    def __init__(self, sid):
+        self.session = MockSession(sid, None)
+
+
+class FetchFFQsTests(unittest.TestCase):
+    def setUp(self):
+        base = 'microsetta_private_api.util.vioscreen.'
+        patches = {'send_email': patch(base + 'send_email'),
+                   'current_task': patch(base + 'current_task'),
+                   'session_repo': patch(base + 'VioscreenSessionRepo'),
+                   'repo': patch(base + 'VioscreenRepo'),
+                   'session_detail': patch.object(VioscreenAdminAPI,
+                                                  'session_detail'),
+                   'get_ffq': patch.object(VioscreenAdminAPI, 'get_ffq'),
+                   'config': patch.dict(SERVER_CONFIG,
+                                        {'vioscreen_fetch_per_minute': 0,
+                                         'vioscreen_write_batch_size': 2})}
+        self.mocks = {k: p.start() for k, p in patches.items()}
+        for p in patches.values():
+            self.addCleanup(p.stop)
+
+        self.session_repo = self.mocks['session_repo'].return_value
+        self.repo = self.mocks['repo'].return_value
+
+    def _get_ffq(self, session_id):
+        if session_id.startswith('bad'):
+            return ["FFQ appears incomplete or not taken"], None
+        return [], MockFFQ(session_id)
+
+    def test_fetch_ffqs(self):
+        self.session_repo.get_unfinished_sessions.return_value = [
+            MockSession('s1', 'u1'),
+            MockSession(None, 'u2'),
+            MockSession('missing', 'u3')]
+
+        def session_detail(sid):
+            if sid != 's1':
+                raise ValueError("404")
+            return MockSession(sid, 'u1')
+
+        self.mocks['session_detail'].side_effect = session_detail
+        self.session_repo.get_missing_ffqs.return_value = [
+            MockSession(sid, None)
+            for sid in ('f1', 'bad1', 'f2', 'f3', 'f4', 'f5')]
+        self.mocks['get_ffq'].side_effect = self._get_ffq
+
+        fetch_ffqs(limit=5)
+
+        # sessions are looked up by their ID, and only if Vioscreen knows
+        # of them
+        self.assertEqual(
+            sorted(c[0][0]
+                   for c in self.mocks['session_detail'].call_args_list),
+            ['missing', 's1'])
+        self.assertEqual(self.mocks['get_ffq'].call_count, 5)
+
+        # FFQs are stored in batches as they arrive
+        stored = [[f.session.sessionId for f in c[0][0]]
+                  for c in self.repo.insert_ffqs.call_args_list]
+        self.assertTrue(all(len(s) <= 2 for s in stored))
+        self.assertEqual(sorted(sum(stored, [])), ['f1', 'f2', 'f3', 'f4'])
+
+        failures = sum([c[0][0] for c in
+                        self.session_repo.record_ffq_fetch_failures
+                        .call_args_list], [])
+        self.assertEqual(failures, [('bad1', "['FFQ appears incomplete or "
+                                             "not taken']")])
+
+        self.mocks['current_task'].update_state.assert_called_with(
+            state="SUCCESS",
+            meta={"completion": 5, "status": "SUCCESS",
+                  "message": "4 FFQs stored"})
+
+        content = self.mocks['send_email'].call_args[0][2]['content']
+        self.assertIn("'bad1' : ['FFQ appears incomplete", content)
+        self.assertIn("'missing' : 404", content)
+
+    def test_fetch_ffqs_bad_ffq_in_batch(self):
+        self.session_repo.get_unfinished_sessions.return_value = []
+        self.session_repo.get_missing_ffqs.return_value = [
+            MockSession(sid, None) for sid in ('f1', 'f2', 'f3')]
+        self.mocks['get_ffq'].side_effect = self._get_ffq
+
+        def insert_ffqs(ffqs):
+            if 'f2' in [f.session.sessionId for f in ffqs]:
+                raise ValueError("unknown code")
+
+        self.repo.insert_ffqs.side_effect = insert_ffqs
+
+        with patch('microsetta_private_api.util.vioscreen.Transaction'):
+            fetch_ffqs()
+
+        # the others in the batch are stored, and the bad FFQ is recorded
+        # rather than aborting the run
+        stored = [[f.session.sessionId for f in c[0][0]]
+                  for c in self.repo.insert_ffqs.call_args_list]
+        self.assertEqual(sorted(sum([s for s in stored if 'f2' not in s],
+                                    [])),
+                         ['f1', 'f3'])
+
+        failures = sum([c[0][0] for c in
+                        self.session_repo.record_ffq_fetch_failures
+                        .call_args_list], [])
+        self.assertEqual(failures, [('f2', 'unknown code')])
+
+        self.mocks['current_task'].update_state.assert_called_with(
+            state="SUCCESS",
+            meta={"completion": 3, "status": "SUCCESS",
+                  "message": "2 FFQs stored"})
+
+    def test_fetch_ffqs_nothing_missing(self):
+        self.session_repo.get_unfinished_sessions.return_value = []
+        self.session_repo.get_missing_ffqs.return_value = []
+
+        fetch_ffqs()
+
+        self.repo.insert_ffqs.assert_not_called()
+        self.mocks['send_email'].assert_not_called()
+
+    def test_rate_limiter(self):
+        limiter = _RateLimiter(60 * 20)  # one call every 50ms
+        start = time.monotonic()
+        for _ in range(5):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+
 @unittest.skipIf(not RUN_API_TESTS,
                  "vioscreen secrets not provided")
 class VioscreenGeneralTests(unittest.TestCase):
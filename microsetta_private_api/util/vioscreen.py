@@ -1,12 +1,15 @@
 import base64
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urljoin
 
 from Crypto.Cipher import AES
 from Crypto import Random
 from base64 import b64decode, b64encode
 
-from celery import Task, current_task
+from celery import current_task
 from microsetta_private_api.tasks import send_email
 from microsetta_private_api.celery_utils import celery
 from werkzeug.exceptions import BadRequest
@@ -168,25 +171,46 @@ def decode_key(encoded):
 
 # In addition to the ciphered protocol that lets users interact through their
 # own browsers, vioscreen supports a server to server communications channel
-# for generation and retrieval of reports.  We wrap this comms channel in
-# celery for async functionality.
+# for generation and retrieval of reports.
 
 # Note:  We expect the VioscreenAdminAPIAgent class to be instantiated once per
-# celery worker process.  That per process instance maintains its own requests
-# session and acquires vioscreen admin credentials upon instantiation.
+# process, by both the flask application and celery workers. That per process
+# instance maintains a pool of connections, and a token which is shared by
+# the threads of the process and renewed before it expires.
 
 # Calls out to vioscreen are expected to be bound to the singleton instance,
 # and should thus reuse connections and tokens across multiple requests.
-# This class is not expected to be instantiated by the main flask application
-class VioscreenAdminAPIAgent(Task):
+# Flask requests call the singleton directly, while background work may
+# instead go through the make_vioscreen_request celery task.
+class VioscreenRetryableError(ValueError):
+    """A response from Vioscreen which may succeed if the request is retried
+    """
+    pass
+
+
+class VioscreenAdminAPIAgent:
+    # Vioscreen tokens are good for an hour
+    TOKEN_LIFETIME = 55 * 60
+
     def __init__(self):
-        print("Initializing Vioscreen Communications Task")
+        print("Initializing Vioscreen Communications Agent")
         self.baseurl = urljoin('https://api.viocare.com',
                                SERVER_CONFIG["vioscreen_regcode"]) + '/'
         self.user = SERVER_CONFIG["vioscreen_admin_username"]
         self.password = SERVER_CONFIG["vioscreen_admin_password"]
         self.session = requests.Session()
+        pool_size = SERVER_CONFIG.get("vioscreen_pool_size", 10)
+        self.session.mount('https://',
+                           requests.adapters.HTTPAdapter(
+                               pool_connections=1, pool_maxsize=pool_size))
         self.headers = None
+        self._token_time = None
+        self._token_lock = threading.RLock()
+
+    def _set_token(self, token):
+        self.headers = {'Accept': 'application/json',
+                        'Authorization': 'Bearer %s' % token}
+        self._token_time = time.monotonic()
 
     def update_headers(self):
         data = {"username": self.user,
@@ -194,63 +218,99 @@ class VioscreenAdminAPIAgent(Task):
 
         url = urljoin(self.baseurl, 'auth/login')
 
-        req = self.session.post(url, data=data)
-        if req.status_code != 200:
-            # TODO: Check if this can send back 3XX redirects or anything
-            #  else that we have to handle to get tokens robustly
-            raise ValueError("Failed to obtain token")
-        else:
-            token = req.json()['token']
-            self.headers = {'Accept': 'application/json',
-                            'Authorization': 'Bearer %s' % token}
+        with self._token_lock:
+            req = self.session.post(url, data=data)
+            if req.status_code != 200:
+                # TODO: Check if this can send back 3XX redirects or anything
+                #  else that we have to handle to get tokens robustly
+                raise ValueError("Failed to obtain token")
+            else:
+                self._set_token(req.json()['token'])
 
     def refresh_token(self):
         if self.headers is None:
             print("Cannot refresh, no headers set")
         refresh_url = urljoin(self.baseurl, 'auth/refreshtoken')
-        req = self.session.get(refresh_url, headers=self.headers)
-        if req.status_code != 200:
-            print("Failed to refresh vioscreen token!  Status Code:",
-                  req.status_code)
+        with self._token_lock:
+            req = self.session.get(refresh_url, headers=self.headers)
+            if req.status_code != 200:
+                print("Failed to refresh vioscreen token!  Status Code:",
+                      req.status_code)
+            else:
+                self._set_token(req.json()['token'])
+
+    def current_headers(self, stale=None):
+        """Obtain headers with a usable token
+
+        Parameters
+        ----------
+        stale : dict, optional
+            Headers whose token Vioscreen rejected. A new token is obtained
+            unless another thread has already replaced them.
+
+        Returns
+        -------
+        dict
+            The headers to issue a request with
+        """
+        with self._token_lock:
+            # if another thread already replaced the stale headers, theirs
+            # are used
+            expired = self._token_time is None or \
+                time.monotonic() - self._token_time > self.TOKEN_LIFETIME
+            if self.headers is None or self.headers is stale or expired:
+                self.update_headers()
+            return self.headers
+
+    def request(self, method, url, **kwargs):
+        """Issue a request to the Vioscreen API
+
+        Parameters
+        ----------
+        method : str
+            Either GET or POST
+        url : str
+            The endpoint, relative to the API base URL
+        kwargs : dict
+            Passed to requests
+
+        Returns
+        -------
+        dict or bytes
+            The decoded JSON response, the content of a PDF response, or a
+            dict describing an error Vioscreen reports for the request
+
+        Raises
+        ------
+        VioscreenRetryableError
+            If Vioscreen returns an unexpected error, or rejects a new token
+        """
+        if method == "GET":
+            method = self.session.get
+        elif method == "POST":
+            method = self.session.post
         else:
-            token = req.json()['token']
-            self.headers = {'Accept': 'application/json',
-                            'Authorization': 'Bearer %s' % token}
-
-
-# In flagrant disregard for celery's own documentation, three functions that
-# declare the same task base class do not appear to share the same instance
-# of that class.  So we implement our own singleton.
-VIOSCREEN_API = VioscreenAdminAPIAgent()
-
-
-@celery.task
-def refresh_headers():
-    if VIOSCREEN_API.headers is None:
-        VIOSCREEN_API.update_headers()
-    else:
-        VIOSCREEN_API.refresh_token()
+            raise Exception("Unknown Method")
 
+        url = urljoin(self.baseurl, url)
 
-@celery.task(
-    bind=True,  # This function is bound to a Task instance
-    ignore_result=False,  # We need the results back
-    default_retry_delay=5  # Default policy: wait 5 seconds on failure
-)
-def make_vioscreen_request(self, method, url, **kwargs):
-    if VIOSCREEN_API.headers is None:
-        VIOSCREEN_API.update_headers()
+        headers = self.current_headers()
+        req = method(url, headers=headers, **kwargs)
+        result, auth_failure = self._handle_response(req)
+        if auth_failure:
+            headers = self.current_headers(stale=headers)
+            req = method(url, headers=headers, **kwargs)
+            result, auth_failure = self._handle_response(req)
 
-    if method == "GET":
-        method = VIOSCREEN_API.session.get
-    elif method == "POST":
-        method = VIOSCREEN_API.session.post
-    else:
-        raise Exception("Unknown Method")
+        if auth_failure:
+            # Implies something weird occured
+            raise VioscreenRetryableError(str(req.status_code) + " ::: " +
+                                          str(req.content))
 
-    url = urljoin(VIOSCREEN_API.baseurl, url)
+        return result
 
-    def handle_response(req):
+    @staticmethod
+    def _handle_response(req):
         if req.status_code != 200:
             data = req.json()
             code = data.get('Code')
@@ -273,11 +333,9 @@ def make_vioscreen_request(self, method, url, **kwargs):
                 # ffq isn't taken
                 return {'error': 'ffq not taken'}, False
             else:
-                # Unknown exception type, requeue the celery task (up to
-                # max retries times)
-                exc = ValueError(str(req.status_code) + " ::: " +
-                                 str(req.content))
-                raise self.retry(exc=exc)
+                # Unknown exception type, the request may be retried
+                raise VioscreenRetryableError(str(req.status_code) + " ::: " +
+                                              str(req.content))
         else:
             if 'Content-Type' in req.headers:
                 ct = req.headers['Content-Type']
@@ -286,57 +344,111 @@ def make_vioscreen_request(self, method, url, **kwargs):
                 if "application/json" in cts:
                     return req.json(), False
                 elif "application/pdf" in cts:
-                    # Well this is maddening.  Since celery is an RPC framework
-                    # you can't just send bytes back and forth, so we have to
-                    # encode it as a string across the redis server to get back
-                    # to flask
-                    return base64.b64encode(req.content).decode("utf-8"), False
+                    return req.content, False
                 else:
                     raise Exception("Unhandled response content type")
             else:
                 raise Exception("Unknown response content type")
 
-    req = method(url, headers=VIOSCREEN_API.headers, **kwargs)
-    result, auth_failure = handle_response(req)
-    if auth_failure:
+
+# In flagrant disregard for celery's own documentation, three functions that
+# declare the same task base class do not appear to share the same instance
+# of that class.  So we implement our own singleton.
+VIOSCREEN_API = VioscreenAdminAPIAgent()
+
+
+@celery.task
+def refresh_headers():
+    if VIOSCREEN_API.headers is None:
         VIOSCREEN_API.update_headers()
-        req = method(url, headers=VIOSCREEN_API.headers, **kwargs)
-        result, auth_failure = handle_response(req)
+    else:
+        VIOSCREEN_API.refresh_token()
 
-    if auth_failure:
-        # Implies something weird occured
-        exc = ValueError(str(req.status_code) + " ::: " + str(req.content))
-        raise self.retry(exc=exc)
 
+@celery.task(
+    bind=True,  # This function is bound to a Task instance
+    ignore_result=False,  # We need the results back
+    default_retry_delay=5  # Default policy: wait 5 seconds on failure
+)
+def make_vioscreen_request(self, method, url, **kwargs):
+    try:
+        result = VIOSCREEN_API.request(method, url, **kwargs)
+    except VioscreenRetryableError as e:
+        # requeue the celery task (up to max retries times)
+        raise self.retry(exc=e)
+
+    if isinstance(result, bytes):
+        # Well this is maddening.  Since celery is an RPC framework
+        # you can't just send bytes back and forth, so we have to
+        # encode it as a string across the redis server to get back
+        # to flask
+        result = base64.b64encode(result).decode("utf-8")
     return result
 
 
-# This object provides a cleaner facade atop the RPC interface to celery
-# and lets you do all the standard vioscreen api operations we support
+# This object provides a cleaner facade atop the Vioscreen API, either
+# called directly or through the RPC interface to celery, and lets you do all
+# the standard vioscreen api operations we support
 class VioscreenAdminAPI:
-    def __init__(self, perform_async=True):
+    """Vioscreen API operations
+
+    Parameters
+    ----------
+    perform_async : bool, optional
+        Whether requests are dispatched to a celery worker. Otherwise, they
+        are issued by this process, through its pooled connections and
+        shared token, which is what Flask requests should do.
+    max_workers : int, optional
+        The most requests get_ffq issues at once. If 1, they are issued one
+        after another. If not specified, the vioscreen_max_workers server
+        configuration is used.
+    timeout : float, optional
+        The seconds to wait on any one request to Vioscreen. If not
+        specified, the vioscreen_request_timeout server configuration is
+        used.
+    rate_limiter : _RateLimiter, optional
+        Waited on before every request, so that the requests of all the
+        threads sharing it are spaced out
+    """
+    def __init__(self, perform_async=True, max_workers=None, timeout=None,
+                 rate_limiter=None):
         self.perform_async = perform_async
+        self.rate_limiter = rate_limiter
+
+        if max_workers is None:
+            max_workers = SERVER_CONFIG.get('vioscreen_max_workers', 8)
+        self.max_workers = max(1, max_workers)
+
+        if timeout is None:
+            timeout = SERVER_CONFIG.get('vioscreen_request_timeout', 60)
+        self.timeout = timeout
 
     def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
         if self.perform_async:
             return make_vioscreen_request.delay(
                 "GET",
                 url,
                 **kwargs)
         else:
-            return make_vioscreen_request(
+            return VIOSCREEN_API.request(
                 "GET",
                 url,
                 **kwargs)
 
     def post(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
         if self.perform_async:
             return make_vioscreen_request.delay(
                 "POST",
                 url,
                 **kwargs)
         else:
-            return make_vioscreen_request(
+            return VIOSCREEN_API.request(
                 "POST",
                 url,
                 **kwargs)
@@ -389,8 +501,6 @@ class VioscreenAdminAPI:
 
     def sessions(self, vioscreen_user):
         detail = self.get('users/%s/sessions' % vioscreen_user)
-        # TODO: Can we push waiting for the async result out to flask to
-        #  free up the flask worker for more requests?
         if self.perform_async:
             detail = detail.get()  # Wait for async result
 
@@ -427,21 +537,51 @@ class VioscreenAdminAPI:
                          ('supplements',
                           self.supplements,
                           'supplements')]
-        results = {'session': self.session_detail(session_id)}
-        for name, f, key in name_func_key:
-            try:
-                data = f(session_id)
-            except:  # noqa
-                errors.append("FFQ appears incomplete or not taken")
-                break
+        if self.max_workers > 1:
+            results = self._get_ffq_concurrent(session_id, name_func_key,
+                                               errors)
+        else:
+            results = {'session': self.session_detail(session_id)}
+            for name, f, key in name_func_key:
+                try:
+                    data = f(session_id)
+                except:  # noqa
+                    errors.append("FFQ appears incomplete or not taken")
+                    break
 
-            results[key] = data
+                results[key] = data
 
         if errors:
             return errors, None
         else:
             return errors, VioscreenComposite(**results)
 
+    def _get_ffq_concurrent(self, session_id, name_func_key, errors):
+        # The session detail and each report are independent, so they are
+        # requested at once. As when requested one after another, a failure
+        # to obtain the session detail is raised, and a failure to obtain
+        # any report marks the FFQ incomplete.
+        n_workers = min(self.max_workers, len(name_func_key) + 1)
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            session = executor.submit(self.session_detail, session_id)
+            reports = [(key, executor.submit(f, session_id))
+                       for name, f, key in name_func_key]
+
+            try:
+                results = {'session': session.result()}
+                for key, future in reports:
+                    try:
+                        results[key] = future.result()
+                    except:  # noqa
+                        errors.append("FFQ appears incomplete or not taken")
+                        break
+            finally:
+                # do not issue requests whose outcome no longer matters
+                for key, future in reports:
+                    future.cancel()
+
+        return results
+
     def top_food_report(self, session_id):
         result = self.post(
             "report/topfoodreport",
@@ -452,8 +592,6 @@ class VioscreenAdminAPI:
                 "providerName": "The Microsetta Initiative"
             })
 
-        # TODO: Celery becomes a lot harder to use when you need to wait for
-        #  answers and encode/decode things.  Blah.
         if self.perform_async:
             result = result.get()
 
@@ -462,7 +600,10 @@ class VioscreenAdminAPI:
             # {'error': 'empty ffq'}
             return None
 
-        return base64.b64decode(result.encode('utf-8'))
+        if self.perform_async:
+            # the PDF is base64 encoded to pass through celery
+            return base64.b64decode(result.encode('utf-8'))
+        return result
 
 
 @celery.task(ignore_result=False)
@@ -549,26 +690,146 @@ def update_session_detail():
                    EN_US)
 
 
-@celery.task(ignore_result=True)
-def fetch_ffqs():
-    MAX_FETCH_SIZE = 100
+class _RateLimiter:
+    """Space out the calls of many threads to at most per_minute a minute"""
+    def __init__(self, per_minute):
+        self._interval = 60 / per_minute if per_minute else 0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
 
-    vio_api = VioscreenAdminAPI(perform_async=False)
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self._interval
+        time.sleep(start - now)
+
+
+def _fetch_concurrently(fetch, items, n_workers):
+    """Apply fetch to each item from a bounded pool of threads
+
+    Yields (item, result, exception) as each fetch completes, with one of
+    result or exception being None.
+    """
+    def guarded(item):
+        try:
+            return item, fetch(item), None
+        except Exception as e:  # noqa
+            return item, None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, n_workers)) as executor:
+        futures = [executor.submit(guarded, item) for item in items]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # if the consumer stops early, do not start further fetches
+            for future in futures:
+                future.cancel()
+
+
+def _store_ffqs(ffqs, failures):
+    """Store a batch of FFQs, and record those we could not obtain
+
+    The batch is written at once. Should that fail, e.g. as an FFQ has a
+    code we do not recognize, each FFQ is written under its own savepoint,
+    so that one bad FFQ does not cost the rest of the batch. FFQs which
+    cannot be written are recorded as failures, along with those given, in
+    a transaction of their own.
+
+    Parameters
+    ----------
+    ffqs : list of VioscreenComposite
+        The FFQs to store
+    failures : list of (str, str)
+        The sessionId of each FFQ which could not be fetched, and why
+
+    Returns
+    -------
+    (int, list of (str, str))
+        The number of FFQs stored, and every failure recorded
+    """
+    failed = []
+    try:
+        with Transaction() as t:
+            vio_repo = VioscreenRepo(t)
+            with t.cursor() as cur:
+                cur.execute("SAVEPOINT store_ffqs")
+                try:
+                    vio_repo.insert_ffqs(ffqs)
+                except Exception:  # noqa
+                    cur.execute("ROLLBACK TO SAVEPOINT store_ffqs")
+                    for ffq in ffqs:
+                        cur.execute("SAVEPOINT store_ffq")
+                        try:
+                            vio_repo.insert_ffqs([ffq])
+                        except Exception as e:  # noqa
+                            cur.execute("ROLLBACK TO SAVEPOINT store_ffq")
+                            failed.append((ffq.session.sessionId, str(e)))
+                        else:
+                            cur.execute("RELEASE SAVEPOINT store_ffq")
+                cur.execute("RELEASE SAVEPOINT store_ffqs")
+            t.commit()
+    except Exception as e:  # noqa
+        # nothing in the batch was stored
+        failed = [(ffq.session.sessionId, str(e)) for ffq in ffqs]
+
+    failures = failures + failed
+    with Transaction() as t:
+        VioscreenSessionRepo(t).record_ffq_fetch_failures(failures)
+        t.commit()
+
+    return len(ffqs) - len(failed), failures
+
+
+@celery.task(ignore_result=True)
+def fetch_ffqs(limit=None):
+    """Fetch the FFQs of finished sessions which we lack data for
+
+    FFQs are fetched by vioscreen_fetch_workers threads, each issuing its
+    requests one after another, and together no more than
+    vioscreen_fetch_per_minute requests a minute. They are stored
+    vioscreen_write_batch_size at a time as they arrive. Sessions which
+    could not be fetched or stored are recorded, so that later runs attempt
+    other sessions before retrying them. As everything fetched is stored as
+    the run progresses, a run which is interrupted loses at most one batch.
+
+    Parameters
+    ----------
+    limit : int, optional
+        The most FFQs to fetch. If not specified, the vioscreen_fetch_limit
+        server configuration is used.
+    """
+    if limit is None:
+        limit = SERVER_CONFIG.get('vioscreen_fetch_limit', 100)
+    n_workers = SERVER_CONFIG.get('vioscreen_fetch_workers', 4)
+    per_minute = SERVER_CONFIG.get('vioscreen_fetch_per_minute', 60)
+    batch_size = SERVER_CONFIG.get('vioscreen_write_batch_size', 25)
+
+    # the threads share the limiter, and each issues one request at a time,
+    # so that no more than n_workers pooled connections are in use
+    vio_api = VioscreenAdminAPI(perform_async=False, max_workers=1,
+                                rate_limiter=_RateLimiter(per_minute))
 
     # obtain our current unfinished sessions to check
     with Transaction() as t:
         r = VioscreenSessionRepo(t)
         not_represented = r.get_unfinished_sessions()
 
+    # sessions Vioscreen has not yet told us about are left to
+    # update_session_detail
+    not_represented = [sess for sess in not_represented
+                       if sess.sessionId is not None]
+
     # collect sessions to update
     unable_to_update_session = []
     updated_sessions = []
-    for sess in enumerate(not_represented):
+    for sess, session_detail, exc in _fetch_concurrently(
+            lambda sess: vio_api.session_detail(sess.sessionId),
+            not_represented, n_workers):
         # update session status information
-        try:
-            session_detail = vio_api.session_detail(sess)
-        except:  # noqa
-            unable_to_update_session.append(sess)
+        if exc is not None:
+            unable_to_update_session.append((sess.sessionId, str(exc)))
         else:
             updated_sessions.append(session_detail)
 
@@ -582,26 +843,43 @@ def fetch_ffqs():
 
     with Transaction() as t:
         vs = VioscreenSessionRepo(t)
-        ffqs_not_represented = vs.get_missing_ffqs()
+        ffqs_not_represented = vs.get_missing_ffqs()[:limit]
 
     # fetch ffq data for sessions we don't yet have it from
     failed_ffqs = []
-    for sess in ffqs_not_represented[:MAX_FETCH_SIZE]:
-        try:
-            error, ffq = vio_api.get_ffq(sess.sessionId)
-        except Exception as e:  # noqa
-            failed_ffqs.append((sess.sessionId, str(e)))
-            continue
-
-        if error:
-            failed_ffqs.append((sess.sessionId, repr(error)))
+    to_store = []
+    to_record = []
+    n_to_get = len(ffqs_not_represented)
+    n_stored = 0
+    fetched = _fetch_concurrently(lambda sess: vio_api.get_ffq(sess.sessionId),
+                                  ffqs_not_represented, n_workers)
+    for idx, (sess, result, exc) in enumerate(fetched, 1):
+        if exc is not None:
+            to_record.append((sess.sessionId, str(exc)))
+        elif result[0]:
+            to_record.append((sess.sessionId, repr(result[0])))
         else:
-            # the call to get_ffq is long, and the data from many ffqs is
-            # large so let's insert as we go
-            with Transaction() as t:
-                vs = VioscreenRepo(t)
-                vs.insert_ffq(ffq)
-                t.commit()
+            to_store.append(result[1])
+
+        # the data from many ffqs is large, so let's store as we go
+        if len(to_store) >= batch_size or idx == n_to_get:
+            batch_stored, batch_failed = _store_ffqs(to_store, to_record)
+            n_stored += batch_stored
+            failed_ffqs.extend(batch_failed)
+            to_store = []
+            to_record = []
+
+        current_task.update_state(
+            state="PROGRESS",
+            meta={"completion": (idx / n_to_get) * 100,
+                  "status": "PROGRESS",
+                  "message": f"{n_stored} of {n_to_get} FFQs stored..."})
+
+    current_task.update_state(
+        state="SUCCESS",
+        meta={"completion": n_to_get,
+              "status": "SUCCESS",
+              "message": f"{n_stored} FFQs stored"})
 
     if len(failed_ffqs) > 0 or len(unable_to_update_session) > 0:
         payload = ''.join(['%s : %s\n' % (repr(s), m)
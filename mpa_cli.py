@@ -1,8 +1,19 @@
 import click
 from microsetta_private_api.server import build_app, run
+from microsetta_private_api.util.google_geocoding import \
+    backfill_account_geocoding
 
 
 @click.command()
 def cli():
     app = build_app()
     run(app)
+
+
+@click.command()
+@click.option('--limit', type=int, default=None,
+              help="The most accounts to queue")
+def geocode_backfill(limit):
+    """Queue geocoding of the accounts which lack a location"""
+    queued = backfill_account_geocoding(limit)
+    click.echo("Queued geocoding of %d accounts" % queued)
@@ -44,5 +44,6 @@ setup(
     entry_points='''
         [console_scripts]
         mpa-cli=mpa_cli:cli
+        mpa-geocode-backfill=mpa_cli:geocode_backfill
     '''
 )